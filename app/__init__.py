@@ -2,20 +2,44 @@ from flask import Flask
 from flask_bootstrap import Bootstrap
 from flask_mail import Mail
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 from config import config
 from flask_login import LoginManager
 from flask_pagedown import PageDown
+from .cache import VersionTable
+from .replicas import RoutingSQLAlchemy
+from .markup import RenderCache
+from .fragments import FragmentCache
+from .follow_graph import FollowGraph
+from .identity import IdentityCache, TokenCache, CredentialCache
+from .passwords import PasswordHasher
+from .page_cache import PageCache
+from .last_seen import LastSeenBuffer
+from .search import SearchIndex
+from .profiler import SQLProfiler
+from .metrics import Metrics
 
 bootstrap = Bootstrap()
 mail = Mail()
 moment = Moment()
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 loging_manager = LoginManager()
 loging_manager.session_protection = 'strong'
 loging_manager.login_view = 'auth.login'
 loging_manager.login_message = 'Пожалуйста, войдите в систему, чтобы получить доступ к этой странице.'
 pagedown = PageDown()
+render_cache = RenderCache()
+follow_graph = FollowGraph()
+versions = VersionTable()
+fragment_cache = FragmentCache(versions)
+identity_cache = IdentityCache(versions)
+token_cache = TokenCache(versions)
+credential_cache = CredentialCache(versions)
+page_cache = PageCache(versions)
+password_hasher = PasswordHasher()
+last_seen_buffer = LastSeenBuffer()
+search_index = SearchIndex()
+sql_profiler = SQLProfiler()
+metrics = Metrics()
 
 
 def create_app(config_name):
@@ -29,10 +53,26 @@ def create_app(config_name):
     db.init_app(app)
     loging_manager.init_app(app)
     pagedown.init_app(app)
+    render_cache.init_app(app)
+    fragment_cache.init_app(app)
+    follow_graph.init_app(app)
+    versions.init_app(app)
+    identity_cache.init_app(app)
+    token_cache.init_app(app)
+    credential_cache.init_app(app)
+    page_cache.init_app(app)
+    password_hasher.init_app(app)
+    last_seen_buffer.init_app(app)
+    search_index.init_app(app)
+    sql_profiler.init_app(app)
+    metrics.init_app(app)
+
+    from .email import outbox
+    outbox.init_app(app)
 
     if app.config['SSL_DISABLE']:
         from flask_sslify import SSLify
-        sslify = SSLify(app)
+        sslify = SSLify(app, skips=['metrics'])
 
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
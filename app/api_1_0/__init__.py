@@ -1,5 +1,8 @@
 from flask import Blueprint
 
+from ..conditional import add_validators
+
 api = Blueprint('api', __name__)
+api.after_request(add_validators)
 
-from . import posts, users, errors, comments, authentication
\ No newline at end of file
+from . import posts, users, errors, comments, authentication, search
\ No newline at end of file
@@ -1,5 +1,7 @@
 from flask_httpauth import HTTPBasicAuth
-from app.models import AnonymousUser, User
+from app import credential_cache
+from app.models import AnonymousUser, User, load_user
+from app.replicas import primary
 from flask import g, jsonify
 from .errors import unauthorized, forbidden
 from . import api
@@ -16,12 +18,25 @@ def verify_password(email_or_token, password):
         g.current_user = User.verify_auth_token(email_or_token)
         g.token_used = True
         return g.current_user
-    user = User().query.filter_by(email=email_or_token).first()
+    g.token_used = False
+    # повторная проверка тех же учетных данных обходится без PBKDF2
+    user_id = credential_cache.get(email_or_token, password)
+    user = load_user(user_id) if user_id is not None else None
+    if user:
+        g.current_user = user
+        return True
+    # версии снимаются до чтения хэша, а хэш читается с основной базы,
+    # чтобы старый пароль не попал в кэш после смены
+    stamps = credential_cache.snapshot()
+    with primary():
+        user = User.query.filter_by(email=email_or_token).first()
     if not user:
         return False
     g.current_user = user
-    g.token_used = False
-    return user.verify_password(password)
+    if not user.verify_password(password):
+        return False
+    credential_cache.set(email_or_token, password, user.id, stamps)
+    return True
 
 
 @auth.error_handler
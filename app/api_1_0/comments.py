@@ -1,28 +1,26 @@
-from flask import request, g, url_for, current_app, jsonify
+from flask import request, g, url_for, current_app
 
 from . import api
 from app.models import Post, Comment, Permission
 from .decorators import permission_required
 from app import db
+from app.pagination import paginate_request
+from app.conditional import not_modified
+from app.serialization import jsonify
+from .multi_get import wants_ids, multi_get
 
 
 @api.route('/comments/')
 def get_comments():
-    page = request.args.get('page', 1, type=int)
+    if wants_ids():
+        return jsonify(multi_get(Comment, 'comments'))
     per_page = current_app.config['FLASKY_COMMENTS_PER_PAGE']
-    pagination = Comment.query.order_by(Comment.timestamp.desc()).paginate(page, per_page, error_out=False)
+    pagination = paginate_request(Comment.query, (Comment.timestamp, Comment.id), per_page)
     comments = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_comments', page=page-1)
-    next_page = None
-    if pagination.has_nex:
-        next_page = url_for('api.get_comments', page=page+1)
     return jsonify({
         'comments': [comment.to_json() for comment in comments],
-        'prev': prev,
-        'next': next_page,
-        'count': pagination.total
+        'prev': pagination.prev_url('api.get_comments'),
+        'next': pagination.next_url('api.get_comments')
     })
 
 
@@ -35,21 +33,19 @@ def get_comment(id):
 @api.route('/posts/<int:id>/comments/')
 def get_post_comments(id):
     post = Post.query.get_or_404(id)
-    page = request.args.get('page', 1, type=int)
+    # комментарии не редактируются, а новый комментарий меняет
+    # comment_count и вместе с ним posts.updated_at
+    response = not_modified(post.id, post.updated_at, last_modified=post.updated_at)
+    if response is not None:
+        return response
     per_page = current_app.config['FLASKY_COMMENTS_PER_PAGE']
-    pagination = post.comments.order_by(Comment.timestamp.asc()).paginate(page, per_page, error_out=True)
+    pagination = paginate_request(post.comments, (Comment.timestamp, Comment.id), per_page, descending=False)
     comments = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_post_comments', id=id, page=page-1)
-    next_page = None
-    if pagination.has_next:
-        next_page = url_for('api.get_post_comments', id=id, page=page+1)
     return jsonify({
         'comments': [comment.to_json() for comment in comments],
-        'prev': prev,
-        'next': next_page,
-        'count': pagination.total
+        'prev': pagination.prev_url('api.get_post_comments', id=id),
+        'next': pagination.next_url('api.get_post_comments', id=id),
+        'count': post.comment_count
     })
 
 
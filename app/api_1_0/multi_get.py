@@ -0,0 +1,36 @@
+from flask import current_app, request
+
+from app.exceptions import ValidationError
+
+
+def wants_ids():
+    return 'ids' in request.args
+
+
+def requested_ids():
+    """Ids of ?ids=1,2,3 (or repeated ids=) in order, without duplicates."""
+    limit = current_app.config['FLASKY_MULTI_GET_LIMIT']
+    try:
+        ids = [int(id) for value in request.args.getlist('ids') for id in value.split(',') if id.strip()]
+    except ValueError:
+        raise ValidationError('ids must be a comma separated list of integers')
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise ValidationError('ids is empty')
+    if len(ids) > limit:
+        raise ValidationError(f'at most {limit} ids can be requested at once')
+    return ids
+
+
+def multi_get(model, name):
+    """Fetch the requested rows of model with one query.
+
+    Rows are returned in the order of the ids; ids without a row are
+    listed under 'missing' instead of failing the whole batch.
+    """
+    ids = requested_ids()
+    found = {obj.id: obj for obj in model.query.filter(model.id.in_(ids))}
+    return {
+        name: [found[id].to_json() for id in ids if id in found],
+        'missing': [id for id in ids if id not in found]
+    }
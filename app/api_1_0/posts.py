@@ -1,4 +1,4 @@
-from flask import jsonify, request, g, url_for
+from flask import request, g, url_for, current_app, stream_with_context
 
 from . import api
 from .authentication import auth
@@ -6,19 +6,55 @@ from app.models import Post, Permission
 from .decorators import permission_required
 from app import db
 from .errors import forbidden
+from app.conditional import not_modified
+from app.serialization import jsonify, dumps
+from .multi_get import wants_ids, multi_get
+
+
+NDJSON = 'application/x-ndjson'
+
+
+def wants_stream():
+    if request.args.get('stream', type=int) == 1:
+        return True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON]) == NDJSON
 
 
 @api.route('/posts/')
 @auth.login_required
 def get_posts():
+    if wants_ids():
+        return jsonify(multi_get(Post, 'posts'))
+    if wants_stream():
+        return stream_posts()
     posts = Post.query.all()
-    return jsonify({'posts': [post.to_json() for post in posts]})
+    response = jsonify({'posts': [post.to_json() for post in posts]})
+    response.vary.add('Accept')
+    return response
+
+
+def stream_posts():
+    # Серверный курсор и yield_per: в памяти одновременно находится не
+    # больше одной пачки строк, первая строка уходит клиенту сразу
+    batch = current_app.config['FLASKY_STREAM_BATCH_SIZE']
+    query = Post.query.order_by(Post.id).execution_options(stream_results=True).yield_per(batch)
+
+    def generate():
+        for post in query:
+            yield dumps(post.to_json()) + b'\n'
+
+    response = current_app.response_class(stream_with_context(generate()), mimetype=NDJSON)
+    response.vary.add('Accept')
+    return response
 
 
 @api.route('/posts/<int:id>')
 @auth.login_required
 def get_post(id):
     post = Post.query.get_or_404(id)
+    response = not_modified(post.id, post.updated_at, last_modified=post.updated_at)
+    if response is not None:
+        return response
     return jsonify(post.to_json())
 
 
@@ -0,0 +1,26 @@
+from flask import request, current_app
+
+from . import api
+from app.models import Post, Comment
+from app import db, search_index
+from app.exceptions import ValidationError
+from app.serialization import jsonify
+
+
+@api.route('/search')
+def search():
+    query = request.args.get('q', '')
+    kind = request.args.get('kind', 'posts')
+    if kind not in ('posts', 'comments'):
+        raise ValidationError('kind must be posts or comments')
+    if kind == 'posts':
+        per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
+        pagination = search_index.paginate(db.session, query, kind, Post.query, per_page)
+    else:
+        per_page = current_app.config['FLASKY_COMMENTS_PER_PAGE']
+        pagination = search_index.paginate(db.session, query, kind, Comment.query, per_page)
+    return jsonify({
+        kind: [obj.to_json() for obj in pagination.items],
+        'prev': pagination.prev_url('api.search', q=query, kind=kind),
+        'next': pagination.next_url('api.search', q=query, kind=kind)
+    })
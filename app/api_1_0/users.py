@@ -1,54 +1,60 @@
-from flask import jsonify, request, current_app, url_for
+from flask import current_app
 
 from . import api
-from app.models import User, Post
+from app.models import User, Post, TimelineEntry
+from app import db
+from app.pagination import paginate_request
+from app.conditional import not_modified
+from app.serialization import jsonify
+from .multi_get import multi_get
+
+
+@api.route('/users/')
+def get_users():
+    return jsonify(multi_get(User, 'users'))
 
 
 @api.route('/user/<int:id>')
 def get_user(id):
     user = User.query.get_or_404(id)
+    # last_seen записывается в обход ORM и не меняет updated_at
+    last_modified = max(filter(None, (user.updated_at, user.last_seen)), default=None)
+    response = not_modified(user.id, user.updated_at, user.last_seen, last_modified=last_modified)
+    if response is not None:
+        return response
     return jsonify(user.to_json())
 
 
 @api.route('/users/<int:id>/posts')
 def get_user_posts(id):
     user = User.query.get_or_404(id)
-    page = request.args.get('page', 1, type=int)
+    # правки постов и их счетчиков видны по индексу (author_id, updated_at)
+    updated_at = db.session.query(db.func.max(Post.updated_at)).filter(Post.author_id == id).scalar()
+    response = not_modified(user.id, user.post_count, updated_at, last_modified=updated_at)
+    if response is not None:
+        return response
     per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
-    pagination = user.posts.order_by(Post.timestamp.desc()).paginate(page, per_page, error_out=True)
+    pagination = paginate_request(user.posts, (Post.timestamp, Post.id), per_page)
     posts = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_user_posts', id=id, page=page-1)
-    next_page = None
-    if pagination.has_next:
-        next_page = url_for('api.get_user_posts', id=id, page=page+1)
     return jsonify({
         'posts': [post.to_json() for post in posts],
-        'prev': prev,
-        'next': next_page,
-        'count': pagination.total
+        'prev': pagination.prev_url('api.get_user_posts', id=id),
+        'next': pagination.next_url('api.get_user_posts', id=id),
+        'count': user.post_count
     })
 
 
 @api.route('/users/<int:id>/timeline/')
 def get_user_followed_posts(id):
     user = User.query.get_or_404(id)
-    page = request.args.get('page', 1, type=int)
     per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
-    pagination = user.followed_posts.order_by(Post.timestamp.desc()).paginate(page, per_page, error_out=True)
+    pagination = paginate_request(user.followed_posts, (TimelineEntry.timestamp, TimelineEntry.post_id), per_page,
+                                  key=lambda post: (post.timestamp, post.id))
     posts = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_user_followed_posts', id=id, page=page-1)
-    next_page = None
-    if pagination.has_next:
-        next_page = url_for('api.get_user_followed_posts', id=id, page=page+1)
     return jsonify({
         'posts': [post.to_json() for post in posts],
-        'prev': prev,
-        'next': next_page,
-        'count': pagination.total
+        'prev': pagination.prev_url('api.get_user_followed_posts', id=id),
+        'next': pagination.next_url('api.get_user_followed_posts', id=id)
     })
 
 
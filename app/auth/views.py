@@ -8,6 +8,7 @@ from ..models import User, db
 from .forms import LoginForm, RegistrationForm, ChangingPasswordForm, PasswordResetRequestForm, \
     PasswordResetForm, ChangeEmailForm
 from ..email import send_email
+from ..decorators import primary_required
 
 
 @auth.route('/login', methods=['GET', 'POST'])
@@ -39,12 +40,14 @@ def register():
         db.session.commit()
         token = user.generate_confirmation_token()
         send_email(user.email, 'Confirm Your Account', 'auth/email/confirm', user=user, token=token)
+        db.session.commit()
         flash('Письмо с подтверждением отправлено Вам на email.')
         return redirect(url_for('main.index'))
     return render_template('auth/register.html', form=form)
 
 
 @auth.route('/confirm/<token>')
+@primary_required
 @login_required
 def confirm(token):
     if current_user.confirmed:
@@ -94,6 +97,7 @@ def unconfirmed():
 def resend_confirmation():
     token = current_user.generate_confirmation_token()
     send_email(current_user.email, 'Confirm Your Account', 'auth/email/confirm', token=token, user=current_user)
+    db.session.commit()
     flash('На Ваш email отправлена новая ссылка для подтверждения вашего email.')
     return redirect(url_for('main.index'))
 
@@ -109,6 +113,7 @@ def password_reset_request():
             token = user.generate_reset_token()
             send_email(user.email, 'Reset Your Password', 'auth/email/reset_password',
                        user=user, token=token)
+            db.session.commit()
         flash('Инструкция по изменению пароля отправлена вам на email.')
         return redirect(url_for('auth.login'))
     return render_template('auth/reset_password.html', form=form)
@@ -139,6 +144,7 @@ def change_email_request():
             send_email(new_email, 'Confirm your email address',
                        'auth/email/change_email',
                        user=current_user, token=token)
+            db.session.commit()
             flash('An email with instructions to confirm your new email '
                   'address has been sent to you.')
             return redirect(url_for('main.index'))
@@ -148,6 +154,7 @@ def change_email_request():
 
 
 @auth.route('/change_email/<token>', methods=['GET', 'POST'])
+@primary_required
 @login_required
 def change_email(token):
     if current_user.change_email(token):
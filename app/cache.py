@@ -0,0 +1,119 @@
+import mmap
+import os
+import zlib
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache:
+    """Thread-safe mapping that evicts the least recently used entries."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def resize(self, maxsize):
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._data) > maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {'size': len(self._data), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses}
+
+
+class VersionTable:
+    """Fixed array of change counters, optionally shared between processes.
+
+    Keys are hashed into slots, so bumping one key may also bump an
+    unrelated one; that only costs a cache miss. With a path the slots live
+    in a memory-mapped file and a bump made by one worker is seen by every
+    worker on the host.
+    """
+
+    def __init__(self, slots=4096, path=None, app=None):
+        self._lock = Lock()
+        self.configure(slots, path)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        slots, path = app.config['FLASKY_VERSION_SLOTS'], app.config['FLASKY_VERSION_PATH']
+        if (slots, path) != (self.slots, self.path):
+            self.configure(slots, path)
+
+    def configure(self, slots, path=None):
+        size = slots * 4
+        if path is None:
+            buffer = mmap.mmap(-1, size)
+        else:
+            with open(path, 'a+b') as f:
+                if os.fstat(f.fileno()).st_size < size:
+                    f.truncate(size)
+                buffer = mmap.mmap(f.fileno(), size)
+        with self._lock:
+            self.slots = slots
+            self.path = path
+            self._values = memoryview(buffer).cast('I')
+
+    def _slot(self, key):
+        # hash() строк различается между процессами, crc32 - нет
+        return zlib.crc32(repr(key).encode('utf-8')) % self.slots
+
+    def get(self, key):
+        return self._values[self._slot(key)]
+
+    def snapshot(self):
+        """Copy of the counters; its get(key) is the version at the time of the copy."""
+        return _VersionSnapshot(self._slot, memoryview(bytes(self._values)).cast('I'))
+
+    def bump(self, key):
+        # Два одновременных увеличения из разных процессов могут дать одно
+        # значение, но оно все равно отличается от прежнего
+        slot = self._slot(key)
+        with self._lock:
+            self._values[slot] = (self._values[slot] + 1) & 0xffffffff
+
+
+class _VersionSnapshot:
+    def __init__(self, slot, values):
+        self._slot = slot
+        self._values = values
+
+    def get(self, key):
+        return self._values[self._slot(key)]
@@ -0,0 +1,37 @@
+import hashlib
+from datetime import timezone
+
+from flask import current_app, request
+
+
+def not_modified(*validators, last_modified=None):
+    """Answer a conditional GET before the response body is built.
+
+    validators are cheap values that change whenever the body would, such
+    as (id, updated_at) of a row already loaded; together with the URL
+    they are hashed into the ETag. Returns a 304 response when the client
+    copy is current, otherwise None, and the ETag and Last-Modified are
+    added to the full response by add_validators.
+    """
+    etag = hashlib.sha1(repr((request.full_path, validators)).encode('utf-8')).hexdigest()
+    if last_modified is not None:
+        last_modified = last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+    request.environ['flasky.validators'] = etag, last_modified
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    else:
+        since = request.if_modified_since
+        fresh = last_modified is not None and since is not None and last_modified <= since
+    if fresh:
+        return current_app.response_class(status=304)
+    return None
+
+
+def add_validators(response):
+    validators = request.environ.get('flasky.validators')
+    if validators is not None and response.status_code in (200, 304):
+        etag, last_modified = validators
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+    return response
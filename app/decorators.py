@@ -21,3 +21,9 @@ def permission_required(permissions):
 
 def admin_required(f):
     return permission_required(Permission.ADMINISTER)(f)
+
+
+def primary_required(f):
+    # GET-обработчики, которые пишут в базу, читают из основной базы, а не из реплики
+    f.primary_required = True
+    return f
@@ -1,21 +1,188 @@
-from threading import Thread
+import json
+from datetime import datetime, timedelta
+from smtplib import SMTPException, SMTPServerDisconnected
+from threading import Event, Lock, Thread
+
+from flask import current_app, has_request_context, render_template, request
 from flask_mail import Message
-from flask import current_app, render_template
 
-from . import mail
+from . import db, mail
+from .models import OutboxMessage
+
+MAX_RETRY_DELAY = 3600
+
+
+def _encode(value):
+    # модели сохраняются ссылкой и загружаются заново при отправке
+    if isinstance(value, db.Model):
+        return {'$model': value.__class__.__name__, 'id': value.id}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict) and '$model' in value:
+        return db.Model._decl_class_registry[value['$model']].query.get(value['id'])
+    return value
+
+
+class Outbox:
+    """Delivers mail queued in the outbox table.
+
+    send_email() only stores the template name and its context, so the
+    request neither renders nor talks to SMTP, and queued mail survives a
+    restart. The message is written with the caller's transaction, and
+    the workers are woken once it commits. FLASKY_MAIL_WORKERS threads
+    claim due messages in batches, render them and send a whole burst
+    over one SMTP connection. Failed messages are retried with
+    exponential backoff up to FLASKY_MAIL_MAX_ATTEMPTS times. With no
+    workers the outbox is drained by 'manage.py send_outbox'.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._threads = []
+        self._lock = Lock()
+        self._wakeup = Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config['FLASKY_MAIL_WORKERS']
+        self.batch_size = app.config['FLASKY_MAIL_BATCH_SIZE']
+        self.max_attempts = app.config['FLASKY_MAIL_MAX_ATTEMPTS']
+        self.retry_delay = app.config['FLASKY_MAIL_RETRY_DELAY']
+        self.poll_interval = app.config['FLASKY_MAIL_POLL_INTERVAL']
+
+    def wake(self):
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = Thread(target=self._work, name='outbox', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        self._wakeup.set()
+
+    def _work(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                handled = self.deliver()
+            except Exception:
+                self.app.logger.exception('Mail delivery failed')
+                handled = 0
+            if not handled:
+                self._wakeup.wait(self.poll_interval)
+
+    def _claim(self):
+        now = datetime.utcnow()
+        due = OutboxMessage.query.filter(OutboxMessage.next_attempt_at <= now) \
+            .order_by(OutboxMessage.next_attempt_at).limit(self.batch_size).all()
+        # сообщение достается тому, чей UPDATE его изменил; аренда истекает,
+        # если процесс завершится, не успев отправить письмо
+        lease = now + timedelta(seconds=self.poll_interval * 10)
+        claimed = [message for message in due
+                   if OutboxMessage.query.filter_by(id=message.id, next_attempt_at=message.next_attempt_at)
+                   .update({'next_attempt_at': lease}, synchronize_session=False)]
+        db.session.commit()
+        return claimed
 
+    def _render(self, message):
+        context = {key: _decode(value) for key, value in json.loads(message.context).items()}
+        msg = Message(message.subject, sender=self.app.config['FLASKY_MAIL_SENDER'],
+                      recipients=[message.recipient])
+        with self.app.test_request_context(base_url=message.base_url):
+            msg.body = render_template(message.template + '.txt', **context)
+            msg.html = render_template(message.template + '.html', **context)
+        return msg
 
-def send_async_email(app, msg):
-    with app.app_context():
-        # if __name__ == '__main__':
-        mail.send(msg)
+    def _sent(self, message):
+        message.attempts += 1
+        message.sent_at = datetime.utcnow()
+        message.next_attempt_at = None
+
+    def _failed(self, message, error):
+        message.attempts += 1
+        message.last_error = repr(error)
+        if message.attempts >= self.max_attempts:
+            message.next_attempt_at = None
+        else:
+            delay = min(self.retry_delay * 2 ** (message.attempts - 1), MAX_RETRY_DELAY)
+            message.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+
+    def deliver(self):
+        """Send due messages over one SMTP connection, return how many were handled."""
+        handled = 0
+        with self.app.app_context():
+            try:
+                batch = self._claim()
+                if not batch:
+                    return 0
+                try:
+                    with mail.connect() as connection:
+                        while batch:
+                            message = batch.pop(0)
+                            try:
+                                connection.send(self._render(message))
+                            except SMTPServerDisconnected:
+                                batch.insert(0, message)
+                                raise
+                            except Exception as e:
+                                self._failed(message, e)
+                            else:
+                                self._sent(message)
+                            handled += 1
+                            if not batch:
+                                db.session.commit()
+                                batch = self._claim()
+                except (SMTPException, OSError) as e:
+                    # соединение потеряно, остаток пакета отправится позже
+                    for message in batch:
+                        self._failed(message, e)
+                        handled += 1
+                db.session.commit()
+            finally:
+                db.session.remove()
+        return handled
+
+    def drain(self):
+        """Deliver everything that is due now, return the number of messages handled."""
+        total = 0
+        while True:
+            handled = self.deliver()
+            if not handled:
+                return total
+            total += handled
+
+
+outbox = Outbox()
 
 
 def send_email(to, subject, template, **kwargs):
     app = current_app._get_current_object()
-    msg = Message(app.config['FLASKY_MAIL_SUBJECT_PREFIX'] + ' ' + subject,
-                  sender=app.config['FLASKY_MAIL_SENDER'], recipients=[to])
-    msg.body = render_template(template + '.txt', **kwargs)
-    msg.html = render_template(template + '.html', **kwargs)
-    thr = Thread(target=send_async_email, args=[app, msg])
-    thr.start()
+    message = OutboxMessage(recipient=to,
+                            subject=app.config['FLASKY_MAIL_SUBJECT_PREFIX'] + ' ' + subject,
+                            template=template,
+                            context=json.dumps({key: _encode(value) for key, value in kwargs.items()}),
+                            base_url=request.url_root if has_request_context() else None)
+    # сообщение фиксируется вместе с транзакцией вызывающего кода
+    db.session.add(message)
+    return message
+
+
+def record_outbox_changes(session, flush_context):
+    if any(isinstance(obj, OutboxMessage) for obj in session.new):
+        session.info['outbox_queued'] = True
+
+
+def wake_outbox(session):
+    if session.info.pop('outbox_queued', False):
+        outbox.wake()
+
+
+def discard_outbox_changes(session, previous_transaction):
+    session.info.pop('outbox_queued', None)
+
+
+db.event.listen(db.session, 'after_flush', record_outbox_changes)
+db.event.listen(db.session, 'after_commit', wake_outbox)
+db.event.listen(db.session, 'after_soft_rollback', discard_outbox_changes)
@@ -0,0 +1,213 @@
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from threading import RLock
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+MAGIC = b'FLGR'
+# версия 1 хранила еще и обратный индекс подписчиков
+VERSION = 2
+HEADER = struct.Struct('<4sIQII')
+RECORD = struct.Struct('<iii')
+ADD, REMOVE = 1, 0
+
+
+class _Locked:
+    def __init__(self, file, operation):
+        self.file = file
+        self.operation = operation
+
+    def __enter__(self):
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), self.operation)
+        return self.file
+
+    def __exit__(self, *args):
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+
+def _exclusive(file):
+    return _Locked(file, fcntl.LOCK_EX if fcntl is not None else None)
+
+
+class _Snapshot:
+    """Read-only view of a snapshot file in CSR layout.
+
+    For every user id the file stores a sorted array of followed ids, so
+    membership is a binary search over a memory-mapped slice shared by all
+    worker processes.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.log_offset, self.nodes, self.edges = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            self.map.close()
+            raise ValueError(f'{path} is not a follow graph snapshot of version {VERSION}')
+        self.ints = ints = memoryview(self.map)[HEADER.size:].cast('i')
+        n, e = self.nodes + 1, self.edges
+        self.offsets = ints[0:n]
+        self.targets = ints[n:n + e]
+
+    def followed(self, id):
+        if id is None or not 0 <= id < self.nodes:
+            return self.targets[0:0]
+        return self.targets[self.offsets[id]:self.offsets[id + 1]]
+
+    def contains(self, follower_id, followed_id):
+        row = self.followed(follower_id)
+        i = bisect_left(row, followed_id)
+        return i < len(row) and row[i] == followed_id
+
+    def close(self):
+        try:
+            for view in (self.offsets, self.targets, self.ints):
+                view.release()
+            self.map.close()
+        except BufferError:
+            # срезы еще используются, файл закроется сборщиком мусора
+            pass
+
+
+class FollowGraph:
+    """Follow graph index shared by the worker processes of one host.
+
+    The graph lives in a memory-mapped snapshot plus an append-only log of
+    follow/unfollow records written after each commit. Every process maps
+    the same snapshot and replays the log tail into a small in-memory
+    overlay, so follow membership checks need no database round trip. 'manage.py build_follow_graph' rewrites the snapshot and
+    truncates the log.
+    """
+
+    def __init__(self, app=None):
+        self.path = None
+        self._snapshot = None
+        self._position = 0
+        self._lock = RLock()
+        self._reset_overlay()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        with self._lock:
+            if self._snapshot is not None:
+                self._snapshot.close()
+                self._snapshot = None
+            self.path = app.config['FLASKY_FOLLOW_GRAPH_PATH']
+            self._position = 0
+            self._reset_overlay()
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    @property
+    def log_path(self):
+        return self.path + '.log'
+
+    def _reset_overlay(self):
+        self._added = defaultdict(set)
+        self._removed = set()
+
+    def build(self, edges):
+        """Write a new snapshot from the (follower_id, followed_id) pairs edges() returns.
+
+        edges is called with the log locked: changes committed while it
+        reads are appended after the truncation instead of being lost.
+        """
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        with open(self.log_path, 'ab') as log, _exclusive(log):
+            edges = sorted(set(edges()))
+            nodes = max((max(edge) for edge in edges), default=-1) + 1
+            offsets, targets = self._csr(edges, nodes)
+            with open(tmp, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, 0, nodes, len(edges)))
+                offsets.tofile(f)
+                targets.tofile(f)
+            os.replace(tmp, self.path)
+            # записи, сделанные до перестройки, уже есть в снимке
+            log.truncate(0)
+
+    @staticmethod
+    def _csr(edges, nodes):
+        offsets = array('i', [0] * (nodes + 1))
+        values = array('i', (b for _, b in edges))
+        for a, _ in edges:
+            offsets[a + 1] += 1
+        for i in range(nodes):
+            offsets[i + 1] += offsets[i]
+        return offsets, values
+
+    def record(self, changes):
+        """Append committed (op, follower_id, followed_id) changes to the log."""
+        if not self.enabled or not changes:
+            return
+        data = b''.join(RECORD.pack(op, a, b) for op, a, b in changes)
+        with open(self.log_path, 'ab') as log, _exclusive(log):
+            log.write(data)
+
+    def _refresh(self):
+        with self._lock:
+            try:
+                inode = os.stat(self.path).st_ino
+            except FileNotFoundError:
+                return False
+            if self._snapshot is None or self._snapshot.inode != inode:
+                try:
+                    self._load()
+                except ValueError:
+                    # снимок старого формата перестраивается, как отсутствующий
+                    return False
+            try:
+                size = os.stat(self.log_path).st_size
+            except FileNotFoundError:
+                size = 0
+            if size < self._position:
+                # лог обрезан перестройкой снимка
+                self._load()
+            if size - self._position >= RECORD.size:
+                with open(self.log_path, 'rb') as log:
+                    log.seek(self._position)
+                    data = log.read((size - self._position) // RECORD.size * RECORD.size)
+                self._position += len(data)
+                for op, a, b in RECORD.iter_unpack(data):
+                    self._apply(op, a, b)
+            return True
+
+    def _load(self):
+        snapshot = _Snapshot(self.path)
+        if self._snapshot is not None:
+            self._snapshot.close()
+        self._snapshot = snapshot
+        self._position = self._snapshot.log_offset
+        self._reset_overlay()
+
+    def _apply(self, op, a, b):
+        if op == ADD:
+            self._removed.discard((a, b))
+            if not self._snapshot.contains(a, b):
+                self._added[a].add(b)
+        else:
+            self._added[a].discard(b)
+            if self._snapshot.contains(a, b):
+                self._removed.add((a, b))
+
+    def available(self):
+        return self.enabled and self._refresh()
+
+    def is_following(self, follower_id, followed_id):
+        with self._lock:
+            if (follower_id, followed_id) in self._removed:
+                return False
+            return followed_id in self._added.get(follower_id, ()) or \
+                self._snapshot.contains(follower_id, followed_id)
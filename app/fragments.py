@@ -0,0 +1,104 @@
+from collections import Counter
+from threading import Lock
+
+from flask import has_request_context, request
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from .cache import LRUCache
+from .replicas import replica_bind
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache post %}...{% endcache %} or {% cache 'name', value, ... %}."""
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cache', [nodes.List(args)]), [], [], body).set_lineno(lineno)
+
+    def _cache(self, args, caller):
+        return self.environment.fragment_cache.fetch(args, caller)
+
+
+class FragmentCache:
+    """Cache of rendered template fragments.
+
+    The key of a fragment is the fragment_key() of its first argument,
+    e.g. ('posts', id, post version, author version), followed by the
+    remaining arguments and the request scheme, since fragments contain
+    gravatar URLs. The versions come from a snapshot taken before the view
+    runs, so a write committed after the rows were loaded leaves the
+    fragment under an outdated key instead of the current one. Anything that depends on the viewer has to stay
+    outside the block. Hits and misses are counted per fragment kind and
+    reported in the Server-Timing header of each response.
+    """
+
+    def __init__(self, versions, app=None):
+        self.versions = versions
+        self.cache = LRUCache()
+        self.hits = Counter()
+        self.misses = Counter()
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.cache.resize(app.config['FLASKY_FRAGMENT_CACHE_SIZE'])
+        self.cache.clear()
+        with self._lock:
+            self.hits.clear()
+            self.misses.clear()
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = self
+        app.before_request(self._snapshot)
+        app.after_request(self._server_timing)
+
+    def _snapshot(self):
+        request.environ['flasky.versions'] = self.versions.snapshot()
+
+    def _stamps(self):
+        if has_request_context():
+            return request.environ.get('flasky.versions', self.versions)
+        return self.versions
+
+    def key(self, args):
+        first, rest = args[0], tuple(args[1:])
+        key = tuple(first.fragment_key(self._stamps())) if hasattr(first, 'fragment_key') else (first,)
+        if has_request_context():
+            rest += (request.scheme,)
+        return key + rest
+
+    def fetch(self, args, render):
+        key = self.key(args)
+        html = self.cache.get(key) if self.cache.maxsize else None
+        hit = html is not None
+        if not hit:
+            html = render()
+            # строки с реплики могут быть старше версий в ключе; анонимные страницы
+            # при промахе page_cache читаются с основной базы и заполняют кэш
+            if self.cache.maxsize and replica_bind() is None:
+                self.cache.set(key, html)
+        with self._lock:
+            (self.hits if hit else self.misses)[key[0]] += 1
+        if has_request_context():
+            counts = request.environ.setdefault('flasky.fragment_cache', [0, 0])
+            counts[0 if hit else 1] += 1
+        return html
+
+    def _server_timing(self, response):
+        counts = request.environ.get('flasky.fragment_cache')
+        if counts is not None:
+            response.headers.add('Server-Timing', 'fragment-cache;desc="hits=%d misses=%d"' % tuple(counts))
+        return response
+
+    def stats(self):
+        with self._lock:
+            kinds = set(self.hits) | set(self.misses)
+            return {kind: {'hits': self.hits[kind], 'misses': self.misses[kind],
+                           'ratio': self.hits[kind] / (self.hits[kind] + self.misses[kind])}
+                    for kind in kinds}
@@ -0,0 +1,151 @@
+import hashlib
+import hmac
+from time import monotonic, time
+
+from .cache import LRUCache
+
+ROLES = ('roles',)
+
+
+class IdentityCache:
+    """Per-process cache of authenticated users together with their role.
+
+    Entries are detached copies stamped with the versions of the user and
+    of the roles table at the time they were read. Committed changes bump
+    those versions (see record_identity_changes in models.py), and an
+    entry older than FLASKY_IDENTITY_CACHE_TTL seconds is dropped anyway.
+    """
+
+    def __init__(self, versions, app=None):
+        self.ttl = 60
+        self.cache = LRUCache()
+        self.versions = versions
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config['FLASKY_IDENTITY_CACHE_TTL']
+        self.cache.resize(app.config['FLASKY_IDENTITY_CACHE_SIZE'])
+        self.cache.clear()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def stamp(self, user_id):
+        """Versions to read before loading a user that will be cached."""
+        return self.versions.get(('user', user_id)), self.versions.get(ROLES)
+
+    def get(self, user_id):
+        entry = self.cache.get(user_id)
+        if entry is None:
+            return None
+        expires, stamp, user = entry
+        if expires < monotonic() or stamp != self.stamp(user_id):
+            self.cache.pop(user_id)
+            return None
+        return user
+
+    def set(self, user, stamp):
+        if self.enabled:
+            self.cache.set(user.id, (monotonic() + self.ttl, stamp, user))
+
+    def invalidate(self, user_ids=(), roles=False):
+        for user_id in user_ids:
+            self.versions.bump(('user', user_id))
+            self.cache.pop(user_id)
+        if roles:
+            self.versions.bump(ROLES)
+            self.cache.clear()
+
+    def stats(self):
+        return self.cache.stats()
+
+
+class _VerifiedCache:
+    # Общая часть кэшей проверенных учетных данных: запись хранит id
+    # пользователя и версию его учетных данных на момент проверки
+    def __init__(self, versions, app=None):
+        self.ttl = 0
+        self.cache = LRUCache()
+        self.versions = versions
+        if app is not None:
+            self.init_app(app)
+
+    def _get(self, key):
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        expires, stamp, user_id = entry
+        if expires <= time() or stamp != self.versions.get(('credentials', user_id)):
+            self.cache.pop(key)
+            return None
+        return user_id
+
+    def snapshot(self):
+        """Versions to pass to set(), taken before the credentials are read."""
+        return self.versions.snapshot()
+
+    def _set(self, key, user_id, expires, stamps=None):
+        if self.ttl > 0:
+            # версия, снятая до чтения: смена пароля во время проверки делает запись устаревшей
+            stamp = (stamps or self.versions).get(('credentials', user_id))
+            self.cache.set(key, (min(expires, time() + self.ttl), stamp, user_id))
+
+    def revoke(self, user_ids):
+        for user_id in user_ids:
+            self.versions.bump(('credentials', user_id))
+
+    def stats(self):
+        return self.cache.stats()
+
+
+class TokenCache(_VerifiedCache):
+    """Bounded cache from API token digest to the id of the verified user.
+
+    A cached token skips the signature check. An entry lives until the
+    token expires or FLASKY_TOKEN_CACHE_TTL seconds pass, whichever comes
+    first, and is dropped once the user's password or email changes.
+    """
+
+    def init_app(self, app):
+        self.ttl = app.config['FLASKY_TOKEN_CACHE_TTL']
+        self.cache.resize(app.config['FLASKY_TOKEN_CACHE_SIZE'])
+        self.cache.clear()
+
+    @staticmethod
+    def key(token):
+        # в памяти хранятся только дайджесты, а не сами токены
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        return self._get(self.key(token))
+
+    def set(self, token, user_id, expires):
+        self._set(self.key(token), user_id, expires)
+
+
+class CredentialCache(_VerifiedCache):
+    """Short-lived cache of successful email and password checks.
+
+    Keys are an HMAC of the credentials under SECRET_KEY, so the cache
+    holds neither passwords nor digests that could be attacked offline.
+    Entries live FLASKY_CREDENTIAL_CACHE_TTL seconds and are dropped once
+    the user's password or email changes.
+    """
+
+    def init_app(self, app):
+        self.ttl = app.config['FLASKY_CREDENTIAL_CACHE_TTL']
+        self.secret = app.config['SECRET_KEY'].encode('utf-8')
+        self.cache.resize(app.config['FLASKY_CREDENTIAL_CACHE_SIZE'])
+        self.cache.clear()
+
+    def key(self, email, password):
+        message = '\0'.join((email, password)).encode('utf-8')
+        return hmac.new(self.secret, message, hashlib.sha256).digest()
+
+    def get(self, email, password):
+        return self._get(self.key(email, password))
+
+    def set(self, email, password, user_id, stamps=None):
+        self._set(self.key(email, password), user_id, time() + self.ttl, stamps)
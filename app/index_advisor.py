@@ -0,0 +1,207 @@
+import os
+import re
+import textwrap
+import uuid
+from base64 import b64encode
+from collections import namedtuple
+from datetime import datetime
+
+from flask_sqlalchemy import get_debug_queries
+from sqlalchemy import inspect
+
+from .profiler import EXPLAIN, fingerprint
+
+Recommendation = namedtuple('Recommendation', 'table columns replaces reasons')
+
+_PARAM = r'(?:\?|%\(\w+\)s|%s|:\w+)'
+_WHERE = re.compile(r' WHERE (.*?)(?: GROUP BY | ORDER BY | LIMIT |$)', re.S)
+_ORDER = re.compile(r' ORDER BY (.*?)(?: LIMIT | OFFSET | FOR UPDATE|$)', re.S)
+# SQLite: SCAN posts / SEARCH posts USING ...; PostgreSQL: Seq Scan on posts
+_FULL_SCAN = re.compile(r'^(?:SCAN (?:TABLE )?(\w+)|.*Seq Scan on (\w+))')
+_SORT = re.compile(r'USE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY|^\s*(?:->\s*)?(?:Incremental )?Sort\b')
+
+
+def pages(data):
+    """Paths of the pages and API resources whose queries are analyzed."""
+    id, email, username = data['users'][0]
+    post = data['posts'][0]
+    return ['/', '/followed', '/', '/all', f'/user/{username}', f'/post/{post}', f'/followers/{username}',
+            f'/followed_by/{username}', '/api/v1.0/posts/', f'/api/v1.0/posts/{post}',
+            f'/api/v1.0/users/{id}/posts', f'/api/v1.0/users/{id}/timeline/',
+            f'/api/v1.0/posts/{post}/comments/', '/api/v1.0/comments/']
+
+
+def record_queries(app, data, password='cat'):
+    """Visit pages() as the first seeded user; distinct SELECTs by fingerprint."""
+    id, email, username = data['users'][0]
+    headers = {'X-Forwarded-Proto': 'https',
+               'Authorization': 'Basic ' + b64encode(f'{email}:{password}'.encode('utf-8')).decode('ascii')}
+    with app.app_context():
+        # запросы всех страниц копятся в этом контексте приложения
+        client = app.test_client()
+        client.post('/auth/login', data={'email': email, 'password': password}, headers=headers)
+        for path in pages(data):
+            client.get(path, headers=headers)
+        queries = {}
+        for query in get_debug_queries():
+            key = fingerprint(query.statement)
+            if key.lower().startswith('select') and key not in queries:
+                queries[key] = (query.statement, query.parameters)
+    return list(queries.values())
+
+
+def explain(connection, statement, parameters):
+    rows = connection.execute(EXPLAIN[connection.dialect.name] + statement, parameters).fetchall()
+    if connection.dialect.name == 'sqlite':
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+
+def _equalities(statement, table):
+    where = _WHERE.search(statement)
+    if where is None:
+        return []
+    column = rf'\b{table}\.(\w+)'
+    found = re.findall(rf'{_PARAM} = {column}|{column} = {_PARAM}', where.group(1))
+    return list(dict.fromkeys(left or right for left, right in found))
+
+
+def _ordering(statement):
+    # таблица и столбцы ORDER BY, если все они из одной таблицы
+    order = _ORDER.search(statement)
+    if order is None:
+        return None, []
+    items = [re.sub(r'\s+(?:ASC|DESC)$', '', item.strip(), flags=re.I) for item in order.group(1).split(',')]
+    names = [item.split('.') for item in items]
+    if any(len(name) != 2 for name in names) or len({table for table, _ in names}) != 1:
+        return None, []
+    return names[0][0], [column for _, column in names]
+
+
+def _shape(statement):
+    # условия и порядок запроса, без длинного списка столбцов
+    statement = fingerprint(statement)
+    found = re.search(r' (?:WHERE|ORDER BY) ', statement)
+    return statement[found.start() + 1:] if found else statement
+
+
+def _candidates(statement, plan):
+    statement = ' '.join(statement.split())
+    order_table, order_columns = _ordering(statement)
+    for line in plan:
+        scan = _FULL_SCAN.search(line)
+        table = scan and (scan.group(1) or scan.group(2))
+        if table:
+            equal = _equalities(statement, table)
+            # полный просмотр без условий на равенство (общая лента, выгрузка) индекс не ускорит
+            if equal:
+                yield table, equal + [c for c in order_columns if table == order_table and c not in equal], \
+                    f'full scan of {table}'
+        elif _SORT.search(line) and order_table is not None:
+            equal = _equalities(statement, order_table)
+            yield order_table, equal + [c for c in order_columns if c not in equal], \
+                f'sort of {order_table} not served by an index'
+
+
+def _existing(inspector, table):
+    indexes = [(index['name'], index['column_names'], index.get('unique', False))
+               for index in inspector.get_indexes(table)]
+    primary = inspector.get_pk_constraint(table)['constrained_columns']
+    if primary:
+        indexes.append((None, primary, True))
+    return indexes
+
+
+def advise(engine, queries):
+    """Indexes that would let the queries avoid full scans and sorts.
+
+    Each (statement, parameters) is explained on engine. A full scan of
+    a table filtered by equality, or a sort that no index serves, yields
+    a candidate index of the equality columns followed by the ORDER BY
+    columns. Candidates already covered by the prefix of an existing
+    index, or by a longer candidate, are dropped. Non-unique existing
+    indexes that are a prefix of a candidate are listed in replaces as
+    (name, columns) pairs, for the migration to drop.
+    """
+    inspector = inspect(engine)
+    candidates = {}
+    with engine.connect() as connection:
+        for statement, parameters in queries:
+            plan = explain(connection, statement, parameters)
+            for table, columns, reason in _candidates(statement, plan):
+                reasons = candidates.setdefault((table, tuple(columns)), {})
+                reasons[f'{reason}: {_shape(statement)}'] = None
+
+    recommendations = []
+    for (table, columns), reasons in sorted(candidates.items()):
+        if any(other[0] == table and len(other[1]) > len(columns) and other[1][:len(columns)] == columns
+               for other in candidates):
+            continue
+        existing = _existing(inspector, table)
+        if any(tuple(names[:len(columns)]) == columns for _, names, _ in existing):
+            continue
+        replaces = [(name, names) for name, names, unique in existing
+                    if name and not unique and tuple(names) == columns[:len(names)]]
+        recommendations.append(Recommendation(table, list(columns), replaces, list(reasons)))
+    return recommendations
+
+
+def index_name(table, columns):
+    return f'ix_{table}_{"_".join(columns)}'
+
+
+def render_migration(recommendations, revision, down_revision, message='composite indexes'):
+    upgrade, downgrade = [], []
+    for table, columns, replaces, reasons in recommendations:
+        name = index_name(table, columns)
+        for reason in reasons[:3]:
+            upgrade += textwrap.wrap(reason, 120, initial_indent='    # ', subsequent_indent='    #   ',
+                                     break_long_words=False, break_on_hyphens=False)
+        create = f"    op.create_index('{name}', '{table}', {columns!r}, unique=False)"
+        if len(create) > 120:
+            create = f"    op.create_index('{name}', '{table}',\n                    {columns!r}, unique=False)"
+        upgrade.append(create)
+        for old, old_columns in replaces:
+            upgrade.append(f"    op.drop_index('{old}', '{table}')")
+            downgrade.append(f"    op.create_index('{old}', '{table}', {old_columns!r}, unique=False)")
+        downgrade.append(f"    op.drop_index('{name}', '{table}')")
+    upgrade = '\n'.join(upgrade) or '    pass'
+    downgrade = '\n'.join(downgrade) or '    pass'
+    return f'''"""{message}
+
+Revision ID: {revision}
+Revises: {down_revision}
+Create Date: {datetime.utcnow()}
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '{revision}'
+down_revision = '{down_revision}'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+{upgrade}
+
+
+def downgrade():
+{downgrade}
+'''
+
+
+def write_migration(recommendations, directory='migrations', message='composite indexes'):
+    """Write an Alembic revision on top of the current head; returns its path."""
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+
+    config = Config(os.path.join(directory, 'alembic.ini'))
+    config.set_main_option('script_location', directory)
+    head = ScriptDirectory.from_config(config).get_current_head()
+    revision = uuid.uuid4().hex[-12:]
+    path = os.path.join(directory, 'versions', f'{revision}_{message.replace(" ", "_")}.py')
+    with open(path, 'w') as f:
+        f.write(render_migration(recommendations, revision, head, message))
+    return path
@@ -0,0 +1,111 @@
+import atexit
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+from time import monotonic
+
+from sqlalchemy import bindparam, column, or_, table
+from sqlalchemy.exc import SQLAlchemyError
+
+users = table('users', column('id'), column('last_seen'))
+
+
+class LastSeenBuffer:
+    """Write-behind buffer for User.last_seen.
+
+    ping() only records the time in memory, keeping the latest value per
+    user. The buffer is written with one executemany UPDATE once it holds
+    FLASKY_LAST_SEEN_BATCH users, and by a background thread every
+    FLASKY_LAST_SEEN_INTERVAL seconds, so it is written even when traffic
+    stops. The thread starts with the first touch(). Visits closer than
+    FLASKY_LAST_SEEN_RESOLUTION seconds to the stored value are ignored,
+    so the column lags behind by at most the interval plus the resolution.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.interval = 60
+        self.batch_size = 500
+        self.resolution = timedelta(seconds=60)
+        self._pending = {}
+        self._flushed = monotonic()
+        self._lock = Lock()
+        self._timer = None
+        atexit.register(self._flush_at_exit)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        with self._lock:
+            self._pending = {}
+            self._flushed = monotonic()
+        self.app = app
+        self.interval = app.config['FLASKY_LAST_SEEN_INTERVAL']
+        self.batch_size = app.config['FLASKY_LAST_SEEN_BATCH']
+        self.resolution = timedelta(seconds=app.config['FLASKY_LAST_SEEN_RESOLUTION'])
+
+    def _work(self, stopped):
+        while not stopped.wait(self.interval):
+            try:
+                self.flush()
+            except SQLAlchemyError:
+                self.app.logger.exception('Writing last_seen failed')
+
+    def stop(self):
+        """Stop the background flush thread; the next touch() starts it again."""
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            thread, stopped = timer
+            stopped.set()
+            thread.join()
+
+    def _flush_at_exit(self):
+        self.stop()
+        try:
+            self.flush()
+        except SQLAlchemyError:
+            # при завершении процесса база данных может быть уже недоступна
+            pass
+
+    def __len__(self):
+        return len(self._pending)
+
+    def touch(self, user_id, last_seen=None, now=None):
+        now = now or datetime.utcnow()
+        if last_seen is not None and now - last_seen < self.resolution:
+            return False
+        with self._lock:
+            previous = self._pending.get(user_id)
+            if previous is not None and now - previous < self.resolution:
+                return False
+            self._pending[user_id] = now
+            if self._timer is None:
+                # поток запускается лениво, уже в рабочем процессе, а не до fork
+                stopped = Event()
+                thread = Thread(target=self._work, args=(stopped,), name='last-seen', daemon=True)
+                thread.start()
+                self._timer = (thread, stopped)
+            due = len(self._pending) >= self.batch_size or monotonic() - self._flushed >= self.interval
+        if due:
+            self.flush()
+        return True
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed = monotonic()
+        if not pending or self.app is None:
+            return 0
+        from . import db
+
+        # условие на last_seen не дает перезаписать более позднее значение,
+        # записанное другим процессом
+        statement = users.update() \
+            .where(users.c.id == bindparam('_id')) \
+            .where(or_(users.c.last_seen.is_(None), users.c.last_seen < bindparam('_seen'))) \
+            .values(last_seen=bindparam('_seen'))
+        rows = [{'_id': id, '_seen': seen} for id, seen in pending.items()]
+        # отдельное соединение: сессия текущего запроса не затрагивается
+        with db.get_engine(self.app).begin() as connection:
+            connection.execute(statement, rows)
+        return len(rows)
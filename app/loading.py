@@ -0,0 +1,17 @@
+from sqlalchemy.orm import joinedload
+
+from .models import Post, Comment
+
+
+# Шаблоны _posts.html и _comments.html обращаются к автору каждой записи.
+# Ленивая загрузка давала отдельный запрос на каждую строку страницы,
+# поэтому списки загружают авторов тем же запросом, что и сами записи.
+# Агрегаты страницы (число комментариев, подписчиков) хранятся в самих
+# строках, см. update_counters в models.py.
+
+def load_posts(query):
+    return query.options(joinedload(Post.author))
+
+
+def load_comments(query):
+    return query.options(joinedload(Comment.author))
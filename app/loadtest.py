@@ -0,0 +1,284 @@
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+from base64 import b64encode
+from datetime import datetime
+from http.cookiejar import CookieJar
+from random import Random
+from time import perf_counter, sleep
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+SCENARIOS = {'browse': 50, 'timeline': 25, 'post': 5, 'comment': 10, 'api': 10}
+
+# SSLify перенаправляет на https все, что пришло не через https-прокси
+HEADERS = {'X-Forwarded-Proto': 'https', 'User-Agent': 'flasky-loadtest'}
+
+
+def parse_weights(value):
+    """'browse=50,api=10' -> {'browse': 50, 'api': 10}."""
+    weights = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f'unknown scenario {name!r}')
+        weights[name] = float(weight) if weight else SCENARIOS[name]
+    return weights
+
+
+def load_app(config_name, database):
+    """App of config_name on database, with forms accepted without CSRF tokens."""
+    from . import create_app
+
+    app = create_app(config_name)
+    # формы отправляются без CSRF-токена, как в тестах
+    app.config.update(SQLALCHEMY_DATABASE_URI=database, WTF_CSRF_ENABLED=False, DEBUG=False)
+    return app
+
+
+def _serve(config_name, database, ports):
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, load_app(config_name, database), threaded=True)
+    ports.put(server.port)
+    server.serve_forever()
+
+
+class _NoRedirect(HTTPRedirectHandler):
+    # редирект после POST меряется отдельно, если сценарий его запрашивает
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.recording = False
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, error):
+        if not self.recording:
+            return
+        with self._lock:
+            self.samples.setdefault(name, []).append(seconds)
+            if error:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+
+class VirtualUser:
+    """One simulated client with its own cookies and seeded account."""
+
+    def __init__(self, base_url, recorder, rng, data, password):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.rng = rng
+        self.data = data
+        self.user = rng.choice(data['users'])
+        self.password = password
+        self.anonymous = build_opener(_NoRedirect)
+        self.browser = build_opener(HTTPCookieProcessor(CookieJar()), _NoRedirect)
+        self.logged_in = False
+        self.token = None
+
+    def request(self, name, path, form=None, opener=None, auth=None, method=None):
+        headers = dict(HEADERS)
+        if auth is not None:
+            headers['Authorization'] = 'Basic ' + b64encode(f'{auth[0]}:{auth[1]}'.encode('utf-8')).decode('ascii')
+        body = urlencode(form).encode('utf-8') if form is not None else None
+        if method == 'POST' and body is None:
+            body = b''
+        start = perf_counter()
+        try:
+            with (opener or self.anonymous).open(Request(self.base_url + path, body, headers, method=method)) as r:
+                status, content = r.status, r.read()
+        except HTTPError as e:
+            status, content = e.code, e.read()
+        except (URLError, OSError):
+            status, content = 0, b''
+        self.recorder.add(name, perf_counter() - start, status == 0 or status >= 400)
+        return status, content
+
+    def login(self):
+        if not self.logged_in:
+            status, _ = self.request('auth.login', '/auth/login',
+                                     {'email': self.user[1], 'password': self.password}, self.browser)
+            # успешный вход перенаправляет на главную, неудачный снова показывает форму
+            self.logged_in = status == 302
+
+    def browse(self):
+        self.request('main.index', '/')
+        self.request('main.post', f'/post/{self.rng.choice(self.data["posts"])}')
+        self.request('main.user', f'/user/{self.rng.choice(self.data["users"])[2]}')
+
+    def timeline(self):
+        self.login()
+        self.request('main.show_followed', '/followed', opener=self.browser)
+        self.request('main.index', '/', opener=self.browser)
+
+    def post(self):
+        self.login()
+        body = ' '.join(self.rng.choice(self.data['words']) for _ in range(12))
+        self.request('main.index:post', '/', {'body': body}, self.browser)
+
+    def comment(self):
+        self.login()
+        id = self.rng.choice(self.data['posts'])
+        self.request('main.post', f'/post/{id}', opener=self.browser)
+        body = ' '.join(self.rng.choice(self.data['words']) for _ in range(6))
+        self.request('main.post:comment', f'/post/{id}', {'body': body}, self.browser)
+
+    def api(self):
+        if self.token is None:
+            status, content = self.request('api.get_token', '/api/v1.0/token', auth=(self.user[1], self.password),
+                                           method='POST')
+            if status != 200:
+                return
+            self.token = json.loads(content)['token']
+        auth = (self.token, '')
+        self.request('api.get_posts', '/api/v1.0/posts/', auth=auth)
+        self.request('api.get_user_followed_posts', f'/api/v1.0/users/{self.user[0]}/timeline/', auth=auth)
+        self.request('api.get_post', f'/api/v1.0/posts/{self.rng.choice(self.data["posts"])}', auth=auth)
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def summarize(samples, errors, elapsed):
+    """Requests per second, error count and p50/p95/p99 in ms per name."""
+    def stats(latencies, failed):
+        ordered = sorted(latencies)
+        return {'requests': len(ordered), 'errors': failed, 'rps': len(ordered) / elapsed if elapsed else 0.0,
+                'mean_ms': sum(ordered) / len(ordered) * 1000 if ordered else 0.0,
+                'p50_ms': _percentile(ordered, 0.50) * 1000, 'p95_ms': _percentile(ordered, 0.95) * 1000,
+                'p99_ms': _percentile(ordered, 0.99) * 1000, 'max_ms': ordered[-1] * 1000 if ordered else 0.0}
+
+    endpoints = {name: stats(latencies, errors.get(name, 0)) for name, latencies in sorted(samples.items())}
+    everything = [seconds for latencies in samples.values() for seconds in latencies]
+    return stats(everything, sum(errors.values())), endpoints
+
+
+def seed_dataset(app, users, posts, comments, follows, seed, password, force=False):
+    """Seed the app's database; the (id, email, username) of users, post ids and some words.
+
+    A database that already has users is only seeded with force.
+    """
+    from . import db
+    from .models import User, Post
+    from .seed import seed_database
+
+    with app.app_context():
+        if not force and db.engine.has_table(User.__tablename__) and db.session.query(User.id).first():
+            db.session.remove()
+            raise RuntimeError(f'{app.config["SQLALCHEMY_DATABASE_URI"]} already has users, '
+                               f'seeding it needs force')
+        db.create_all()
+        seed_database(users=users, posts=posts, comments=comments, follows=follows, seed=seed, password=password)
+        data = {'users': [tuple(row) for row in db.session.query(User.id, User.email, User.username)],
+                'posts': [id for id, in db.session.query(Post.id)],
+                'words': [word for body, in db.session.query(Post.body).limit(200) for word in body.split()]}
+        db.session.remove()
+        db.get_engine(app).dispose()
+    data['words'] = data['words'] or ['lorem', 'ipsum']
+    return data
+
+
+def _port(server, ports):
+    while True:
+        try:
+            return ports.get(timeout=1)
+        except queue.Empty:
+            if not server.is_alive():
+                raise RuntimeError(f'the app server exited with code {server.exitcode}')
+
+
+def run(config_name='loadtest', database=None, duration=30, warmup=5, concurrency=8, weights=None,
+        users=100, posts=1000, comments=1000, follows=1000, seed=0, password='cat', force=False):
+    """Seed a database, serve the app from it and drive weighted scenarios.
+
+    The app runs in a separate process on a threaded werkzeug server, so
+    the clients do not share its interpreter lock. Each of concurrency
+    threads is a virtual user that repeatedly picks a scenario by weight.
+    Requests made during the first warmup seconds are not counted. A
+    given database that already has users is only seeded with force.
+    """
+    if users < 1 or posts < 1:
+        raise ValueError('the load test needs at least one user and one post')
+    weights = weights or SCENARIOS
+    started = datetime.utcnow()
+    directory = None
+    if database is None:
+        directory = tempfile.mkdtemp(prefix='flasky-loadtest-')
+        database = 'sqlite:///' + os.path.join(directory, 'loadtest.sqlite')
+    data = seed_dataset(load_app(config_name, database), users, posts, comments, follows, seed, password, force)
+
+    context = multiprocessing.get_context('spawn')
+    ports = context.Queue()
+    server = context.Process(target=_serve, args=(config_name, database, ports), daemon=True)
+    server.start()
+    try:
+        base_url = f'http://127.0.0.1:{_port(server, ports)}'
+        recorder = Recorder()
+        stop = threading.Event()
+        names = list(weights)
+        chances = [weights[name] for name in names]
+
+        def drive(number):
+            rng = Random(seed * 1000 + number)
+            user = VirtualUser(base_url, recorder, rng, data, password)
+            while not stop.is_set():
+                getattr(user, rng.choices(names, chances)[0])()
+
+        threads = [threading.Thread(target=drive, args=(number,), daemon=True) for number in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        sleep(warmup)
+        recorder.recording = True
+        start = perf_counter()
+        sleep(duration)
+        recorder.recording = False
+        elapsed = perf_counter() - start
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.terminate()
+        server.join()
+        if directory is not None:
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+            os.rmdir(directory)
+
+    total, endpoints = summarize(recorder.samples, recorder.errors, elapsed)
+    return {
+        'started': started.isoformat(timespec='seconds'),
+        'config': config_name,
+        'duration': elapsed,
+        'concurrency': concurrency,
+        'scenarios': weights,
+        'dataset': {'users': users, 'posts': posts, 'comments': comments, 'follows': follows, 'seed': seed},
+        'total': total,
+        'endpoints': endpoints,
+    }
+
+
+def compare(baseline, results):
+    """Relative change of rps and p95 per endpoint against an earlier run."""
+    changes = {}
+    for name, current in results['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if previous is None:
+            continue
+        changes[name] = {key: (current[key] - previous[key]) / previous[key] if previous[key] else None
+                         for key in ('rps', 'p95_ms', 'p99_ms')}
+    return changes
@@ -3,23 +3,38 @@ from flask_login import login_required, current_user
 from flask_sqlalchemy import get_debug_queries
 
 from . import main
-from ..models import User, db, Role, Permission, Post, Comment
+from .. import page_cache, search_index, sql_profiler
+from ..models import User, db, Role, Permission, Post, Comment, Follow, TimelineEntry
 from .forms import EditProfileForm, EditProfileAdminForm, PostForm, CommentForm
-from ..decorators import admin_required, permission_required
+from ..decorators import admin_required, permission_required, primary_required
+from ..pagination import paginate_request
+from ..profiler import ORDERS
+from ..loading import load_posts, load_comments
+
+
+def post_page_tags(posts):
+    tags = []
+    for post in posts:
+        tags += [('page', 'post', post.id), ('user', post.author_id)]
+    return tags
 
 
 def sort_posts():
     show_followed = False
     if current_user.is_authenticated:
         show_followed = request.cookies.get('show_followed', '')
+    per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
     if show_followed:
-        query = current_user.followed_posts
+        pagination = paginate_request(load_posts(current_user.followed_posts),
+                                      (TimelineEntry.timestamp, TimelineEntry.post_id), per_page,
+                                      key=lambda post: (post.timestamp, post.id))
     else:
-        query = Post.query
-    return query, show_followed
+        pagination = paginate_request(load_posts(Post.query), (Post.timestamp, Post.id), per_page)
+    return pagination, show_followed
 
 
 @main.route('/', methods=['GET', 'POST'])
+@page_cache.cached
 def index():
     form = PostForm()
     if current_user.can(Permission.WRITE_ARTICLES) and form.validate_on_submit():
@@ -27,20 +42,20 @@ def index():
                     author=current_user._get_current_object())
         db.session.add(post)
         return redirect(url_for('.index'))
-    query, show_followed = sort_posts()
-    page = request.args.get('page', 1, type=int)
-    per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
-    pagination = query.order_by(Post.timestamp.desc()).paginate(page, per_page, error_out=False)
+    pagination, show_followed = sort_posts()
     posts = pagination.items
+    page_cache.depends_on(('page', 'posts'), *post_page_tags(posts))
     return render_template('index.html', form=form, posts=posts, pagination=pagination, show_followed=show_followed)
 
 
 @main.route('/user/<username>')
+@page_cache.cached
 def user(username):
     user = User.query.filter_by(username=username).first()
     if not user:
         abort(404)
-    posts = user.posts.order_by(Post.timestamp.desc()).all()
+    posts = load_posts(user.posts).order_by(Post.timestamp.desc()).all()
+    page_cache.depends_on(('user', user.id), ('page', 'profile', user.id), *post_page_tags(posts))
     return render_template('user.html', user=user, posts=posts)
 
 
@@ -107,6 +122,7 @@ def edit(id):
 
 
 @main.route('/follow/<username>')
+@primary_required
 @login_required
 @permission_required(Permission.FOLLOW)
 def follow(username):
@@ -124,6 +140,7 @@ def follow(username):
 
 
 @main.route('/unfollow/<username>')
+@primary_required
 @login_required
 @permission_required(Permission.FOLLOW)
 def unfollow(username):
@@ -141,15 +158,17 @@ def unfollow(username):
 
 
 @main.route('/followers/<username>')
+@page_cache.cached
 def followers(username):
     user = User.query.filter_by(username=username).first()
     if not user:
         flash('Invalid user.')
         return redirect(url_for('.index'))
-    page = request.args.get('page', 1, type=int)
     per_page = current_app.config['FLASKY_FOLLOWERS_PER_PAGE']
-    pagination = user.followers.paginate(page, per_page, error_out=False)
+    pagination = paginate_request(user.followers, (Follow.timestamp, Follow.follower_id), per_page)
     follows = [{'user': item.follower, 'timestamp': item.timestamp} for item in pagination.items]
+    page_cache.depends_on(('user', user.id), ('page', 'followers', user.id),
+                          *[('user', item.follower_id) for item in pagination.items])
     return render_template('followers.html', user=user,
                            title='Followers of', endpoint='.followers',
                            pagination=pagination, follows=follows)
@@ -161,9 +180,8 @@ def followed_by(username):
     if not user:
         flash('Invalid user.')
         return redirect(url_for('.index'))
-    page = request.args.get('page', 1, type=int)
     per_page = current_app.config['FLASKY_FOLLOWERS_PER_PAGE']
-    pagination = user.followed.paginate(page, per_page, error_out=False)
+    pagination = paginate_request(user.followed, (Follow.timestamp, Follow.followed_id), per_page)
     follows = [{'user': item.followed, 'timestamp': item.timestamp} for item in pagination.items]
     return render_template('followers.html', user=user,
                            title='Followed by', endpoint='.followed_by',
@@ -187,8 +205,9 @@ def show_followed():
 
 
 @main.route('/post/<int:id>', methods=['GET', 'POST'])
+@page_cache.cached
 def post(id):
-    post = Post.query.get_or_404(id)
+    post = load_posts(Post.query).get_or_404(id)
     form = CommentForm()
     if form.validate_on_submit():
         comment = Comment(
@@ -199,27 +218,43 @@ def post(id):
         db.session.add(comment)
         flash('Your comment has benn published.')
         return redirect(url_for('.post', id=post.id, page=-1))
-    page = request.args.get('page', 1, type=int)
-    if page == -1:
-        page = (post.comments.count() - 1) // current_app.config['FLASKY_COMMENTS_PER_PAGE'] + 1
     per_page = current_app.config['FLASKY_COMMENTS_PER_PAGE']
-    pagination = post.comments.order_by(Comment.timestamp.asc()).paginate(page, per_page, error_out=False)
+    pagination = paginate_request(load_comments(post.comments), (Comment.timestamp, Comment.id), per_page,
+                                  descending=False)
     comments = pagination.items
+    page_cache.depends_on(*post_page_tags([post]), *[('user', comment.author_id) for comment in comments])
     return render_template('post.html', posts=[post], form=form, comments=comments, pagination=pagination)
 
 
+@main.route('/search')
+def search():
+    query = request.args.get('q', '')
+    kind = request.args.get('kind', 'posts')
+    if kind == 'comments':
+        per_page = current_app.config['FLASKY_COMMENTS_PER_PAGE']
+        pagination = search_index.paginate(db.session, query, kind, load_comments(Comment.query), per_page)
+    else:
+        kind = 'posts'
+        per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
+        pagination = search_index.paginate(db.session, query, kind, load_posts(Post.query), per_page)
+    return render_template('search.html', query=query, kind=kind, pagination=pagination,
+                           posts=pagination.items if kind == 'posts' else [],
+                           comments=pagination.items if kind == 'comments' else [])
+
+
 @main.route('/moderate')
 @login_required
 @permission_required(Permission.MODERATE_COMMENTS)
 def moderate():
-    page = request.args.get('page', 1, type=int)
     per_page = current_app.config['FLASKY_COMMENTS_PER_PAGE']
-    pagination = Comment.query.order_by(Comment.timestamp.desc()).paginate(page, per_page, error_out=False)
+    pagination = paginate_request(load_comments(Comment.query), (Comment.timestamp, Comment.id), per_page)
     comments = pagination.items
-    return render_template('moderate.html', comments=comments, pagination=pagination, page=page)
+    return render_template('moderate.html', comments=comments, pagination=pagination,
+                           cursor=request.args.get('cursor'))
 
 
 @main.route('/moderate/enable/<int:id>')
+@primary_required
 @login_required
 @permission_required(Permission.MODERATE_COMMENTS)
 def moderate_enable(id):
@@ -227,10 +262,11 @@ def moderate_enable(id):
     comment.disabled = False
     db.session.add(comment)
     return redirect(url_for('.moderate',
-                            page=request.args.get('page', 1, type=int)))
+                            cursor=request.args.get('cursor')))
 
 
 @main.route('/moderate/disable/<int:id>')
+@primary_required
 @login_required
 @permission_required(Permission.MODERATE_COMMENTS)
 def moderate_disable(id):
@@ -238,7 +274,20 @@ def moderate_disable(id):
     comment.disabled = True
     db.session.add(comment)
     return redirect(url_for('.moderate',
-                            page=request.args.get('page', 1, type=int)))
+                            cursor=request.args.get('cursor')))
+
+
+@main.route('/sql-profile')
+@login_required
+@admin_required
+def sql_profile():
+    endpoint = request.args.get('view') or None
+    order_by = request.args.get('order', 'total')
+    if order_by not in ORDERS:
+        order_by = 'total'
+    endpoints, statements = sql_profiler.report(endpoint, order_by, limit=100)
+    return render_template('sql_profile.html', endpoints=endpoints, statements=statements,
+                           endpoint=endpoint, order_by=order_by)
 
 
 @main.after_app_request
@@ -0,0 +1,48 @@
+import hashlib
+
+from bleach import linkify, clean
+from markdown import markdown
+
+from .cache import LRUCache
+
+ALLOWED_TAGS = [
+    'a', 'abbr', 'acronym', 'b', 'blockquote', 'code',
+    'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul',
+    'h1', 'h2', 'h3', 'p', 'img']
+
+
+def render_markdown(source, tags=ALLOWED_TAGS):
+    initial_html = markdown(source, output_format='html')
+    return linkify(clean(initial_html, tags=tags, strip=True))
+
+
+class RenderCache:
+    """Content-addressed cache of rendered and sanitized Markdown.
+
+    Keys are a digest of the source text and the tag allowlist, so
+    changing the allowlist never serves HTML sanitized by the old one.
+    """
+
+    def __init__(self, app=None, tags=ALLOWED_TAGS):
+        self.tags = tags
+        self.cache = LRUCache()
+        self._salt = hashlib.sha256('\0'.join(sorted(tags)).encode('utf-8')).digest()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.cache.resize(app.config['FLASKY_RENDER_CACHE_SIZE'])
+
+    def key(self, source):
+        return hashlib.sha256(self._salt + source.encode('utf-8')).hexdigest()
+
+    def render(self, source):
+        key = self.key(source)
+        html = self.cache.get(key)
+        if html is None:
+            html = render_markdown(source, self.tags)
+            self.cache.set(key, html)
+        return html
+
+    def stats(self):
+        return self.cache.stats()
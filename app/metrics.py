@@ -0,0 +1,319 @@
+import atexit
+import glob
+import json
+import os
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+from time import monotonic, perf_counter
+
+from flask import abort, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+HOLD_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+HELP = {
+    'flasky_request_duration_seconds': ('histogram', 'Time from the start of a request to its response, '
+                                                     'including the session teardown.'),
+    'flasky_db_connection_held_seconds': ('histogram', 'Time a pooled database connection stays checked out.'),
+    'flasky_db_pool_checkouts_total': ('counter', 'Connections checked out of the database pool.'),
+    'flasky_db_connections_opened_total': ('counter', 'New database connections opened by the pool.'),
+    'flasky_db_pool_connections': ('gauge', 'Connections of the database pool by state.'),
+    'flasky_cache_hits_total': ('counter', 'Cache lookups that found an entry.'),
+    'flasky_cache_misses_total': ('counter', 'Cache lookups that found nothing.'),
+    'flasky_password_hashes_total': ('counter', 'Password hashes and checks.'),
+    'flasky_password_hash_seconds_total': ('counter', 'Time spent hashing and checking passwords.'),
+}
+
+POOL_STATES = ('size', 'checkedin', 'checkedout', 'overflow')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class _Middleware:
+    def __init__(self, wsgi_app, metrics):
+        self.wsgi_app = wsgi_app
+        self.metrics = metrics
+
+    def __call__(self, environ, start_response):
+        start = perf_counter()
+        status = []
+
+        def _start_response(code, headers, exc_info=None):
+            status.append(code[:3])
+            return start_response(code, headers, exc_info)
+
+        try:
+            return self.wsgi_app(environ, _start_response)
+        finally:
+            # время до возврата тела ответа: потоковые ответы учитываются до первого байта
+            self.metrics.observe_request(environ.get('flasky.endpoint'), environ.get('REQUEST_METHOD', ''),
+                                         status[0] if status else '500', perf_counter() - start)
+
+
+class Metrics:
+    """Request, database pool and cache metrics in Prometheus text format.
+
+    Each process keeps its own histograms of request latency per
+    endpoint, method and status and of how long pooled database
+    connections stay checked out, taken from the pool's checkout, checkin
+    and connect events. With FLASKY_METRICS_PATH set, gunicorn workers
+    write their totals to a file of their own every
+    FLASKY_METRICS_INTERVAL seconds and /metrics adds up the files of all
+    workers. Files of exited workers are removed at the next scrape, which
+    Prometheus sees as a counter reset. /metrics requires the
+    FLASKY_METRICS_TOKEN bearer token; without a token it answers 404
+    unless FLASKY_METRICS_PUBLIC is set.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.path = None
+        self.interval = 5
+        self.token = None
+        self.public = False
+        self._lock = Lock()
+        self._histograms = {}
+        self._counters = defaultdict(int)
+        self._listeners = {}
+        self._saved = monotonic()
+        atexit.register(self.save)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.path = app.config['FLASKY_METRICS_PATH']
+        self.interval = app.config['FLASKY_METRICS_INTERVAL']
+        self.token = app.config['FLASKY_METRICS_TOKEN']
+        self.public = app.config['FLASKY_METRICS_PUBLIC']
+        with self._lock:
+            self._histograms = {}
+            self._counters = defaultdict(int)
+        app.wsgi_app = _Middleware(app.wsgi_app, self)
+        app.before_request(self._before_request)
+        app.add_url_rule('/metrics', 'metrics', self.view)
+
+    @staticmethod
+    def _before_request():
+        request.environ['flasky.endpoint'] = request.endpoint
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self._counters[name, labels] += value
+
+    def observe_request(self, endpoint, method, status, seconds):
+        blueprint = endpoint.rpartition('.')[0] if endpoint else ''
+        labels = (('blueprint', blueprint), ('endpoint', endpoint or 'none'), ('method', method),
+                  ('status', status))
+        self.observe('flasky_request_duration_seconds', labels, seconds, LATENCY_BUCKETS)
+        self._instrument_pools()
+        if self.path is not None and monotonic() - self._saved >= self.interval:
+            self.save()
+
+    def _engines(self):
+        from flask_sqlalchemy import get_state
+
+        if self.app is None or 'sqlalchemy' not in self.app.extensions:
+            return {}
+        connectors = dict(get_state(self.app).connectors)
+        return {bind or 'default': connector._engine for bind, connector in connectors.items()
+                if connector._engine is not None}
+
+    def _pool_listeners(self, bind):
+        labels = (('bind', bind),)
+
+        def checkout(dbapi_connection, record, proxy):
+            record.info['flasky.checkout'] = perf_counter()
+            self.inc('flasky_db_pool_checkouts_total', labels)
+
+        def checkin(dbapi_connection, record):
+            start = record.info.pop('flasky.checkout', None)
+            if start is not None:
+                self.observe('flasky_db_connection_held_seconds', labels, perf_counter() - start, HOLD_BUCKETS)
+
+        def connect(dbapi_connection, record):
+            self.inc('flasky_db_connections_opened_total', labels)
+
+        return {'checkout': checkout, 'checkin': checkin, 'connect': connect}
+
+    def _instrument_pools(self):
+        # пулы создаются вместе с движками при первом обращении к базе;
+        # пересозданный пул (dispose) наследует слушателей старого
+        for bind, engine in self._engines().items():
+            listeners = self._listeners.get(bind)
+            if listeners is None:
+                listeners = self._listeners[bind] = self._pool_listeners(bind)
+            if not event.contains(engine.pool, 'checkout', listeners['checkout']):
+                for name, listener in listeners.items():
+                    event.listen(engine.pool, name, listener)
+
+    def _collect(self):
+        from . import (render_cache, fragment_cache, identity_cache, token_cache, credential_cache,
+                       page_cache, password_hasher)
+
+        with self._lock:
+            counters = dict(self._counters)
+        caches = [('render', render_cache.stats()), ('identity', identity_cache.stats()),
+                  ('token', token_cache.stats()), ('credential', credential_cache.stats()),
+                  ('page', page_cache.stats())]
+        caches += [(f'fragment_{kind}', stats) for kind, stats in fragment_cache.stats().items()]
+        for name, stats in caches:
+            counters['flasky_cache_hits_total', (('cache', name),)] = stats['hits']
+            counters['flasky_cache_misses_total', (('cache', name),)] = stats['misses']
+        hashing = password_hasher.stats()
+        counters['flasky_password_hashes_total', ()] = hashing['count']
+        counters['flasky_password_hash_seconds_total', ()] = hashing['seconds']
+        gauges = {}
+        self._instrument_pools()
+        for bind, engine in self._engines().items():
+            for state in POOL_STATES:
+                value = getattr(engine.pool, state, None)
+                if callable(value):
+                    gauges['flasky_db_pool_connections', (('bind', bind), ('state', state))] = value()
+        return counters, gauges
+
+    def snapshot(self):
+        counters, gauges = self._collect()
+        with self._lock:
+            histograms = [[name, labels, histogram.buckets, list(histogram.counts), histogram.sum]
+                          for (name, labels), histogram in self._histograms.items()]
+        return {
+            'pid': os.getpid(),
+            'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+            'gauges': [[name, labels, value] for (name, labels), value in gauges.items()],
+            'histograms': histograms,
+        }
+
+    def _file(self, pid):
+        return os.path.join(self.path, f'metrics.{pid}.json')
+
+    def save(self):
+        if self.path is None or self.app is None:
+            return
+        self._saved = monotonic()
+        with self.app.app_context():
+            snapshot = self.snapshot()
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self._file(f'{os.getpid()}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, self._file(os.getpid()))
+
+    def _snapshots(self):
+        yield self.snapshot()
+        if self.path is None:
+            return
+        for name in glob.glob(self._file('*')):
+            if name == self._file(os.getpid()) or name.endswith('.tmp.json'):
+                continue
+            try:
+                with open(name) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not _alive(snapshot['pid']):
+                # иначе счетчики завершенных воркеров копились бы между перезапусками
+                try:
+                    os.remove(name)
+                except FileNotFoundError:
+                    pass
+                continue
+            yield snapshot
+
+    def collect(self):
+        """Counters, gauges and histograms added up over all processes."""
+        counters = defaultdict(float)
+        gauges = defaultdict(float)
+        histograms = {}
+        for snapshot in self._snapshots():
+            for name, labels, value in snapshot['counters']:
+                counters[name, tuple(map(tuple, labels))] += value
+            for name, labels, value in snapshot['gauges']:
+                gauges[name, tuple(map(tuple, labels))] += value
+            for name, labels, buckets, counts, total in snapshot['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                if key not in histograms:
+                    histograms[key] = [tuple(buckets), [0] * len(counts), 0.0]
+                merged = histograms[key]
+                if merged[0] != tuple(buckets):
+                    # границы корзин изменились между версиями приложения
+                    continue
+                merged[1] = [a + b for a, b in zip(merged[1], counts)]
+                merged[2] += total
+        return counters, gauges, histograms
+
+    def render(self):
+        counters, gauges, histograms = self.collect()
+        families = defaultdict(list)
+        for (name, labels), value in sorted(counters.items()):
+            families[name].append(f'{name}{_labels(labels)} {_number(value)}')
+        for (name, labels), value in sorted(gauges.items()):
+            families[name].append(f'{name}{_labels(labels)} {_number(value)}')
+        for (name, labels), (buckets, counts, total) in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(buckets + (float('inf'),), counts):
+                cumulative += count
+                families[name].append(f'{name}_bucket{_labels(labels, [("le", _number(bound))])} {cumulative}')
+            families[name].append(f'{name}_sum{_labels(labels)} {_number(total)}')
+            families[name].append(f'{name}_count{_labels(labels)} {cumulative}')
+        lines = []
+        for name in sorted(families):
+            kind, description = HELP[name]
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}'] + families[name]
+        return '\n'.join(lines) + '\n'
+
+    def view(self):
+        if self.token:
+            if request.headers.get('Authorization') != f'Bearer {self.token}':
+                abort(403)
+        elif not self.public:
+            abort(404)
+        return self.app.response_class(self.render(), mimetype='text/plain; version=0.0.4')
@@ -1,16 +1,25 @@
 from datetime import datetime
+from collections import defaultdict
+from itertools import chain
 import hashlib
 
-from werkzeug.security import generate_password_hash, check_password_hash
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
 from flask_login import UserMixin, AnonymousUserMixin
-from flask import current_app, request, url_for
-from markdown import markdown
-from bleach import linkify, clean
+from flask import current_app, request
 
 from . import db
+from . import render_cache
+from . import follow_graph
+from . import versions
+from . import identity_cache
+from . import token_cache
+from . import password_hasher
+from . import last_seen_buffer
+from . import search_index
 from .exceptions import ValidationError
+from .serialization import url_templates, http_date
 from . import loging_manager
+from .replicas import primary
 
 
 class Follow(db.Model):
@@ -18,6 +27,19 @@ class Follow(db.Model):
     follower_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
     followed_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
     timestamp = db.Column(db.DateTime(), default=datetime.utcnow)
+    # списки подписчиков и подписок идут по времени подписки
+    __table_args__ = (
+        db.Index('ix_follows_followed_id_timestamp_follower_id', 'followed_id', 'timestamp', 'follower_id'),
+        db.Index('ix_follows_follower_id_timestamp_followed_id', 'follower_id', 'timestamp', 'followed_id'),
+    )
+
+
+class TimelineEntry(db.Model):
+    __tablename__ = 'timeline'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), primary_key=True)
+    timestamp = db.Column(db.DateTime(), default=datetime.utcnow)
+    __table_args__ = (db.Index('ix_timeline_user_id_timestamp_post_id', 'user_id', 'timestamp', 'post_id'),)
 
 
 class Role(db.Model):
@@ -76,6 +98,11 @@ class User(UserMixin, db.Model):
     member_since = db.Column(db.DateTime(), default=datetime.utcnow)
     last_seen = db.Column(db.DateTime(), default=datetime.utcnow)
     avatar_hash = db.Column(db.String(32))
+    post_count = db.Column(db.Integer, default=0)
+    follower_count = db.Column(db.Integer, default=0)
+    followed_count = db.Column(db.Integer, default=0)
+    # меняется и при обновлении счетчиков, см. update_counters
+    updated_at = db.Column(db.DateTime(), default=datetime.utcnow, onupdate=datetime.utcnow)
     posts = db.relationship('Post', backref='author', lazy='dynamic')
     followed = db.relationship('Follow',
                                foreign_keys=[Follow.follower_id],
@@ -121,10 +148,10 @@ class User(UserMixin, db.Model):
 
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def verify_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.check(self.password_hash, password)
 
     def generate_confirmation_token(self, expiration=3600):
         s = Serializer(current_app.config['SECRET_KEY'], expiration)
@@ -185,8 +212,8 @@ class User(UserMixin, db.Model):
         return True
 
     def ping(self):
-        self.last_seen = datetime.utcnow()
-        db.session.add(self)
+        # запись откладывается, см. LastSeenBuffer
+        last_seen_buffer.touch(self.id, self.last_seen)
 
     def gravatar(self, size=100, default='identicon', rating='g'):
         if request.is_secure:
@@ -196,34 +223,14 @@ class User(UserMixin, db.Model):
         hash = self.avatar_hash
         return f'{url}/{hash}?s={size}&d={default}&r={rating}'
 
-    @staticmethod
-    def generate_fake(count=10):
-        from sqlalchemy.exc import IntegrityError
-        from random import seed
-        import forgery_py
-
-        seed()
-        for i in range(count):
-            u = User(email=forgery_py.internet.email_address(),
-                     username=forgery_py.internet.user_name(True),
-                     password=forgery_py.lorem_ipsum.word(),
-                     confirmed=True,
-                     name=forgery_py.name.full_name(),
-                     location=forgery_py.address.city(),
-                     about_me=forgery_py.lorem_ipsum.sentence(),
-                     member_since=forgery_py.date.date(True))
-            db.session.add(u)
-            try:
-                db.session.commit()
-            except IntegrityError:
-                db.session.rollback()
-
     def follow(self, user):
         if not self.is_following(user):
             f = Follow(follower=self, followed=user)
             db.session.add(f)
 
     def is_following(self, user):
+        if _follow_graph_usable(self, user):
+            return follow_graph.is_following(self.id, user.id)
         return self.followed.filter_by(followed_id=user.id).first() is not None
 
     def unfollow(self, user):
@@ -232,11 +239,16 @@ class User(UserMixin, db.Model):
             db.session.delete(f)
 
     def is_followed_by(self, user):
+        if _follow_graph_usable(self, user):
+            return follow_graph.is_following(user.id, self.id)
         return self.followers.filter_by(follower_id=user.id).first() is not None
 
     @property
     def followed_posts(self):
-        return Post.query.join(Follow, Follow.followed_id == Post.author_id).filter(Follow.follower_id == self.id)
+        # посты читаются из материализованной ленты, см. update_timelines
+        return Post.query.join(TimelineEntry, TimelineEntry.post_id == Post.id)\
+            .filter(TimelineEntry.user_id == self.id)\
+            .order_by(TimelineEntry.timestamp.desc())
 
     @staticmethod
     def add_self_follows():
@@ -252,22 +264,27 @@ class User(UserMixin, db.Model):
 
     @staticmethod
     def verify_auth_token(token):
-        s = Serializer(current_app.config['SECRET_KEY'])
-        try:
-            data = s.loads(token)
-        except:
-            return None
-        return User.query.get(data['id'])
+        user_id = token_cache.get(token)
+        if user_id is None:
+            s = Serializer(current_app.config['SECRET_KEY'])
+            try:
+                data, header = s.loads(token, return_header=True)
+            except:
+                return None
+            user_id = data['id']
+            token_cache.set(token, user_id, header['exp'])
+        return load_user(user_id)
 
     def to_json(self):
+        urls = url_templates()
         json_user = {
-            'url': url_for('api.get_post', id=self.id, _external=True),
+            'url': urls.build('api.get_post', self.id, external=True),
             'username': self.username,
-            'member_since': self.member_since,
-            'last_seen': self.last_seen,
-            'posts': url_for('api.get_user_posts', id=self.id, _external=True),
-            'followed_posts': url_for('api.get_user_followed_posts', id=self.id, _external=True),
-            'post_count': self.posts.count()
+            'member_since': http_date(self.member_since),
+            'last_seen': http_date(self.last_seen),
+            'posts': urls.build('api.get_user_posts', self.id, external=True),
+            'followed_posts': urls.build('api.get_user_followed_posts', self.id, external=True),
+            'post_count': self.post_count
         }
         return json_user
 
@@ -287,43 +304,33 @@ class Post(db.Model):
     timestamp = db.Column(db.DateTime(), index=True, default=datetime.utcnow)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     body_html = db.Column(db.Text)
+    comment_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime(), default=datetime.utcnow, onupdate=datetime.utcnow)
     comments = db.relationship('Comment', backref='post', lazy='dynamic')
-
-    @staticmethod
-    def generate_fake():
-        from random import seed, randint
-        import forgery_py
-
-        seed()
-        user_count = User.query.count()
-        for i in range(user_count):
-            u = User.query.offset(randint(0, user_count - 1)).first()
-            p = Post(
-                body=forgery_py.lorem_ipsum.sentences(randint(1, 3)),
-                timestamp=forgery_py.date.date(True),
-                author=u
-            )
-            db.session.add(p)
-            db.session.commit()
+    __table_args__ = (db.Index('ix_posts_author_id_updated_at', 'author_id', 'updated_at'),
+                      db.Index('ix_posts_author_id_timestamp_id', 'author_id', 'timestamp', 'id'))
 
     @staticmethod
     def on_changed_body(target, value, oldvalue, initiator):
-        allowed_tags = [
-            'a', 'abbr', 'acronym', 'b', 'blockquote', 'code',
-            'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul',
-            'h1', 'h2', 'h3', 'p', 'img']
-        initial_body_html = markdown(value, output_format='html')
-        target.body_html = linkify(clean(initial_body_html, tags=allowed_tags, strip=True))
+        if value == oldvalue and target.body_html is not None:
+            return
+        target.body_html = render_cache.render(value)
+        # строка поискового индекса перезаписывается при следующем flush
+        target._search_stale = True
+
+    def fragment_key(self, stamps=versions):
+        return ('posts', self.id, stamps.get(('posts', self.id)), stamps.get(('user', self.author_id)))
 
     def to_json(self):
+        urls = url_templates()
         json_post = {
-            'url': url_for('api.get_post', id=self.id, _external=True),
+            'url': urls.build('api.get_post', self.id, external=True),
             'body': self.body,
             'body_html': self.body_html,
-            'timestamp': self.timestamp,
-            'author': url_for('api.get_user', id=self.author_id, _external=True),
-            'comments': url_for('api.get_post_comments', id=self.id, _external=True),
-            'comment_count': self.comments.count()
+            'timestamp': http_date(self.timestamp),
+            'author': urls.build('api.get_user', self.author_id, external=True),
+            'comments': urls.build('api.get_post_comments', self.id, external=True),
+            'comment_count': self.comment_count
         }
         return json_post
 
@@ -344,24 +351,28 @@ class Comment(db.Model):
     disabled = db.Column(db.Boolean)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     post_id = db.Column(db.Integer, db.ForeignKey('posts.id'))
+    __table_args__ = (db.Index('ix_comments_post_id_timestamp_id', 'post_id', 'timestamp', 'id'),)
 
     @staticmethod
     def on_changed_body(target, value, oldvalue, initiator):
-        allowed_tags = [
-            'a', 'abbr', 'acronym', 'b', 'blockquote', 'code',
-            'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul',
-            'h1', 'h2', 'h3', 'p', 'img']
-        initial_body_html = markdown(value, output_format='html')
-        target.body_html = linkify(clean(initial_body_html, tags=allowed_tags, strip=True))
+        if value == oldvalue and target.body_html is not None:
+            return
+        target.body_html = render_cache.render(value)
+        # строка поискового индекса перезаписывается при следующем flush
+        target._search_stale = True
+
+    def fragment_key(self, stamps=versions):
+        return ('comments', self.id, stamps.get(('comments', self.id)), stamps.get(('user', self.author_id)))
 
     def to_json(self):
+        urls = url_templates()
         json_comment = {
-            'url': url_for('api.get_comment', id=self.id, _external=True),
-            'post_url': url_for('api.get_post', id=self.post_id),
+            'url': urls.build('api.get_comment', self.id, external=True),
+            'post_url': urls.build('api.get_post', self.post_id),
             'body': self.body,
             'body_html': self.body_html,
-            'timestamp': self.timestamp,
-            'author_url': url_for('api.get_user', id=self.author_id)
+            'timestamp': http_date(self.timestamp),
+            'author_url': urls.build('api.get_user', self.author_id)
         }
         return json_comment
 
@@ -373,11 +384,373 @@ class Comment(db.Model):
         return Comment(body=body)
 
 
+class OutboxMessage(db.Model):
+    __tablename__ = 'outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(128))
+    subject = db.Column(db.String(256))
+    template = db.Column(db.String(128))
+    context = db.Column(db.Text)
+    base_url = db.Column(db.String(256))
+    created_at = db.Column(db.DateTime(), default=datetime.utcnow)
+    # NULL у отправленных и окончательно не доставленных писем
+    next_attempt_at = db.Column(db.DateTime(), index=True, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, default=0)
+    sent_at = db.Column(db.DateTime())
+    last_error = db.Column(db.Text)
+
+    def __repr__(self):
+        return '<OutboxMessage %r>' % self.id
+
+
+def _counter_deltas(objects, sign, deltas):
+    for obj in objects:
+        if isinstance(obj, Post):
+            deltas[(User, obj.author_id, 'post_count')] += sign
+        elif isinstance(obj, Comment):
+            deltas[(Post, obj.post_id, 'comment_count')] += sign
+        elif isinstance(obj, Follow):
+            deltas[(User, obj.followed_id, 'follower_count')] += sign
+            deltas[(User, obj.follower_id, 'followed_count')] += sign
+
+
+def update_counters(session, flush_context):
+    # Счетчики обновляются атомарным UPDATE, чтобы параллельные запросы
+    # не затирали значения друг друга.
+    deltas = defaultdict(int)
+    _counter_deltas(session.new, 1, deltas)
+    _counter_deltas(session.deleted, -1, deltas)
+    expired = session.info.setdefault('expired_counters', [])
+    for (model, id, attr), delta in deltas.items():
+        if id is None or delta == 0:
+            continue
+        column = getattr(model, attr)
+        session.execute(model.__table__.update()
+                        .where(model.id == id)
+                        .values({attr: db.func.coalesce(column, 0) + delta}))
+        expired.append((model, id, attr))
+
+
+def expire_counters(session, flush_context):
+    for model, id, attr in session.info.pop('expired_counters', []):
+        obj = session.identity_map.get(db.inspect(model).identity_key_from_primary_key([id]))
+        if obj is not None:
+            session.expire(obj, [attr, 'updated_at'])
+
+
+def _not_in_timeline(user_id):
+    timeline = TimelineEntry.__table__
+    return ~db.exists().where(db.and_(timeline.c.user_id == user_id,
+                                      timeline.c.post_id == Post.__table__.c.id))
+
+
+def _fan_out(session, user_id, post_filter, limit):
+    # Добавить в ленту пользователя последние посты, которых там еще нет
+    posts = Post.__table__
+    select = db.select([db.literal(user_id), posts.c.id, posts.c.timestamp])\
+        .where(post_filter)\
+        .where(_not_in_timeline(user_id))\
+        .order_by(posts.c.timestamp.desc())\
+        .limit(limit)
+    session.execute(TimelineEntry.__table__.insert().from_select(['user_id', 'post_id', 'timestamp'], select))
+
+
+def _trim_timelines(session, user_filter, length):
+    # Удалить из лент все, что старше length-го по счету поста
+    timeline = TimelineEntry.__table__
+    newer = timeline.alias()
+    boundary = db.select([newer.c.timestamp])\
+        .where(newer.c.user_id == timeline.c.user_id)\
+        .order_by(newer.c.timestamp.desc())\
+        .limit(1).offset(length - 1)\
+        .as_scalar()
+    session.execute(timeline.delete().where(user_filter).where(timeline.c.timestamp < boundary))
+
+
+def update_timelines(session, flush_context):
+    timeline = TimelineEntry.__table__
+    posts = Post.__table__
+    follows = Follow.__table__
+    length = current_app.config['FLASKY_TIMELINE_LENGTH']
+    for obj in session.deleted:
+        if isinstance(obj, Follow):
+            session.execute(timeline.delete().where(db.and_(
+                timeline.c.user_id == obj.follower_id,
+                timeline.c.post_id.in_(db.select([posts.c.id]).where(posts.c.author_id == obj.followed_id)))))
+    for obj in session.new:
+        if isinstance(obj, Follow):
+            _fan_out(session, obj.follower_id, posts.c.author_id == obj.followed_id, length)
+            _trim_timelines(session, timeline.c.user_id == obj.follower_id, length)
+        elif isinstance(obj, Post) and obj.author_id is not None:
+            select = db.select([follows.c.follower_id, posts.c.id, posts.c.timestamp])\
+                .where(follows.c.followed_id == posts.c.author_id)\
+                .where(posts.c.id == obj.id)\
+                .where(_not_in_timeline(follows.c.follower_id))
+            session.execute(timeline.insert().from_select(['user_id', 'post_id', 'timestamp'], select))
+            _trim_timelines(session, timeline.c.user_id.in_(
+                db.select([follows.c.follower_id]).where(follows.c.followed_id == obj.author_id)), length)
+
+
+def rebuild_timelines(user_ids=None):
+    """Refill the materialized timelines from the follow graph.
+
+    Rebuilds all users unless user_ids is given.
+    """
+    length = current_app.config['FLASKY_TIMELINE_LENGTH']
+    timeline = TimelineEntry.__table__
+    follows = Follow.__table__
+    posts = Post.__table__
+    if user_ids is None:
+        user_ids = [id for (id,) in db.session.query(User.id)]
+        db.session.execute(timeline.delete())
+    for i, user_id in enumerate(user_ids, 1):
+        db.session.execute(timeline.delete().where(timeline.c.user_id == user_id))
+        followed = db.select([follows.c.followed_id]).where(follows.c.follower_id == user_id)
+        _fan_out(db.session, user_id, posts.c.author_id.in_(followed), length)
+        if i % 100 == 0:
+            db.session.commit()
+    db.session.commit()
+
+
+def _follow_graph_usable(*users):
+    # Граф содержит только зафиксированные подписки, поэтому для новых
+    # пользователей и незафиксированных изменений используется база данных
+    if not follow_graph.enabled or any(user.id is None for user in users):
+        return False
+    session = db.session()
+    if session.info.get('follow_changes') or \
+            any(isinstance(obj, Follow) for obj in chain(session.new, session.deleted)):
+        return False
+    if not follow_graph.available():
+        build_follow_graph()
+        return follow_graph.available()
+    return True
+
+
+def record_follow_changes(session, flush_context):
+    if not follow_graph.enabled:
+        return
+    changes = session.info.setdefault('follow_changes', [])
+    for obj in session.new:
+        if isinstance(obj, Follow):
+            changes.append((1, obj.follower_id, obj.followed_id))
+    for obj in session.deleted:
+        if isinstance(obj, Follow):
+            changes.append((0, obj.follower_id, obj.followed_id))
+
+
+def publish_follow_changes(session):
+    follow_graph.record(session.info.pop('follow_changes', None))
+
+
+def discard_follow_changes(session, previous_transaction):
+    session.info.pop('follow_changes', None)
+
+
+def build_follow_graph():
+    """Rewrite the follow graph snapshot from the follows table."""
+    follows = Follow.__table__
+
+    def edges():
+        # подписки читаются под блокировкой лога, чтобы не потерять параллельные изменения
+        rows = db.session.execute(db.select([follows.c.follower_id, follows.c.followed_id]))
+        return [(a, b) for a, b in rows]
+
+    follow_graph.build(edges)
+
+
+def _changed_columns(obj):
+    # изменения связей (например, добавление подписки) в расчет не берутся
+    state = db.inspect(obj)
+    return {attr.key for attr in state.mapper.column_attrs if state.attrs[attr.key].history.has_changes()}
+
+
+# Столбцы, изменение которых не делает кэшированного пользователя устаревшим
+IDENTITY_VOLATILE = {'last_seen', 'post_count', 'follower_count', 'followed_count', 'updated_at'}
+# Столбцы, изменение которых отзывает кэшированные токены API
+CREDENTIALS = {'email', 'password_hash'}
+
+
+def record_identity_changes(session, flush_context):
+    changes = session.info.setdefault('identity_changes', set())
+    for obj in chain(session.dirty, session.deleted):
+        if isinstance(obj, Role):
+            changes.add(('roles', None))
+        elif isinstance(obj, User):
+            changed = _changed_columns(obj)
+            deleted = obj in session.deleted
+            if deleted or changed - IDENTITY_VOLATILE:
+                changes.add(('user', obj.id))
+            if deleted or changed & CREDENTIALS:
+                changes.add(('credentials', obj.id))
+
+
+def publish_identity_changes(session):
+    changes = session.info.pop('identity_changes', None)
+    if changes:
+        identity_cache.invalidate([id for kind, id in changes if kind == 'user'],
+                                  roles=('roles', None) in changes)
+        token_cache.revoke([id for kind, id in changes if kind == 'credentials'])
+
+
+def discard_identity_changes(session, previous_transaction):
+    session.info.pop('identity_changes', None)
+
+
+# Изменение только счетчика комментариев не затрагивает кэшированный фрагмент
+FRAGMENT_VOLATILE = {'comment_count'}
+
+
+def record_fragment_changes(session, flush_context):
+    changes = session.info.setdefault('fragment_changes', set())
+    for obj in chain(session.dirty, session.deleted):
+        if isinstance(obj, (Post, Comment)):
+            changed = _changed_columns(obj)
+            if obj in session.deleted or changed - FRAGMENT_VOLATILE:
+                changes.add((obj.__tablename__, obj.id))
+
+
+def publish_fragment_changes(session):
+    for key in session.info.pop('fragment_changes', ()):
+        versions.bump(key)
+
+
+def discard_fragment_changes(session, previous_transaction):
+    session.info.pop('fragment_changes', None)
+
+
+def record_page_changes(session, flush_context):
+    # ключи страниц кэша анонимных ответов, см. PageCache
+    changes = session.info.setdefault('page_changes', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Post):
+            changes.add(('page', 'post', obj.id))
+            if obj not in session.dirty:
+                changes.update((('page', 'posts'), ('page', 'profile', obj.author_id)))
+        elif isinstance(obj, Comment):
+            changes.add(('page', 'post', obj.post_id))
+        elif isinstance(obj, Follow):
+            changes.update((('page', 'profile', obj.follower_id), ('page', 'profile', obj.followed_id),
+                            ('page', 'followers', obj.followed_id)))
+
+
+def publish_page_changes(session):
+    for key in session.info.pop('page_changes', ()):
+        versions.bump(key)
+
+
+def discard_page_changes(session, previous_transaction):
+    session.info.pop('page_changes', None)
+
+
+def update_search_index(session, flush_context):
+    # индекс пишется в той же транзакции, что и сами строки, и откатывается вместе с ними
+    updated = defaultdict(list)
+    removed = defaultdict(list)
+    for obj in chain(session.new, session.dirty):
+        if isinstance(obj, (Post, Comment)):
+            stale = obj.__dict__.pop('_search_stale', False)
+            if isinstance(obj, Comment) and obj.disabled:
+                if 'disabled' in _changed_columns(obj):
+                    removed['comments'].append(obj.id)
+            elif stale or isinstance(obj, Comment) and 'disabled' in _changed_columns(obj):
+                updated[obj.__tablename__].append((obj.id, obj.body))
+    for obj in session.deleted:
+        if isinstance(obj, (Post, Comment)):
+            removed[obj.__tablename__].append(obj.id)
+    if not updated and not removed:
+        return
+    connection = session.connection()
+    for kind, rows in updated.items():
+        search_index.update(connection, kind, rows)
+    for kind, ids in removed.items():
+        search_index.remove(connection, kind, ids)
+
+
+def rebuild_search_index(batch_size=1000):
+    """Recreate the search index from all posts and enabled comments."""
+    connection = db.session.connection()
+    search_index.drop(None, connection)
+    search_index.create(None, connection)
+    queries = (('posts', db.session.query(Post.id, Post.body)),
+               ('comments', db.session.query(Comment.id, Comment.body).filter(Comment.disabled.isnot(True))))
+    for kind, query in queries:
+        rows = []
+        for row in query.yield_per(batch_size):
+            rows.append(tuple(row))
+            if len(rows) >= batch_size:
+                search_index.update(connection, kind, rows)
+                rows = []
+        search_index.update(connection, kind, rows)
+    db.session.commit()
+
+
+def reconcile_counters():
+    """Recompute stored counters from the source tables.
+
+    Returns the number of rows whose counters had drifted.
+    """
+    counters = [
+        (User, User.post_count,
+         db.select([db.func.count(Post.id)]).where(Post.author_id == User.id)),
+        (User, User.follower_count,
+         db.select([db.func.count()]).select_from(Follow.__table__).where(Follow.followed_id == User.id)),
+        (User, User.followed_count,
+         db.select([db.func.count()]).select_from(Follow.__table__).where(Follow.follower_id == User.id)),
+        (Post, Post.comment_count,
+         db.select([db.func.count(Comment.id)]).where(Comment.post_id == Post.id)),
+    ]
+    repaired = 0
+    for model, column, count in counters:
+        count = count.as_scalar()
+        result = db.session.execute(model.__table__.update()
+                                    .where(db.or_(column.is_(None), column != count))
+                                    .values({column.key: count}))
+        repaired += result.rowcount
+    db.session.commit()
+    return repaired
+
+
 loging_manager.anonymous_user = AnonymousUser
 db.event.listen(Post.body, 'set', Post.on_changed_body)
 db.event.listen(Comment.body, 'set', Comment.on_changed_body)
+db.event.listen(db.session, 'after_flush', update_counters)
+db.event.listen(db.session, 'after_flush_postexec', expire_counters)
+db.event.listen(db.session, 'after_flush', update_timelines)
+db.event.listen(db.session, 'after_flush', record_follow_changes)
+db.event.listen(db.session, 'after_commit', publish_follow_changes)
+db.event.listen(db.session, 'after_soft_rollback', discard_follow_changes)
+db.event.listen(db.session, 'after_flush', record_identity_changes)
+db.event.listen(db.session, 'after_commit', publish_identity_changes)
+db.event.listen(db.session, 'after_soft_rollback', discard_identity_changes)
+db.event.listen(db.session, 'after_flush', record_fragment_changes)
+db.event.listen(db.session, 'after_commit', publish_fragment_changes)
+db.event.listen(db.session, 'after_soft_rollback', discard_fragment_changes)
+db.event.listen(db.session, 'after_flush', record_page_changes)
+db.event.listen(db.session, 'after_commit', publish_page_changes)
+db.event.listen(db.session, 'after_soft_rollback', discard_page_changes)
+db.event.listen(db.session, 'after_flush', update_search_index)
+db.event.listen(db.metadata, 'after_create', search_index.create)
+db.event.listen(db.metadata, 'before_drop', search_index.drop)
 
 
 @loging_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    cached = identity_cache.get(user_id)
+    if cached is not None:
+        # merge без загрузки не выполняет запросов; счетчики часто меняются
+        # и перечитываются только если к ним обратятся
+        user = db.session.merge(cached, load=False)
+        db.session.expire(user, ['post_count', 'follower_count', 'followed_count', 'updated_at'])
+        return user
+    stamp = identity_cache.stamp(user_id)
+    # версия снята с основной базы, а реплика может отставать: промах читает основную
+    with primary():
+        user = User.query.options(db.joinedload(User.role)).get(user_id)
+    if user is not None and identity_cache.enabled:
+        # в кэш попадает отсоединенная копия, а не объект текущей сессии
+        scratch = db.Session()
+        identity_cache.set(scratch.merge(user, load=False), stamp)
+        scratch.close()
+    return user
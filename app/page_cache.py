@@ -0,0 +1,96 @@
+import hashlib
+from collections import namedtuple
+from datetime import datetime, timezone
+from functools import wraps
+from time import monotonic
+
+from flask import current_app, request, session
+from flask_login import current_user
+
+from .cache import LRUCache
+
+_Page = namedtuple('_Page', 'expires stamps data status mimetype etag last_modified')
+
+
+class PageCache:
+    """Response cache for anonymous GET requests.
+
+    While rendering, a cached view declares the VersionTable keys its page
+    depends on with depends_on(), e.g. ('page', 'post', id) for every post
+    shown. Committed writes bump those keys (see record_page_changes in
+    models.py), which invalidates exactly the pages showing the changed
+    rows; FLASKY_PAGE_CACHE_TTL bounds the staleness of anything that is
+    not tracked, such as last_seen. Requests with pending flash messages
+    and responses that set cookies or touch the session are never cached.
+    Cached pages carry an ETag and Last-Modified, so revalidating clients
+    get 304 Not Modified.
+    """
+
+    def __init__(self, versions, app=None):
+        self.ttl = 60
+        self.cache = LRUCache()
+        self.versions = versions
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config['FLASKY_PAGE_CACHE_TTL']
+        self.cache.resize(app.config['FLASKY_PAGE_CACHE_SIZE'])
+        self.cache.clear()
+
+    def depends_on(self, *keys):
+        tags = request.environ.get('flasky.page_tags')
+        if tags is not None:
+            tags.update(keys)
+
+    def cached(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self._cacheable_request():
+                return view(*args, **kwargs)
+            key = (request.scheme, request.full_path)
+            entry = self.cache.get(key)
+            if entry is not None:
+                if self._fresh(entry):
+                    response = self._response(entry)
+                    response.headers['X-Page-Cache'] = 'hit'
+                    return response
+                self.cache.pop(key)
+            # версии снимаются до чтения строк: изменение, зафиксированное во время
+            # рендера, делает страницу устаревшей, а не прячется под новой версией
+            versions = self.versions.snapshot()
+            # промах читает основную базу: строки отстающей реплики могут быть
+            # старше снятых версий, а страница хранится до записи в них
+            request.environ.pop('flasky.replica', None)
+            tags = request.environ['flasky.page_tags'] = set()
+            response = current_app.make_response(view(*args, **kwargs))
+            if tags and self._cacheable_response(response):
+                stamps = [(tag, versions.get(tag)) for tag in tags]
+                data = response.get_data()
+                page = _Page(monotonic() + self.ttl, stamps, data, response.status_code, response.mimetype,
+                             hashlib.sha1(data).hexdigest(), datetime.now(timezone.utc).replace(microsecond=0))
+                self.cache.set(key, page)
+                response = self._response(page)
+            response.headers['X-Page-Cache'] = 'miss'
+            return response
+        return wrapper
+
+    def _cacheable_request(self):
+        return self.ttl > 0 and request.method == 'GET' and \
+            '_flashes' not in session and not current_user.is_authenticated
+
+    def _cacheable_response(self, response):
+        return response.status_code == 200 and not response.direct_passthrough and \
+            not session.modified and 'Set-Cookie' not in response.headers
+
+    def _fresh(self, page):
+        return page.expires > monotonic() and all(self.versions.get(tag) == stamp for tag, stamp in page.stamps)
+
+    def _response(self, page):
+        response = current_app.response_class(page.data, status=page.status, mimetype=page.mimetype)
+        response.set_etag(page.etag)
+        response.last_modified = page.last_modified
+        return response.make_conditional(request)
+
+    def stats(self):
+        return self.cache.stats()
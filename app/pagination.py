@@ -0,0 +1,102 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from flask import abort, request, url_for
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(values, direction):
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    data = json.dumps([direction] + values, separators=(',', ':')).encode('utf-8')
+    return urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _decode_value(column, value):
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    # JSON true/false - тоже int в Python
+    if not isinstance(value, python_type) or isinstance(value, bool) and python_type is not bool:
+        raise TypeError(value)
+    return value
+
+
+def decode_cursor(cursor, columns):
+    try:
+        data = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(data, list):
+            raise TypeError(cursor)
+        direction, values = data[0], data[1:]
+        if direction not in ('next', 'prev') or len(values) != len(columns):
+            raise ValueError(cursor)
+        return direction, [_decode_value(column, value) for column, value in zip(columns, values)]
+    except (ValueError, TypeError, KeyError, IndexError, NotImplementedError):
+        abort(400)
+
+
+def _after(columns, values, descending):
+    # Лексикографическое сравнение (a, b) > (x, y) без row values,
+    # которые поддерживаются не всеми версиями SQLite
+    clauses = []
+    for i, column in enumerate(columns):
+        compare = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*[columns[j] == values[j] for j in range(i)], compare))
+    return or_(*clauses)
+
+
+class KeysetPagination:
+    def __init__(self, items, has_prev, has_next, key):
+        self.items = items
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.prev_cursor = encode_cursor(key(items[0]), 'prev') if has_prev and items else None
+        self.next_cursor = encode_cursor(key(items[-1]), 'next') if has_next and items else None
+
+    def prev_url(self, endpoint, **values):
+        if self.prev_cursor is None:
+            return None
+        return url_for(endpoint, cursor=self.prev_cursor, **values)
+
+    def next_url(self, endpoint, **values):
+        if self.next_cursor is None:
+            return None
+        return url_for(endpoint, cursor=self.next_cursor, **values)
+
+
+def paginate(query, columns, per_page, cursor=None, page=1, descending=True, key=None):
+    """Paginate query by the unique sort key columns, e.g. (timestamp, id).
+
+    Pages are addressed by opaque cursors, so every page is fetched with
+    an index range scan and no OFFSET or COUNT(*). page=N is still accepted
+    for old links; page=-1 is the last page.
+    """
+    if key is None:
+        key = lambda item: [getattr(item, column.key) for column in columns]
+
+    def ordered(reverse):
+        desc = descending != reverse
+        return query.order_by(None).order_by(*[column.desc() if desc else column.asc() for column in columns])
+
+    if cursor:
+        direction, values = decode_cursor(cursor, columns)
+        reverse = direction == 'prev'
+        items = ordered(reverse).filter(_after(columns, values, descending != reverse)).limit(per_page + 1).all()
+        more = len(items) > per_page
+        items = items[:per_page]
+        if reverse:
+            return KeysetPagination(items[::-1], more, True, key)
+        return KeysetPagination(items, True, more, key)
+    if page == -1:
+        items = ordered(True).limit(per_page + 1).all()
+        return KeysetPagination(items[:per_page][::-1], len(items) > per_page, False, key)
+    page = max(page, 1)
+    items = ordered(False).offset((page - 1) * per_page).limit(per_page + 1).all()
+    return KeysetPagination(items[:per_page], page > 1, len(items) > per_page, key)
+
+
+def paginate_request(query, columns, per_page, descending=True, key=None):
+    return paginate(query, columns, per_page,
+                    cursor=request.args.get('cursor'),
+                    page=request.args.get('page', 1, type=int),
+                    descending=descending, key=key)
@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import perf_counter
+
+from flask import g, has_request_context
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordHasher:
+    """Runs password hashing on a bounded thread pool and measures it.
+
+    PBKDF2 releases the GIL, so at most FLASKY_PASSWORD_HASH_WORKERS hashes
+    use the CPU at once, however many requests need one. The time spent
+    hashing is kept in stats() and reported per response in the
+    Server-Timing header.
+    """
+
+    def __init__(self, app=None):
+        self.workers = 0
+        self._executor = None
+        self._lock = Lock()
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            self.workers = app.config['FLASKY_PASSWORD_HASH_WORKERS']
+        app.after_request(self._server_timing)
+
+    def _submit(self, function, *args):
+        with self._lock:
+            if self._executor is None and self.workers > 0:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+            executor = self._executor
+        if executor is None:
+            return self._timed(function, *args)
+        return executor.submit(self._timed, function, *args).result()
+
+    def _timed(self, function, *args):
+        start = perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self._observe(perf_counter() - start)
+
+    def _observe(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def hash(self, password):
+        return self._measured(generate_password_hash, password)
+
+    def check(self, password_hash, password):
+        return self._measured(check_password_hash, password_hash, password)
+
+    def _measured(self, function, *args):
+        start = perf_counter()
+        try:
+            return self._submit(function, *args)
+        finally:
+            if has_request_context():
+                g.password_hash_seconds = g.get('password_hash_seconds', 0.0) + perf_counter() - start
+
+    def _server_timing(self, response):
+        seconds = g.get('password_hash_seconds')
+        if seconds is not None:
+            response.headers.add('Server-Timing', f'password-hash;dur={seconds * 1000:.1f}')
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {'count': self.count, 'seconds': self.seconds, 'max_seconds': self.max_seconds}
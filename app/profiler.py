@@ -0,0 +1,259 @@
+import atexit
+import glob
+import hashlib
+import json
+import os
+import queue
+import random
+import re
+from bisect import bisect_left
+from threading import Lock, Thread
+from time import monotonic
+
+from flask import request
+from flask_sqlalchemy import get_debug_queries
+from sqlalchemy.exc import SQLAlchemyError
+
+# верхние границы корзин гистограммы длительности, в секундах; гистограммы
+# разных процессов складываются, поэтому p95 считается и по сводному отчету
+BOUNDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+          0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+EXPLAIN = {'sqlite': 'EXPLAIN QUERY PLAN ', 'postgresql': 'EXPLAIN '}
+
+OTHER = '<other statements>'
+
+ORDERS = ('total', 'count', 'mean', 'max', 'p95')
+
+_NORMALIZE = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'%\(\w+\)s|%s|\$\d+|(?<![:\w]):\w+'), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\s+'), ' '),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?+)'),
+    (re.compile(r'(?:VALUES|values) \(.*?\)(?:\s*,\s*\(.*?\))+'), 'VALUES (...)+'),
+]
+
+
+def fingerprint(statement):
+    """Statement with literals, placeholders and IN lists normalized."""
+    for pattern, replacement in _NORMALIZE:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+def _percentile(buckets, fraction):
+    total = sum(buckets)
+    if not total:
+        return 0.0
+    rank = fraction * total
+    seen = 0
+    for bound, count in zip(BOUNDS, buckets):
+        seen += count
+        if seen >= rank:
+            return bound
+    return BOUNDS[-1]
+
+
+class SQLProfiler:
+    """Per-endpoint SQL statistics grouped by statement fingerprint.
+
+    After each request the queries recorded by Flask-SQLAlchemy are
+    reduced to fingerprints and added to count, total and maximum time
+    and a duration histogram per (endpoint, fingerprint), next to the
+    number of queries per request of every endpoint. The first execution
+    of a SELECT slower than FLASKY_PROFILER_SLOW_QUERY queues its EXPLAIN,
+    which a background thread runs outside the request, on a read replica
+    when there is one. With FLASKY_PROFILER_PATH set every process writes its
+    totals there every FLASKY_PROFILER_INTERVAL seconds, and report()
+    merges the files of all processes.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.path = None
+        self.interval = 60
+        self.slow = 0.05
+        self.max_fingerprints = 2000
+        self._lock = Lock()
+        self._explains = queue.Queue(maxsize=100)
+        self._explainer = None
+        self.reset()
+        atexit.register(self.save)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config['FLASKY_PROFILER']
+        self.path = app.config['FLASKY_PROFILER_PATH']
+        self.interval = app.config['FLASKY_PROFILER_INTERVAL']
+        self.slow = app.config['FLASKY_PROFILER_SLOW_QUERY']
+        self.max_fingerprints = app.config['FLASKY_PROFILER_MAX_FINGERPRINTS']
+        self.reset()
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def reset(self):
+        with self._lock:
+            self._statements = {}
+            self._endpoints = {}
+            self._plans = {}
+            self._saved = monotonic()
+
+    def _before_request(self):
+        # запросы копятся в контексте приложения, который может пережить запрос
+        request.environ['flasky.profiler_start'] = len(get_debug_queries())
+
+    def _after_request(self, response):
+        if self.enabled:
+            start = request.environ.get('flasky.profiler_start', 0)
+            self.record(request.endpoint or request.path, get_debug_queries()[start:])
+        return response
+
+    def record(self, endpoint, queries):
+        slow = []
+        with self._lock:
+            totals = self._endpoints.setdefault(endpoint, [0, 0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += len(queries)
+            totals[3] = max(totals[3], len(queries))
+            for query in queries:
+                duration = query.duration
+                totals[2] += duration
+                key = fingerprint(query.statement)
+                if (endpoint, key) not in self._statements and len(self._statements) >= self.max_fingerprints:
+                    key = OTHER
+                stats = self._statements.get((endpoint, key))
+                if stats is None:
+                    stats = self._statements[endpoint, key] = [0, 0.0, 0.0, [0] * len(BOUNDS)]
+                stats[0] += 1
+                stats[1] += duration
+                stats[2] = max(stats[2], duration)
+                stats[3][bisect_left(BOUNDS, duration)] += 1
+                if duration >= self.slow and key not in self._plans and key != OTHER and \
+                        key.lower().startswith('select'):
+                    self._plans[key] = None
+                    slow.append((key, query.statement, query.parameters))
+            due = self.path is not None and monotonic() - self._saved >= self.interval
+        for key, statement, parameters in slow:
+            try:
+                self._explains.put_nowait((key, statement, parameters))
+            except queue.Full:
+                # план снимется при следующем медленном выполнении
+                self._plans.pop(key, None)
+        if slow:
+            self._start_explainer()
+        if due:
+            self.save()
+
+    def _start_explainer(self):
+        with self._lock:
+            if self._explainer is None:
+                self._explainer = Thread(target=self._explain_queued, name='sql-explain', daemon=True)
+                self._explainer.start()
+
+    def _explain_queued(self):
+        while True:
+            key, statement, parameters = self._explains.get()
+            try:
+                self._plans[key] = self.explain(statement, parameters)
+            except Exception:
+                self.app.logger.exception('EXPLAIN failed')
+            finally:
+                self._explains.task_done()
+
+    def wait_for_plans(self):
+        """Block until every queued EXPLAIN has run."""
+        self._explains.join()
+
+    def explain(self, statement, parameters):
+        from . import db
+
+        replicas = self.app.config['FLASKY_READ_REPLICAS']
+        engine = db.get_engine(self.app, bind=random.choice(replicas) if replicas else None)
+        prefix = EXPLAIN.get(engine.dialect.name)
+        if prefix is None:
+            return None
+        try:
+            with engine.connect() as connection:
+                rows = connection.execute(prefix + statement, parameters).fetchall()
+        except SQLAlchemyError as e:
+            return f'EXPLAIN failed: {e.__class__.__name__}'
+        return '\n'.join(' '.join(str(value) for value in row) for row in rows)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'statements': [[endpoint, key, count, total, longest, list(buckets)]
+                               for (endpoint, key), (count, total, longest, buckets) in self._statements.items()],
+                'endpoints': [[endpoint] + list(totals) for endpoint, totals in self._endpoints.items()],
+                'plans': {key: plan for key, plan in self._plans.items() if plan is not None},
+            }
+
+    def _file(self, pid):
+        return os.path.join(self.path, f'sql-profile.{pid}.json')
+
+    def save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            self._saved = monotonic()
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self._file(f'{os.getpid()}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, self._file(os.getpid()))
+
+    def _snapshots(self):
+        yield self.snapshot()
+        if self.path is None:
+            return
+        for name in glob.glob(self._file('*')):
+            if name != self._file(os.getpid()) and not name.endswith('.tmp.json'):
+                try:
+                    with open(name) as f:
+                        yield json.load(f)
+                except (OSError, ValueError):
+                    continue
+
+    def report(self, endpoint=None, order_by='total', limit=None):
+        """Merged statistics of all processes, busiest first.
+
+        Returns (endpoints, statements): per endpoint the request and
+        query counts, and per (endpoint, fingerprint) count, total, mean,
+        max and p95 with the EXPLAIN plan when one was captured. order_by
+        is one of ORDERS.
+        """
+        if order_by not in ORDERS:
+            raise ValueError(f'order_by must be one of {", ".join(ORDERS)}')
+        statements, endpoints, plans = {}, {}, {}
+        for snapshot in self._snapshots():
+            for name, key, count, total, longest, buckets in snapshot['statements']:
+                stats = statements.setdefault((name, key), [0, 0.0, 0.0, [0] * len(BOUNDS)])
+                stats[0] += count
+                stats[1] += total
+                stats[2] = max(stats[2], longest)
+                stats[3] = [a + b for a, b in zip(stats[3], buckets)]
+            for name, requests, queries, seconds, most in snapshot['endpoints']:
+                totals = endpoints.setdefault(name, [0, 0, 0.0, 0])
+                totals[0] += requests
+                totals[1] += queries
+                totals[2] += seconds
+                totals[3] = max(totals[3], most)
+            plans.update(snapshot['plans'])
+        endpoint_rows = [{'endpoint': name, 'requests': requests, 'queries': queries,
+                          'queries_per_request': queries / requests if requests else 0.0,
+                          'max_queries': most, 'total': seconds}
+                         for name, (requests, queries, seconds, most) in endpoints.items()
+                         if endpoint is None or name == endpoint]
+        statement_rows = [{'endpoint': name, 'fingerprint': key,
+                           'id': hashlib.sha1(key.encode('utf-8')).hexdigest()[:12],
+                           'count': count, 'total': total, 'mean': total / count, 'max': longest,
+                           'p95': min(_percentile(buckets, 0.95), longest), 'plan': plans.get(key)}
+                          for (name, key), (count, total, longest, buckets) in statements.items()
+                          if endpoint is None or name == endpoint]
+        endpoint_rows.sort(key=lambda row: row['queries' if order_by == 'count' else 'total'], reverse=True)
+        statement_rows.sort(key=lambda row: row[order_by], reverse=True)
+        return endpoint_rows, statement_rows[:limit]
@@ -0,0 +1,112 @@
+import random
+from contextlib import contextmanager
+
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, _EngineConnector, get_state
+from sqlalchemy import event, orm
+from sqlalchemy.sql.expression import Select, CompoundSelect
+
+SAFE_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+
+
+class _PooledConnector(_EngineConnector):
+    def get_options(self, sa_url, echo):
+        options = super().get_options(sa_url, echo)
+        # у SQLite свои пулы (NullPool, SingletonThreadPool), размеры к ним не применимы
+        if not sa_url.drivername.startswith('sqlite'):
+            config = self._app.config
+            pools = config['FLASKY_POOL_OPTIONS']
+            if self._bind in pools:
+                options.update(pools[self._bind])
+            elif self._bind in config['FLASKY_READ_REPLICAS']:
+                options.update(config['FLASKY_REPLICA_POOL_OPTIONS'])
+            else:
+                options.update(pools.get(None, {}))
+        return options
+
+
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None):
+        # только чистые SELECT; flush, text() и SELECT ... FOR UPDATE идут в основную базу
+        if isinstance(clause, (Select, CompoundSelect)) and clause._for_update_arg is None:
+            bind = replica_bind()
+            if bind is not None:
+                return get_state(self.app).db.get_engine(self.app, bind=bind)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy with per-bind pool options and read replica routing.
+
+    Replicas are ordinary SQLALCHEMY_BINDS listed in FLASKY_READ_REPLICAS.
+    A read-only request is pinned to one of them in before_request, and
+    its SELECT statements run there until the session first flushes.
+    Everything else, including all writes, uses the primary database.
+    Reads that fill version-stamped caches go through primary().
+    """
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def make_connector(self, app=None, bind=None):
+        return _PooledConnector(self, self.get_app(app), bind)
+
+    def init_app(self, app):
+        super().init_app(app)
+        app.before_request(route_request)
+        app.after_request(remember_writes)
+
+
+def replica_bind():
+    if not has_request_context():
+        return None
+    return request.environ.get('flasky.replica')
+
+
+@contextmanager
+def primary():
+    """Run the enclosed reads of a replica request on the primary database."""
+    replica = request.environ.pop('flasky.replica', None) if has_request_context() else None
+    try:
+        yield
+    finally:
+        # после flush запрос остается на основной базе, см. leave_replica
+        if replica is not None and not request.environ.get('flasky.wrote'):
+            request.environ['flasky.replica'] = replica
+
+
+def route_request():
+    config = current_app.config
+    replicas = config['FLASKY_READ_REPLICAS']
+    if not replicas or request.method not in SAFE_METHODS:
+        return
+    # клиент недавно писал: читаем свои же записи из основной базы,
+    # пока реплика могла их еще не получить
+    if request.cookies.get(config['FLASKY_REPLICA_COOKIE']):
+        return
+    view = current_app.view_functions.get(request.endpoint)
+    if getattr(view, 'primary_required', False):
+        return
+    request.environ['flasky.replica'] = random.choice(replicas)
+
+
+def remember_writes(response):
+    config = current_app.config
+    if not config['FLASKY_READ_REPLICAS']:
+        return response
+    session = get_state(current_app).db.session
+    # изменения, которые еще не сброшены, запишутся при закрытии сессии
+    if request.method not in SAFE_METHODS or request.environ.get('flasky.wrote') or \
+            session.new or session.dirty or session.deleted:
+        response.set_cookie(config['FLASKY_REPLICA_COOKIE'], '1', max_age=config['FLASKY_REPLICA_STICKINESS'],
+                            httponly=True)
+    return response
+
+
+def leave_replica(session, flush_context):
+    if has_request_context():
+        request.environ['flasky.wrote'] = True
+        request.environ.pop('flasky.replica', None)
+
+
+event.listen(RoutingSession, 'after_flush', leave_replica)
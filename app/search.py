@@ -0,0 +1,128 @@
+import re
+
+from flask import abort, request
+from sqlalchemy import Column, Integer, text
+
+from .pagination import KeysetPagination, encode_cursor, decode_cursor
+
+KINDS = {'posts': 0, 'comments': 1}
+
+_WORD = re.compile(r'\w+')
+
+# курсор поиска хранит смещение: ранжированная выдача не имеет ключа для keyset
+_OFFSET = Column('offset', Integer)
+
+SQLITE = {
+    'create': ["CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+               "body, tokenize = 'unicode61 remove_diacritics 2')"],
+    'drop': ["DROP TABLE IF EXISTS search_index"],
+    'delete': "DELETE FROM search_index WHERE rowid = :rowid",
+    'insert': "INSERT INTO search_index (rowid, body) VALUES (:rowid, :body)",
+    # bm25 отрицательный: чем меньше, тем лучше совпадение
+    'search': "SELECT rowid, bm25(search_index) AS score FROM search_index "
+              "WHERE search_index MATCH :query AND rowid % 2 = :kind "
+              "ORDER BY score, rowid LIMIT :limit OFFSET :offset",
+}
+
+POSTGRESQL = {
+    'create': ["CREATE TABLE IF NOT EXISTS search_index (id BIGINT PRIMARY KEY, document TSVECTOR NOT NULL)",
+               "CREATE INDEX IF NOT EXISTS ix_search_index_document ON search_index USING GIN (document)"],
+    'drop': ["DROP TABLE IF EXISTS search_index"],
+    'delete': "DELETE FROM search_index WHERE id = :rowid",
+    'insert': "INSERT INTO search_index (id, document) "
+              "VALUES (:rowid, to_tsvector(CAST(:language AS regconfig), :body)) "
+              "ON CONFLICT (id) DO UPDATE SET document = EXCLUDED.document",
+    'search': "SELECT id, ts_rank(document, query) AS score "
+              "FROM search_index, plainto_tsquery(CAST(:language AS regconfig), :query) AS query "
+              "WHERE document @@ query AND id % 2 = :kind "
+              "ORDER BY score DESC, id LIMIT :limit OFFSET :offset",
+}
+
+DIALECTS = {'sqlite': SQLITE, 'postgresql': POSTGRESQL}
+
+
+def rowid(kind, id):
+    # посты и комментарии делят одну таблицу индекса
+    return id * 2 + KINDS[kind]
+
+
+class SearchPagination(KeysetPagination):
+    def __init__(self, items, offset, per_page, has_next):
+        self.items = items
+        self.has_prev = offset > 0
+        self.has_next = has_next
+        self.prev_cursor = encode_cursor([max(offset - per_page, 0)], 'prev') if self.has_prev else None
+        self.next_cursor = encode_cursor([offset + per_page], 'next') if has_next else None
+
+
+class SearchIndex:
+    """Full-text index over the bodies of posts and comments.
+
+    SQLite gets an FTS5 virtual table ranked by bm25, PostgreSQL a
+    tsvector table with a GIN index ranked by ts_rank. Rows are written
+    in the same transaction as the posts and comments themselves by the
+    after_flush listener in models.py; other databases are not indexed
+    and return no results.
+    """
+
+    def __init__(self, app=None):
+        self.language = 'simple'
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.language = app.config['FLASKY_SEARCH_LANGUAGE']
+
+    @staticmethod
+    def statements(bind):
+        return DIALECTS.get(bind.dialect.name)
+
+    def create(self, target, connection, **kw):
+        for statement in (self.statements(connection) or {}).get('create', ()):
+            connection.execute(text(statement))
+
+    def drop(self, target, connection, **kw):
+        for statement in (self.statements(connection) or {}).get('drop', ()):
+            connection.execute(text(statement))
+
+    def update(self, connection, kind, rows):
+        """Index (id, body) pairs of one kind, replacing earlier versions."""
+        statements = self.statements(connection)
+        if statements is None or not rows:
+            return
+        rows = [{'rowid': rowid(kind, id), 'body': body or '', 'language': self.language} for id, body in rows]
+        connection.execute(text(statements['delete']), rows)
+        connection.execute(text(statements['insert']), rows)
+
+    def remove(self, connection, kind, ids):
+        statements = self.statements(connection)
+        if statements is None or not ids:
+            return
+        connection.execute(text(statements['delete']), [{'rowid': rowid(kind, id)} for id in ids])
+
+    def search(self, connection, query, kind, offset=0, limit=10):
+        """Ids of the best matches of kind, best first."""
+        statements = self.statements(connection)
+        words = _WORD.findall(query or '')
+        if statements is None or not words:
+            return []
+        if statements is SQLITE:
+            # пользовательский ввод не должен разбираться как синтаксис FTS5
+            query = ' '.join(f'"{word}"' for word in words)
+        rows = connection.execute(text(statements['search']),
+                                  {'query': query, 'kind': KINDS[kind], 'limit': limit, 'offset': offset,
+                                   'language': self.language})
+        return [id // 2 for id, score in rows]
+
+    def paginate(self, session, query, kind, loader, per_page):
+        """Ranked page of objects for ?cursor=, loaded with loader (a query of kind)."""
+        cursor = request.args.get('cursor')
+        offset = decode_cursor(cursor, [_OFFSET])[1][0] if cursor else 0
+        if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+            abort(400)
+        ids = self.search(session.connection(), query, kind, offset, per_page + 1)
+        has_next = len(ids) > per_page
+        ids = ids[:per_page]
+        entity = loader.column_descriptions[0]['entity']
+        found = {obj.id: obj for obj in loader.filter(entity.id.in_(ids))} if ids else {}
+        return SearchPagination([found[id] for id in ids if id in found], offset, per_page, has_next)
@@ -0,0 +1,183 @@
+import hashlib
+from bisect import bisect
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import accumulate
+from multiprocessing import Pool
+from random import Random
+
+from forgery_py.dictionaries_loader import get_dictionary
+from werkzeug.security import generate_password_hash
+
+from . import db, search_index
+from .markup import render_markdown
+from .models import User, Role, Post, Comment, Follow, rebuild_timelines
+
+EPOCH = datetime(2020, 1, 1)
+SPAN = 2 * 365 * 24 * 60 * 60
+
+
+def _words(name):
+    return [line.strip() for line in get_dictionary(name)]
+
+
+class _Chooser:
+    # Выбор id пользователя: равномерно или по закону Ципфа, чтобы у
+    # небольшого числа пользователей было большинство подписчиков
+    def __init__(self, rng, ids, distribution, alpha):
+        self.rng = rng
+        self.ids = ids
+        self.cumulative = None
+        if distribution == 'zipf':
+            self.cumulative = list(accumulate(1.0 / (rank ** alpha) for rank in range(1, len(ids) + 1)))
+        elif distribution != 'uniform':
+            raise ValueError(f'unknown distribution {distribution!r}')
+
+    def __call__(self):
+        if self.cumulative is None:
+            return self.ids[self.rng.randrange(len(self.ids))]
+        point = self.rng.random() * self.cumulative[-1]
+        return self.ids[min(bisect(self.cumulative, point), len(self.ids) - 1)]
+
+
+def _next_id(model):
+    return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+
+def _render(bodies, pool):
+    # синтетические тексты часто повторяются, каждый уникальный рендерится один раз
+    unique = list(dict.fromkeys(bodies))
+    if pool is None:
+        html = [render_markdown(body) for body in unique]
+    else:
+        html = pool.map(render_markdown, unique, chunksize=64)
+    rendered = dict(zip(unique, html))
+    return [rendered[body] for body in bodies]
+
+
+def _insert(table, rows):
+    if rows:
+        db.session.execute(table.insert(), rows)
+        db.session.commit()
+
+
+def _index(kind, rows):
+    search_index.update(db.session.connection(), kind, [(row['id'], row['body']) for row in rows])
+    db.session.commit()
+
+
+def _store_counters(table, counters):
+    # сгенерированные строки ссылаются только на сгенерированных авторов и
+    # посты, поэтому счетчики известны заранее и пишутся одним executemany
+    columns = list(counters)
+    ids = set().union(*counters.values())
+    rows = [dict({'_id': id}, **{column: counters[column][id] for column in columns}) for id in ids]
+    if rows:
+        db.session.execute(table.update()
+                           .where(table.c.id == db.bindparam('_id'))
+                           .values({column: db.bindparam(column) for column in columns}), rows)
+        db.session.commit()
+
+
+def _reset_sequences():
+    if db.engine.dialect.name == 'postgresql':
+        for table in ('users', 'posts', 'comments'):
+            db.session.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                               f"COALESCE((SELECT MAX(id) FROM {table}), 1))")
+        db.session.commit()
+
+
+def seed_database(users=100, posts=1000, comments=1000, follows=1000, distribution='zipf',
+                  alpha=1.1, seed=0, batch_size=5000, workers=None, password='cat'):
+    """Insert a deterministic synthetic dataset in batches.
+
+    The same seed always produces the same rows. Rows are written with
+    executemany, bypassing the ORM events, so the stored counters, the
+    search index and the timelines of the new users are filled in
+    separately.
+    """
+    if users < 1:
+        raise ValueError('at least one user is required')
+    rng = Random(seed)
+    first_names = _words('male_first_names') + _words('female_first_names')
+    last_names = _words('last_names')
+    cities = _words('cities')
+    sentences = _words('lorem_ipsum')
+
+    def moment():
+        return EPOCH + timedelta(seconds=rng.randrange(SPAN))
+
+    def text(count):
+        return ' '.join(rng.choice(sentences) for _ in range(count))
+
+    Role.insert_roles()
+    role_id = Role.query.filter_by(default=True).first().id
+    password_hash = generate_password_hash(password)
+
+    first_user = _next_id(User)
+    user_ids = list(range(first_user, first_user + users))
+    rows = []
+    for id in user_ids:
+        first, last = rng.choice(first_names), rng.choice(last_names)
+        email = f'{first.lower()}.{last.lower()}{id}@example.com'
+        since = moment()
+        rows.append({'id': id, 'email': email, 'username': f'{first.lower()}{id}',
+                     'password_hash': password_hash, 'confirmed': True, 'role_id': role_id,
+                     'name': f'{first} {last}', 'location': rng.choice(cities), 'about_me': text(1),
+                     'member_since': since, 'last_seen': since,
+                     'avatar_hash': hashlib.md5(email.encode('utf-8')).hexdigest(),
+                     'post_count': 0, 'follower_count': 0, 'followed_count': 0})
+        if len(rows) >= batch_size:
+            _insert(User.__table__, rows)
+            rows = []
+    _insert(User.__table__, rows)
+
+    # каждый пользователь читает самого себя
+    edges = set((id, id) for id in user_ids)
+    popular = _Chooser(rng, user_ids, distribution, alpha)
+    target = min(follows, users * (users - 1))
+    wanted = len(edges) + target
+    while len(edges) < wanted:
+        edges.add((user_ids[rng.randrange(users)], popular()))
+    rows = [{'follower_id': follower, 'followed_id': followed, 'timestamp': moment()}
+            for follower, followed in sorted(edges)]
+    for start in range(0, len(rows), batch_size):
+        _insert(Follow.__table__, rows[start:start + batch_size])
+    user_counters = {'follower_count': Counter(followed for _, followed in edges),
+                     'followed_count': Counter(follower for follower, _ in edges),
+                     'post_count': Counter()}
+    comment_count = Counter()
+
+    pool = Pool(workers) if workers != 1 else None
+    try:
+        first_post = _next_id(Post)
+        for start in range(0, posts, batch_size):
+            ids = range(first_post + start, first_post + min(start + batch_size, posts))
+            rows = [{'id': id, 'author_id': user_ids[rng.randrange(users)], 'timestamp': moment(),
+                     'body': text(rng.randint(1, 3)), 'comment_count': 0} for id in ids]
+            user_counters['post_count'].update(row['author_id'] for row in rows)
+            for row, html in zip(rows, _render([row['body'] for row in rows], pool)):
+                row['body_html'] = html
+            _insert(Post.__table__, rows)
+            _index('posts', rows)
+
+        post_ids = range(first_post, first_post + posts)
+        first_comment = _next_id(Comment)
+        for start in range(0, comments if posts else 0, batch_size):
+            ids = range(first_comment + start, first_comment + min(start + batch_size, comments))
+            rows = [{'id': id, 'post_id': rng.choice(post_ids), 'author_id': user_ids[rng.randrange(users)],
+                     'timestamp': moment(), 'body': text(1), 'disabled': False} for id in ids]
+            comment_count.update(row['post_id'] for row in rows)
+            for row, html in zip(rows, _render([row['body'] for row in rows], pool)):
+                row['body_html'] = html
+            _insert(Comment.__table__, rows)
+            _index('comments', rows)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    _reset_sequences()
+    _store_counters(User.__table__, user_counters)
+    _store_counters(Post.__table__, {'comment_count': comment_count})
+    rebuild_timelines(user_ids)
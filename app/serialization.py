@@ -0,0 +1,117 @@
+import json as _json
+import re
+from datetime import timezone
+
+from flask import current_app, url_for, _request_ctx_stack
+from flask import json as flask_json
+
+from .cache import LRUCache
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson не установлен
+    orjson = None
+
+# Число, которое подставляется вместо id при построении шаблона URL
+PLACEHOLDER = 2147480647
+
+_DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+_templates = LRUCache(64)
+
+# все, что stdlib с ensure_ascii пишет как \uXXXX, а orjson оставляет как есть
+_UNESCAPED = re.compile(rb'[\x7f-\xff]+')
+
+
+def http_date(value):
+    """Format a datetime exactly as Flask's JSONEncoder does, without a time tuple."""
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return f'{_DAYS[value.weekday()]}, {value.day:02d} {_MONTHS[value.month - 1]} {value.year:04d} ' \
+           f'{value.hour:02d}:{value.minute:02d}:{value.second:02d} GMT'
+
+
+class URLTemplates(dict):
+    """URLs of id endpoints under one url root, built by url_for once.
+
+    Each endpoint is built once with a placeholder id and split around
+    it, so later URLs are plain string concatenation. The root already
+    contains the scheme, host and script name, so the templates can be
+    shared by all requests with the same root.
+    """
+
+    def __missing__(self, key):
+        endpoint, external = key
+        placeholder = str(PLACEHOLDER)
+        prefix, found, suffix = url_for(endpoint, id=PLACEHOLDER, _external=external).partition(placeholder)
+        if not found or placeholder in suffix:
+            raise ValueError(f'cannot build a URL template for {endpoint}')
+        self[key] = prefix, suffix
+        return prefix, suffix
+
+    def build(self, endpoint, id, external=False):
+        prefix, suffix = self[endpoint, external]
+        return f'{prefix}{id}{suffix}'
+
+
+def url_templates():
+    ctx = _request_ctx_stack.top
+    root = ctx.request.url_root if ctx is not None else None
+    templates = _templates.get(root)
+    if templates is None:
+        templates = URLTemplates()
+        _templates.set(root, templates)
+    return templates
+
+
+def _compact(app):
+    # быстрый путь дает те же байты, что jsonify, только при настройках по умолчанию
+    return app.config['JSON_SORT_KEYS'] and app.config['JSON_AS_ASCII'] and \
+        app.json_encoder is flask_json.JSONEncoder
+
+
+def _escape(match):
+    chunks = []
+    for char in match.group().decode('utf-8'):
+        code = ord(char)
+        if code > 0xffff:
+            code -= 0x10000
+            chunks.append(f'\\u{0xd800 | code >> 10:04x}\\u{0xdc00 | code & 0x3ff:04x}')
+        else:
+            chunks.append(f'\\u{code:04x}')
+    return ''.join(chunks).encode('ascii')
+
+
+def _dumps(obj):
+    if orjson is not None:
+        try:
+            data = orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            # например, одиночные суррогаты или целые больше 64 бит
+            pass
+        else:
+            return data if data.isascii() and b'\x7f' not in data else _UNESCAPED.sub(_escape, data)
+    return _json.dumps(obj, sort_keys=True, separators=(',', ':')).encode('ascii')
+
+
+def dumps(obj):
+    """Serialize to the bytes of a compact jsonify body, without the newline.
+
+    The values must already be JSON types; to_json formats datetimes
+    itself. orjson is used when installed, with non-ASCII characters
+    escaped afterwards the way the standard library encoder does.
+    """
+    if not _compact(current_app):
+        return flask_json.dumps(obj, separators=(',', ':')).encode('utf-8')
+    return _dumps(obj)
+
+
+def jsonify(obj):
+    """flask.jsonify for a single object, byte for byte, through dumps."""
+    app = current_app
+    if app.config['JSONIFY_PRETTYPRINT_REGULAR'] or app.debug or not _compact(app):
+        return flask_json.jsonify(obj)
+    return app.response_class(_dumps(obj) + b'\n', mimetype=app.config['JSONIFY_MIMETYPE'])
@@ -0,0 +1,196 @@
+"""Microbenchmarks of the pure-Python hot paths of app/models.py.
+
+    python benchmarks/models.py [--save] [--baseline PATH] [--threshold 0.1] [-k NAME]
+
+Every benchmark runs on fixed inputs in an in-memory database. The loop
+count is calibrated so one sample takes at least --min-time seconds, and
+--repeat samples are taken with the garbage collector off. Results are
+compared with the baseline file (benchmarks/models-baseline.json unless
+--baseline is given) when it exists. A benchmark counts as a regression
+when its median is slower than the baseline by more than --threshold and
+a one-sided Mann-Whitney U test on the samples gives p < --alpha. Then
+the script exits with status 1. --save writes the current samples as
+the new baseline; baselines are only comparable on the same machine.
+
+A baseline is therefore not committed. To check a change, save one from
+the commit it is based on and compare on the same machine:
+
+    git stash && python benchmarks/models.py --save && git stash pop
+    python benchmarks/models.py
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import timeit
+from itertools import cycle
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import check_password_hash, generate_password_hash  # noqa: E402
+
+from app import create_app, db, token_cache, identity_cache, password_hasher  # noqa: E402
+from app.markup import render_markdown  # noqa: E402
+from app.models import User, Post, Comment, Role  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models-baseline.json')
+
+BODIES = [
+    'Short post.',
+    'A *post* with **emphasis**, a [link](https://example.com) and `code`.',
+    '# Heading\n\n' + '\n'.join(f'- item {i} with http://example.com/{i}' for i in range(10)),
+    'Unicode: привет, мир ☃ — "quoted" & <script>alert(1)</script>',
+]
+
+
+def benchmarks():
+    """Name -> function of no arguments; run inside a request context."""
+    user = User.query.filter_by(email='bench@example.com').first()
+    post = Post.query.first()
+    comment = Comment.query.first()
+    token = user.generate_auth_token(3600)
+    password_hash = generate_password_hash('cat')
+    bodies = cycle(BODIES)
+
+    def post_body():
+        # тексты чередуются: каждое присваивание меняет значение и идет в кэш рендера
+        post.body = next(bodies)
+
+    def verify_token_uncached():
+        token_cache.cache.clear()
+        identity_cache.cache.clear()
+        User.verify_auth_token(token)
+
+    def user_init():
+        # follow(self) сбрасывает нового пользователя в базу; точка сохранения откатывает вставку
+        savepoint = db.session.begin_nested()
+        User(email='new@example.com', username='new')
+        savepoint.rollback()
+
+    return {
+        'post.on_changed_body': post_body,
+        'render_markdown': lambda: render_markdown(BODIES[2]),
+        'post.to_json': post.to_json,
+        'user.to_json': user.to_json,
+        'comment.to_json': comment.to_json,
+        'user.gravatar': user.gravatar,
+        'user.generate_auth_token': lambda: user.generate_auth_token(3600),
+        'user.verify_auth_token': lambda: User.verify_auth_token(token),
+        'user.verify_auth_token (uncached)': verify_token_uncached,
+        'check_password_hash': lambda: check_password_hash(password_hash, 'cat'),
+        'password_hasher.check': lambda: password_hasher.check(password_hash, 'cat'),
+        'user.__init__': user_init,
+    }
+
+
+def measure(function, repeat, min_time):
+    timer = timeit.Timer(function)
+    loops = 1
+    while timer.timeit(loops) < min_time:
+        loops *= 2
+    return loops, [seconds / loops for seconds in timer.repeat(repeat, loops)]
+
+
+def summary(samples):
+    q1, median, q3 = statistics.quantiles(samples, n=4) if len(samples) > 1 else samples * 3
+    return {'median': median, 'q1': q1, 'q3': q3, 'min': min(samples),
+            'stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0}
+
+
+def slower_p_value(current, baseline):
+    """One-sided Mann-Whitney U p-value that current is slower than baseline."""
+    ranked = sorted([(value, 0) for value in current] + [(value, 1) for value in baseline])
+    ranks = [0.0] * len(ranked)
+    i = 0
+    while i < len(ranked):
+        j = i
+        while j + 1 < len(ranked) and ranked[j + 1][0] == ranked[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        i = j + 1
+    n1, n2 = len(current), len(baseline)
+    u = sum(rank for rank, (_, group) in zip(ranks, ranked) if group == 0) - n1 * (n1 + 1) / 2
+    sigma = math.sqrt(n1 * n2 * (n1 + n2 + 1) / 12)
+    if not sigma:
+        return 1.0
+    z = (u - n1 * n2 / 2 - 0.5) / sigma
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def compare(results, baseline, threshold, alpha):
+    rows = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            rows.append((name, result, None, None, False))
+            continue
+        ratio = result['median'] / statistics.median(previous['samples']) - 1
+        p = slower_p_value(result['samples'], previous['samples'])
+        rows.append((name, result, ratio, p, ratio > threshold and p < alpha))
+    return rows
+
+
+def setup():
+    db.create_all()
+    Role.insert_roles()
+    user = User(email='bench@example.com', username='bench', password='cat', confirmed=True)
+    post = Post(body=BODIES[1], author=user)
+    db.session.add_all([user, post, Comment(body=BODIES[0], post=post, author=user)])
+    db.session.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=15, help='samples per benchmark')
+    parser.add_argument('--min-time', type=float, default=0.05, help='minimum seconds per sample')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file')
+    parser.add_argument('--save', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed slowdown of the median')
+    parser.add_argument('--alpha', type=float, default=0.01, help='significance level of the slowdown')
+    parser.add_argument('-k', dest='only', default=None, help='only benchmarks containing this text')
+    args = parser.parse_args(argv)
+
+    app = create_app('testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['benchmarks']
+
+    results = {}
+    with app.app_context():
+        setup()
+        with app.test_request_context(base_url='https://localhost'):
+            for name, function in benchmarks().items():
+                if args.only and args.only not in name:
+                    continue
+                function()
+                loops, samples = measure(function, args.repeat, args.min_time)
+                results[name] = dict(summary(samples), loops=loops, samples=samples)
+        db.session.remove()
+        db.drop_all()
+
+    regressions = 0
+    print(f'{"benchmark":<36} {"median us":>11} {"iqr us":>9} {"loops":>7} {"change":>8} {"p":>7}')
+    for name, result, ratio, p, regressed in compare(results, baseline, args.threshold, args.alpha):
+        line = f'{name:<36} {result["median"] * 1e6:>11.2f} {(result["q3"] - result["q1"]) * 1e6:>9.2f} ' \
+               f'{result["loops"]:>7}'
+        if ratio is not None:
+            line += f' {ratio * 100:>+7.1f}% {p:>7.4f}' + ('  REGRESSION' if regressed else '')
+        regressions += regressed
+        print(line)
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'benchmarks': results}, f, indent=2, sort_keys=True)
+        print(f'Baseline written to {args.baseline}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""Compare the API serialization path with the url_for + jsonify one.
+
+    python benchmarks/serialization.py [rows] [repeat]
+
+Both paths serialize the same posts, users and comments of a seeded
+in-memory database inside one request context. The script exits with an
+error if the two response bodies differ by a single byte.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import url_for, jsonify as flask_jsonify  # noqa: E402
+
+from app import create_app, db, serialization  # noqa: E402
+from app.models import User, Post, Comment  # noqa: E402
+from app.seed import seed_database  # noqa: E402
+
+
+# to_json до появления app.serialization
+def reference_user(user):
+    return {
+        'url': url_for('api.get_post', id=user.id, _external=True),
+        'username': user.username,
+        'member_since': user.member_since,
+        'last_seen': user.last_seen,
+        'posts': url_for('api.get_user_posts', id=user.id, _external=True),
+        'followed_posts': url_for('api.get_user_followed_posts', id=user.id, _external=True),
+        'post_count': user.post_count
+    }
+
+
+def reference_post(post):
+    return {
+        'url': url_for('api.get_post', id=post.id, _external=True),
+        'body': post.body,
+        'body_html': post.body_html,
+        'timestamp': post.timestamp,
+        'author': url_for('api.get_user', id=post.author_id, _external=True),
+        'comments': url_for('api.get_post_comments', id=post.id, _external=True),
+        'comment_count': post.comment_count
+    }
+
+
+def reference_comment(comment):
+    return {
+        'url': url_for('api.get_comment', id=comment.id, _external=True),
+        'post_url': url_for('api.get_post', id=comment.post_id),
+        'body': comment.body,
+        'body_html': comment.body_html,
+        'timestamp': comment.timestamp,
+        'author_url': url_for('api.get_user', id=comment.author_id)
+    }
+
+
+def main(rows=1000, repeat=5):
+    app = create_app('testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    with app.app_context():
+        db.create_all()
+        seed_database(users=max(rows // 10, 1), posts=rows, comments=rows, follows=0, workers=1)
+        author = User.query.first()
+        # не-ASCII и управляющие символы идут через резервный кодировщик
+        db.session.add(Post(body='Привет, мир ☃ "quoted" \x7f\t', author=author))
+        db.session.commit()
+        kinds = [('posts', Post.query.all(), reference_post),
+                 ('users', User.query.all(), reference_user),
+                 ('comments', Comment.query.all(), reference_comment)]
+
+        print(f'encoder: {"orjson" if serialization.orjson is not None else "json"}')
+        failed = False
+        with app.test_request_context(base_url='https://localhost'):
+            for name, objects, reference in kinds:
+                def old():
+                    return flask_jsonify({name: [reference(obj) for obj in objects]}).get_data()
+
+                def new():
+                    return serialization.jsonify({name: [obj.to_json() for obj in objects]}).get_data()
+
+                identical = old() == new()
+                failed = failed or not identical
+                old_time = min(timeit.repeat(old, number=1, repeat=repeat))
+                new_time = min(timeit.repeat(new, number=1, repeat=repeat))
+                print(f'{name:<9} {len(objects):>6} rows  url_for+jsonify {old_time * 1e6 / len(objects):7.1f} us/row  '
+                      f'serialization {new_time * 1e6 / len(objects):7.1f} us/row  '
+                      f'x{old_time / new_time:.1f}  {"identical" if identical else "DIFFERENT"}')
+        db.drop_all()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:3])))
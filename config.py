@@ -3,11 +3,28 @@ from os import path, environ
 base_dir = path.abspath(path.dirname(__file__))
 
 
+def replica_binds():
+    # DATABASE_REPLICA_URLS="postgresql://replica1/flasky,postgresql://replica2/flasky"
+    uris = [uri.strip() for uri in environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri.strip()]
+    return {f'replica{i}': uri for i, uri in enumerate(uris, 1)}
+
+
 class Config:
     SECRET_KEY = environ.get('SECRET_KEY') or "hard to gues string"
     SQLALCHEMY_TRACK_MODIFICATIONS = True
     SQLALCHEMY_COMMIT_ON_TEARDOWN = True
     SQLALCHEMY_RECORD_QUERIES = True
+    SQLALCHEMY_BINDS = replica_binds()
+    FLASKY_READ_REPLICAS = sorted(SQLALCHEMY_BINDS)
+    FLASKY_REPLICA_STICKINESS = 10
+    FLASKY_REPLICA_COOKIE = 'flasky_primary'
+    # параметры пула по имени bind, None - основная база; к SQLite не применяются
+    FLASKY_POOL_OPTIONS = {
+        None: {'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 10, 'pool_recycle': 1800, 'pool_pre_ping': True},
+    }
+    # для реплик без своей записи в FLASKY_POOL_OPTIONS
+    FLASKY_REPLICA_POOL_OPTIONS = {'pool_size': 20, 'max_overflow': 20, 'pool_timeout': 10, 'pool_recycle': 1800,
+                                   'pool_pre_ping': True}
 
     MAIL_SERVER = 'smtp.gmail.com'
     MAIL_PORT = 587
@@ -16,12 +33,50 @@ class Config:
     MAIL_PASSWORD = environ.get('MAIL_PASSWORD')
     FLASKY_MAIL_SUBJECT_PREFIX = '[Flasky]'
     FLASKY_MAIL_SENDER = 'Flasky admin <flasky@example.com>'
+    FLASKY_MAIL_WORKERS = 2
+    FLASKY_MAIL_BATCH_SIZE = 50
+    FLASKY_MAIL_MAX_ATTEMPTS = 8
+    FLASKY_MAIL_RETRY_DELAY = 30
+    FLASKY_MAIL_POLL_INTERVAL = 30
     FLASKY_ADMIN = environ.get('FLASKY_ADMIN')
     SSL_DISABLE = True
     FLASKY_POSTS_PER_PAGE = 10
     FLASKY_FOLLOWERS_PER_PAGE = 10
     FLASKY_COMMENTS_PER_PAGE = 10
+    FLASKY_STREAM_BATCH_SIZE = 500
+    FLASKY_MULTI_GET_LIMIT = 100
+    FLASKY_SEARCH_LANGUAGE = environ.get('FLASKY_SEARCH_LANGUAGE') or 'simple'
+    FLASKY_TIMELINE_LENGTH = 1000
+    FLASKY_RENDER_CACHE_SIZE = 1024
+    FLASKY_FRAGMENT_CACHE_SIZE = 4096
+    FLASKY_PAGE_CACHE_TTL = 60
+    FLASKY_PAGE_CACHE_SIZE = 1024
+    FLASKY_FOLLOW_GRAPH_PATH = environ.get('FLASKY_FOLLOW_GRAPH_PATH')
+    FLASKY_VERSION_SLOTS = 65536
+    FLASKY_VERSION_PATH = environ.get('FLASKY_VERSION_PATH')
+    FLASKY_IDENTITY_CACHE_TTL = 60
+    FLASKY_IDENTITY_CACHE_SIZE = 4096
+    FLASKY_TOKEN_CACHE_TTL = 300
+    FLASKY_TOKEN_CACHE_SIZE = 4096
+    FLASKY_CREDENTIAL_CACHE_TTL = 60
+    FLASKY_CREDENTIAL_CACHE_SIZE = 1024
+    FLASKY_PASSWORD_HASH_WORKERS = 2
+    FLASKY_LAST_SEEN_INTERVAL = 60
+    FLASKY_LAST_SEEN_BATCH = 500
+    FLASKY_LAST_SEEN_RESOLUTION = 60
     FLASKY_DB_QUERY_TOMEOUT = 0.5
+    # EXPLAIN медленных запросов нагружает базу; в production профилировщик включается явно
+    FLASKY_PROFILER = bool(environ.get('FLASKY_PROFILER'))
+    FLASKY_PROFILER_PATH = environ.get('FLASKY_PROFILER_PATH')
+    FLASKY_PROFILER_INTERVAL = 60
+    FLASKY_PROFILER_SLOW_QUERY = 0.05
+    FLASKY_PROFILER_MAX_FINGERPRINTS = 2000
+    # каталог, общий для всех воркеров gunicorn; без него /metrics видит один процесс
+    FLASKY_METRICS_PATH = environ.get('FLASKY_METRICS_PATH')
+    FLASKY_METRICS_INTERVAL = 5
+    FLASKY_METRICS_TOKEN = environ.get('FLASKY_METRICS_TOKEN')
+    # без токена /metrics доступен только там, где это разрешено явно
+    FLASKY_METRICS_PUBLIC = False
 
     @staticmethod
     def init_app(app):
@@ -31,14 +86,29 @@ class Config:
 class DevelopmentConfig(Config):
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path.join(base_dir, 'data_dev.sqlite')
+    FLASKY_PROFILER = True
+    FLASKY_METRICS_PUBLIC = True
 
 
 class TestingConfig(Config):
     TESTING = True
+    FLASKY_MAIL_WORKERS = 0
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path.join(base_dir, 'data_test.sqlite')
+    SQLALCHEMY_BINDS = {}
+    FLASKY_READ_REPLICAS = []
+    FLASKY_PROFILER = True
+    FLASKY_METRICS_PUBLIC = True
     WTF_CSRF_ENABLED = False
 
 
+class LoadTestConfig(Config):
+    # как production, но без профилировщика, отправки почты и SMTP-журнала ошибок;
+    # базу данных задает manage.py loadtest, сервер слушает без TLS
+    SSL_DISABLE = False
+    FLASKY_MAIL_WORKERS = 0
+    FLASKY_PROFILER = False
+
+
 class ProductionConfig(Config):
     SQLALCHEMY_DATABASE_URI = environ.get('DATABASE_URL')
 
@@ -86,6 +156,7 @@ class HerokuConfig(ProductionConfig):
 config = {
     'development': DevelopmentConfig,
     'testing': TestingConfig,
+    'loadtest': LoadTestConfig,
     'production': ProductionConfig,
     'heroku': HerokuConfig,
     'default': DevelopmentConfig
@@ -15,8 +15,10 @@ migrate = Migrate(app, db)
 
 @manager.command
 def deploy():
+    from time import time
     from flask_migrate import upgrade
     from app.models import Role, User
+    from app.seed import seed_database
 
     # обновить базу данных
     upgrade()
@@ -24,16 +26,186 @@ def deploy():
     # создать роли для пользователей
     Role.insert_roles()
 
-    # создаем фейковых пользователей
-    User.generate_fake(50)
-
-    # фейковые посты
-    Post.generate_fake()
+    # создаем фейковых пользователей и посты
+    seed_database(users=50, posts=50, comments=0, follows=0, seed=int(time()))
 
     # объявить все пользователей как читающих самих себя
     User.add_self_follows()
 
 
+@manager.command
+def reconcile_counters():
+    """Repair drift in the stored post, comment and follow counters."""
+    from app.models import reconcile_counters
+
+    repaired = reconcile_counters()
+    print(f'Counters repaired: {repaired}')
+
+
+@manager.command
+def rebuild_timelines():
+    """Backfill the materialized home timelines of all users."""
+    from app.models import rebuild_timelines
+
+    rebuild_timelines()
+
+
+@manager.command
+def rebuild_search_index():
+    """Recreate the full-text search index of posts and comments."""
+    from app.models import rebuild_search_index
+
+    rebuild_search_index()
+
+
+@manager.command
+def build_follow_graph():
+    """Rewrite the shared follow graph snapshot from the database."""
+    from app.models import build_follow_graph
+
+    if not app.config['FLASKY_FOLLOW_GRAPH_PATH']:
+        print('FLASKY_FOLLOW_GRAPH_PATH is not set')
+        return
+    build_follow_graph()
+
+
+@manager.command
+def send_outbox():
+    """Deliver all queued mail that is due now."""
+    from app.email import outbox
+
+    handled = outbox.drain()
+    print(f'Messages handled: {handled}')
+
+
+@manager.option('-e', '--endpoint', default=None, help='only this endpoint')
+@manager.option('-o', '--order', dest='order_by', default='total', help='total, count, mean, max or p95')
+@manager.option('-l', '--limit', type=int, default=20, help='number of fingerprints')
+@manager.option('-p', '--plans', action='store_true', default=False, help='print captured EXPLAIN plans')
+def sql_report(endpoint, order_by, limit, plans):
+    """Print the SQL profile collected by the web processes."""
+    from app import sql_profiler
+    from app.profiler import ORDERS
+
+    if not app.config['FLASKY_PROFILER_PATH']:
+        print('FLASKY_PROFILER_PATH is not set')
+        return
+    if order_by not in ORDERS:
+        print(f'--order must be one of {", ".join(ORDERS)}')
+        return
+    endpoints, statements = sql_profiler.report(endpoint, order_by, limit)
+    print(f'{"endpoint":<40} {"requests":>9} {"queries":>9} {"per req":>8} {"max":>5} {"db ms":>10}')
+    for row in endpoints:
+        print(f'{row["endpoint"]:<40} {row["requests"]:>9} {row["queries"]:>9} {row["queries_per_request"]:>8.1f} '
+              f'{row["max_queries"]:>5} {row["total"] * 1000:>10.1f}')
+    print()
+    print(f'{"id":<12} {"endpoint":<30} {"count":>8} {"total ms":>10} {"mean ms":>8} {"p95 ms":>8} {"max ms":>8}')
+    for row in statements:
+        print(f'{row["id"]:<12} {row["endpoint"]:<30} {row["count"]:>8} {row["total"] * 1000:>10.1f} '
+              f'{row["mean"] * 1000:>8.2f} {row["p95"] * 1000:>8.2f} {row["max"] * 1000:>8.2f}')
+        print(f'    {row["fingerprint"][:200]}')
+        if plans and row['plan']:
+            for line in row['plan'].splitlines():
+                print(f'      {line}')
+
+
+@manager.option('-u', '--users', type=int, default=100, help='number of users')
+@manager.option('-p', '--posts', type=int, default=1000, help='number of posts')
+@manager.option('-c', '--comments', type=int, default=1000, help='number of comments')
+@manager.option('-f', '--follows', type=int, default=1000, help='number of follow edges besides self follows')
+@manager.option('-d', '--distribution', default='zipf', help='follower degree distribution: zipf or uniform')
+@manager.option('-a', '--alpha', type=float, default=1.1, help='exponent of the zipf distribution')
+@manager.option('-s', '--seed', dest='random_seed', type=int, default=0, help='random seed')
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=5000, help='rows per INSERT batch')
+@manager.option('-w', '--workers', type=int, default=None, help='Markdown render processes')
+def seed(users, posts, comments, follows, distribution, alpha, random_seed, batch_size, workers):
+    """Fill the database with a deterministic synthetic dataset."""
+    from app.seed import seed_database
+
+    seed_database(users=users, posts=posts, comments=comments, follows=follows,
+                  distribution=distribution, alpha=alpha, seed=random_seed,
+                  batch_size=batch_size, workers=workers)
+
+
+@manager.option('-c', '--config', dest='config_name', default='loadtest', help='configuration of the served app')
+@manager.option('-d', '--database', default=None, help='database URL, a temporary SQLite file by default')
+@manager.option('-t', '--duration', type=float, default=30, help='measured seconds')
+@manager.option('-w', '--warmup', type=float, default=5, help='seconds before measuring starts')
+@manager.option('-n', '--concurrency', type=int, default=8, help='number of virtual users')
+@manager.option('-s', '--scenarios', default=None, help='weights, e.g. browse=50,timeline=25,post=5,comment=10,api=10')
+@manager.option('-u', '--users', type=int, default=100, help='number of seeded users')
+@manager.option('-p', '--posts', type=int, default=1000, help='number of seeded posts')
+@manager.option('-k', '--comments', type=int, default=1000, help='number of seeded comments')
+@manager.option('-o', '--output', default='loadtest.json', help='results file')
+@manager.option('-b', '--baseline', default=None, help='results file of an earlier run to compare with')
+@manager.option('-f', '--force', action='store_true', default=False, help='seed a database that already has users')
+def loadtest(config_name, database, duration, warmup, concurrency, scenarios, users, posts, comments, output,
+             baseline, force):
+    """Drive weighted scenarios against the app served from a seeded database."""
+    import json
+    from app.loadtest import run, parse_weights, compare
+
+    results = run(config_name=config_name, database=database, duration=duration, warmup=warmup,
+                  concurrency=concurrency, weights=parse_weights(scenarios) if scenarios else None,
+                  users=users, posts=posts, comments=comments, follows=users * 10, force=force)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    changes = {}
+    if baseline:
+        with open(baseline) as f:
+            changes = compare(json.load(f), results)
+    print(f'{"endpoint":<32} {"requests":>9} {"errors":>7} {"rps":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}'
+          + (f' {"rps %":>7} {"p95 %":>7}' if baseline else ''))
+    for name, row in list(results['endpoints'].items()) + [('total', results['total'])]:
+        line = f'{name:<32} {row["requests"]:>9} {row["errors"]:>7} {row["rps"]:>8.1f} {row["p50_ms"]:>8.2f} ' \
+               f'{row["p95_ms"]:>8.2f} {row["p99_ms"]:>8.2f}'
+        change = changes.get(name)
+        if change:
+            line += ''.join(f' {change[key] * 100:>+7.1f}' if change[key] is not None else f' {"":>7}'
+                            for key in ('rps', 'p95_ms'))
+        print(line)
+    print(f'Results written to {output}')
+
+
+@manager.option('-c', '--config', dest='config_name', default='testing', help='configuration of the analyzed app')
+@manager.option('-d', '--database', default=None, help='database URL, a temporary SQLite file by default')
+@manager.option('-u', '--users', type=int, default=100, help='number of seeded users')
+@manager.option('-p', '--posts', type=int, default=5000, help='number of seeded posts')
+@manager.option('-k', '--comments', type=int, default=5000, help='number of seeded comments')
+@manager.option('-m', '--migration', action='store_true', default=False, help='write an Alembic migration')
+@manager.option('-f', '--force', action='store_true', default=False, help='seed a database that already has users')
+def index_advisor(config_name, database, users, posts, comments, migration, force):
+    """Recommend indexes from the query plans of the app's pages."""
+    import shutil
+    import tempfile
+    from app.index_advisor import record_queries, advise, index_name, write_migration
+    from app.loadtest import load_app, seed_dataset
+
+    directory = None
+    if database is None:
+        directory = tempfile.mkdtemp(prefix='flasky-index-advisor-')
+        database = 'sqlite:///' + os.path.join(directory, 'advisor.sqlite')
+    try:
+        analyzed = load_app(config_name, database)
+        data = seed_dataset(analyzed, users, posts, comments, users * 10, 0, 'cat', force)
+        queries = record_queries(analyzed, data)
+        with analyzed.app_context():
+            recommendations = advise(db.engine, queries)
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory)
+    for table, columns, replaces, reasons in recommendations:
+        print(f'{index_name(table, columns)} ON {table} ({", ".join(columns)})')
+        for old, _ in replaces:
+            print(f'    replaces {old}')
+        for reason in reasons:
+            print(f'    {reason[:160]}')
+    if not recommendations:
+        print('No missing indexes found')
+    elif migration:
+        print(f'Migration written to {write_migration(recommendations)}')
+
+
 def make_shell_context():
     return dict(app=app, db=db, User=User, Role=Role, Permission=Permission, Post=Post)
 
@@ -0,0 +1,38 @@
+"""denormalized counters
+
+Revision ID: 3f1c6a8d2b47
+Revises: 51f5ccfba190
+Create Date: 2026-10-17 09:12:31.481209
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3f1c6a8d2b47'
+down_revision = '51f5ccfba190'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('users', sa.Column('post_count', sa.Integer(), nullable=True))
+    op.add_column('users', sa.Column('follower_count', sa.Integer(), nullable=True))
+    op.add_column('users', sa.Column('followed_count', sa.Integer(), nullable=True))
+    op.add_column('posts', sa.Column('comment_count', sa.Integer(), nullable=True))
+
+    # заполнить счетчики для существующих данных
+    op.execute('UPDATE users SET post_count = '
+               '(SELECT count(*) FROM posts WHERE posts.author_id = users.id)')
+    op.execute('UPDATE users SET follower_count = '
+               '(SELECT count(*) FROM follows WHERE follows.followed_id = users.id)')
+    op.execute('UPDATE users SET followed_count = '
+               '(SELECT count(*) FROM follows WHERE follows.follower_id = users.id)')
+    op.execute('UPDATE posts SET comment_count = '
+               '(SELECT count(*) FROM comments WHERE comments.post_id = posts.id)')
+
+
+def downgrade():
+    op.drop_column('posts', 'comment_count')
+    op.drop_column('users', 'followed_count')
+    op.drop_column('users', 'follower_count')
+    op.drop_column('users', 'post_count')
@@ -0,0 +1,47 @@
+"""composite indexes
+
+Revision ID: 516a99555d44
+Revises: 9e1f7c3a5b20
+Create Date: 2026-10-17 05:29:47.029667
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '516a99555d44'
+down_revision = '9e1f7c3a5b20'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # full scan of comments: WHERE ? = comments.post_id ORDER BY comments.timestamp ASC, comments.id ASC LIMIT ? OFFSET
+    #   ?
+    op.create_index('ix_comments_post_id_timestamp_id', 'comments', ['post_id', 'timestamp', 'id'], unique=False)
+    # full scan of follows: WHERE ? = follows.followed_id ORDER BY follows.timestamp DESC, follows.follower_id DESC
+    #   LIMIT ? OFFSET ?
+    # sort of follows not served by an index: WHERE ? = follows.followed_id ORDER BY follows.timestamp DESC,
+    #   follows.follower_id DESC LIMIT ? OFFSET ?
+    op.create_index('ix_follows_followed_id_timestamp_follower_id', 'follows',
+                    ['followed_id', 'timestamp', 'follower_id'], unique=False)
+    # sort of follows not served by an index: WHERE ? = follows.follower_id ORDER BY follows.timestamp DESC,
+    #   follows.followed_id DESC LIMIT ? OFFSET ?
+    op.create_index('ix_follows_follower_id_timestamp_followed_id', 'follows',
+                    ['follower_id', 'timestamp', 'followed_id'], unique=False)
+    # sort of posts not served by an index: WHERE ? = posts.author_id ORDER BY posts.timestamp DESC, posts.id DESC LIMIT
+    #   ? OFFSET ?
+    op.create_index('ix_posts_author_id_timestamp_id', 'posts', ['author_id', 'timestamp', 'id'], unique=False)
+    # sort of timeline not served by an index: WHERE timeline.user_id = ? ORDER BY timeline.timestamp DESC,
+    #   timeline.post_id DESC LIMIT ? OFFSET ?
+    op.create_index('ix_timeline_user_id_timestamp_post_id', 'timeline',
+                    ['user_id', 'timestamp', 'post_id'], unique=False)
+    op.drop_index('ix_timeline_user_id_timestamp', 'timeline')
+
+
+def downgrade():
+    op.drop_index('ix_comments_post_id_timestamp_id', 'comments')
+    op.drop_index('ix_follows_followed_id_timestamp_follower_id', 'follows')
+    op.drop_index('ix_follows_follower_id_timestamp_followed_id', 'follows')
+    op.drop_index('ix_posts_author_id_timestamp_id', 'posts')
+    op.create_index('ix_timeline_user_id_timestamp', 'timeline', ['user_id', 'timestamp'], unique=False)
+    op.drop_index('ix_timeline_user_id_timestamp_post_id', 'timeline')
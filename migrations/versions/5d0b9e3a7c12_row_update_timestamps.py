@@ -0,0 +1,28 @@
+"""row update timestamps
+
+Revision ID: 5d0b9e3a7c12
+Revises: c27d4b1e9f60
+Create Date: 2026-10-17 16:02:37.118204
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5d0b9e3a7c12'
+down_revision = 'c27d4b1e9f60'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.add_column('users', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute('UPDATE posts SET updated_at = timestamp')
+    op.execute('UPDATE users SET updated_at = member_since')
+    op.create_index('ix_posts_author_id_updated_at', 'posts', ['author_id', 'updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_posts_author_id_updated_at', 'posts')
+    op.drop_column('users', 'updated_at')
+    op.drop_column('posts', 'updated_at')
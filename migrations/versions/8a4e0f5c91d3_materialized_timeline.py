@@ -0,0 +1,32 @@
+"""materialized timeline
+
+Revision ID: 8a4e0f5c91d3
+Revises: 3f1c6a8d2b47
+Create Date: 2026-10-17 10:04:52.730115
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8a4e0f5c91d3'
+down_revision = '3f1c6a8d2b47'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('timeline',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'post_id')
+    )
+    op.create_index('ix_timeline_user_id_timestamp', 'timeline', ['user_id', 'timestamp'], unique=False)
+    # ленты существующих пользователей заполняются командой manage.py rebuild_timelines
+
+
+def downgrade():
+    op.drop_index('ix_timeline_user_id_timestamp', 'timeline')
+    op.drop_table('timeline')
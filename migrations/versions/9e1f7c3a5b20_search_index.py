@@ -0,0 +1,43 @@
+"""search index
+
+Revision ID: 9e1f7c3a5b20
+Revises: 5d0b9e3a7c12
+Create Date: 2026-10-17 18:41:09.552310
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9e1f7c3a5b20'
+down_revision = '5d0b9e3a7c12'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+def upgrade():
+    # rowid = id * 2 для постов и id * 2 + 1 для комментариев, см. app/search.py;
+    # при другом FLASKY_SEARCH_LANGUAGE индекс перестраивается manage.py rebuild_search_index
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE search_index USING fts5("
+                   "body, tokenize = 'unicode61 remove_diacritics 2')")
+        op.execute("INSERT INTO search_index (rowid, body) SELECT id * 2, coalesce(body, '') FROM posts")
+        op.execute("INSERT INTO search_index (rowid, body) SELECT id * 2 + 1, coalesce(body, '') "
+                   "FROM comments WHERE NOT coalesce(disabled, 0)")
+    elif dialect == 'postgresql':
+        op.create_table('search_index',
+                        sa.Column('id', sa.BigInteger(), nullable=False),
+                        sa.Column('document', postgresql.TSVECTOR(), nullable=False),
+                        sa.PrimaryKeyConstraint('id'))
+        op.create_index('ix_search_index_document', 'search_index', ['document'], postgresql_using='gin')
+        op.execute("INSERT INTO search_index (id, document) "
+                   "SELECT id * 2, to_tsvector('simple', coalesce(body, '')) FROM posts")
+        op.execute("INSERT INTO search_index (id, document) "
+                   "SELECT id * 2 + 1, to_tsvector('simple', coalesce(body, '')) "
+                   "FROM comments WHERE NOT coalesce(disabled, false)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name in ('sqlite', 'postgresql'):
+        op.execute('DROP TABLE search_index')
@@ -0,0 +1,37 @@
+"""mail outbox
+
+Revision ID: c27d4b1e9f60
+Revises: 8a4e0f5c91d3
+Create Date: 2026-10-17 14:21:08.402913
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c27d4b1e9f60'
+down_revision = '8a4e0f5c91d3'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('recipient', sa.String(length=128), nullable=True),
+    sa.Column('subject', sa.String(length=256), nullable=True),
+    sa.Column('template', sa.String(length=128), nullable=True),
+    sa.Column('context', sa.Text(), nullable=True),
+    sa.Column('base_url', sa.String(length=256), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_outbox_next_attempt_at', 'outbox', ['next_attempt_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_outbox_next_attempt_at', 'outbox')
+    op.drop_table('outbox')
@@ -0,0 +1,52 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from benchmarks.models import compare, main, slower_p_value
+
+
+def result(samples):
+    ordered = sorted(samples)
+    return {'median': ordered[len(ordered) // 2], 'samples': samples}
+
+
+class RegressionCheckTestCase(unittest.TestCase):
+    def test_p_value(self):
+        # U = 25 при n1 = n2 = 5, z = (25 - 12.5 - 0.5) / sqrt(25 * 11 / 12)
+        self.assertAlmostEqual(slower_p_value([10, 11, 12, 13, 14], [1, 2, 3, 4, 5]), 0.00609, places=4)
+        self.assertGreater(slower_p_value([1, 2, 3, 4, 5], [10, 11, 12, 13, 14]), 0.99)
+        self.assertGreater(slower_p_value([3, 3, 3], [3, 3, 3]), 0.5)
+
+    def test_compare(self):
+        baseline = {'slower': {'samples': [1, 2, 3, 4, 5]}, 'noise': {'samples': [1, 2, 3, 4, 5]}}
+        results = {'slower': result([10, 11, 12, 13, 14]), 'noise': result([1.05, 2.05, 3.05, 4.05, 5.05]),
+                   'new': result([1, 2, 3])}
+        rows = {name: (ratio, p, regressed) for name, _, ratio, p, regressed in compare(results, baseline, 0.1, 0.01)}
+        self.assertEqual(rows['slower'][0], 3.0)
+        self.assertTrue(rows['slower'][2])
+        # медиана выросла меньше порога
+        self.assertFalse(rows['noise'][2])
+        self.assertEqual(rows['new'], (None, None, False))
+
+    def test_exit_status(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'baseline.json')
+        args = ['--baseline', path, '-k', 'gravatar', '--repeat', '5', '--min-time', '0.001']
+        with redirect_stdout(StringIO()):
+            self.assertEqual(main(args + ['--save']), 0)
+            with open(path) as f:
+                saved = json.load(f)
+            self.assertEqual(list(saved['benchmarks']), ['user.gravatar'])
+            # базовая линия, по сравнению с которой текущий код заведомо медленнее
+            saved['benchmarks']['user.gravatar']['samples'] = [1e-12] * 5
+            with open(path, 'w') as f:
+                json.dump(saved, f)
+            output = StringIO()
+            with redirect_stdout(output):
+                self.assertEqual(main(args), 1)
+        self.assertIn('REGRESSION', output.getvalue())
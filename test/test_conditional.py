@@ -0,0 +1,84 @@
+import unittest
+from base64 import b64encode
+
+from app import create_app, db
+from app.models import User, Role, Post, Comment
+
+
+class ConditionalGetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        john = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        post = Post(body='first', author=john)
+        db.session.add_all([john, post])
+        db.session.commit()
+        self.user_id, self.post_id = john.id, post.id
+        db.session.remove()
+        credentials = b64encode(b'john@example.com:cat').decode('utf-8')
+        self.headers = {'Authorization': 'Basic ' + credentials, 'Accept': 'application/json'}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, url, **headers):
+        response = self.client.get(url, base_url='https://localhost', headers=dict(self.headers, **headers))
+        db.session.remove()
+        return response
+
+    def assertRevalidates(self, url):
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        response = self.get(url, **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+        self.assertEqual(response.headers['ETag'], etag)
+        return etag
+
+    def test_post(self):
+        url = f'/api/v1.0/posts/{self.post_id}'
+        etag = self.assertRevalidates(url)
+        response = self.get(url)
+        self.assertEqual(self.get(url, **{'If-Modified-Since': response.headers['Last-Modified']}).status_code, 304)
+
+        post = Post.query.get(self.post_id)
+        post.body = 'edited'
+        db.session.commit()
+        response = self.get(url, **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['body'], 'edited')
+
+    def test_post_comments(self):
+        url = f'/api/v1.0/posts/{self.post_id}/comments/'
+        etag = self.assertRevalidates(url)
+        db.session.add(Comment(body='nice', post_id=self.post_id, author_id=self.user_id))
+        db.session.commit()
+        response = self.get(url, **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['count'], 1)
+
+    def test_user_posts(self):
+        url = f'/api/v1.0/users/{self.user_id}/posts'
+        etag = self.assertRevalidates(url)
+        # новый комментарий меняет comment_count в списке постов
+        db.session.add(Comment(body='nice', post_id=self.post_id, author_id=self.user_id))
+        db.session.commit()
+        response = self.get(url, **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        db.session.add(Post(body='second', author_id=self.user_id))
+        db.session.commit()
+        self.assertEqual(self.get(url, **{'If-None-Match': etag}).status_code, 200)
+
+    def test_anonymous_page(self):
+        response = self.client.get('/', base_url='https://localhost')
+        etag = response.headers['ETag']
+        response = self.client.get('/', base_url='https://localhost', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
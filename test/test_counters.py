@@ -0,0 +1,61 @@
+import unittest
+
+from app import create_app, db
+from app.models import User, Role, Post, Comment, reconcile_counters
+
+
+class CountersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_user(self, email, username):
+        r = Role.query.filter_by(name='User').first()
+        user = User(email=email, username=username, password='cat', role=r)
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    def test_counters_follow_writes(self):
+        john = self.add_user('john@example.com', 'john')
+        susan = self.add_user('susan@example.com', 'susan')
+        # каждый пользователь читает самого себя
+        self.assertEqual(john.follower_count, 1)
+        self.assertEqual(john.followed_count, 1)
+
+        post = Post(body='post', author=john)
+        db.session.add(post)
+        db.session.add(Comment(body='comment', post=post, author=susan))
+        db.session.commit()
+        self.assertEqual(john.post_count, 1)
+        self.assertEqual(post.comment_count, 1)
+
+        susan.follow(john)
+        db.session.commit()
+        self.assertEqual(john.follower_count, 2)
+        self.assertEqual(susan.followed_count, 2)
+
+        susan.unfollow(john)
+        db.session.commit()
+        self.assertEqual(john.follower_count, 1)
+        self.assertEqual(susan.followed_count, 1)
+
+    def test_reconcile_counters(self):
+        john = self.add_user('john@example.com', 'john')
+        db.session.add(Post(body='post', author=john))
+        db.session.commit()
+        db.session.execute(User.__table__.update().values(post_count=5, follower_count=None))
+        db.session.commit()
+
+        self.assertEqual(reconcile_counters(), 2)
+        self.assertEqual(john.post_count, 1)
+        self.assertEqual(john.follower_count, 1)
+        self.assertEqual(reconcile_counters(), 0)
@@ -0,0 +1,183 @@
+import socketserver
+import threading
+import unittest
+from datetime import datetime, timedelta
+
+from app import create_app, db
+from app.email import outbox, send_email
+from app.models import User, Role, OutboxMessage
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Minimal local SMTP server that records the messages it accepts."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.messages = []
+        self.connections = 0
+        self.refuse = set()
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 localhost')
+        recipients = []
+        for line in self.rfile:
+            command = line.decode('utf-8').strip()
+            verb = command[:4].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                address = command.split(':', 1)[1].strip('<> ')
+                if address in self.server.refuse:
+                    self.reply('451 try again later')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 end with .')
+                data = []
+                for line in self.rfile:
+                    if line == b'.\r\n':
+                        break
+                    data.append(line)
+                self.server.messages.append((recipients, b''.join(data).decode('utf-8')))
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class OutboxTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = SMTPStandIn().__enter__()
+        self.app = create_app('testing')
+        state = self.app.extensions['mail']
+        state.suppress = False
+        state.use_tls = False
+        state.server, state.port = self.server.server_address
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(email='john@example.com', username='john', password='cat')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.server.__exit__()
+
+    def send(self, to):
+        with self.app.test_request_context(base_url='https://example.com'):
+            send_email(to, 'Confirm Your Account', 'auth/email/confirm', user=self.user, token='abc')
+            db.session.commit()
+
+    def test_request_only_queues(self):
+        self.send('john@example.com')
+        self.assertEqual(self.server.connections, 0)
+        message = OutboxMessage.query.one()
+        self.assertEqual(message.subject, '[Flasky] Confirm Your Account')
+        self.assertIsNone(message.sent_at)
+
+    def test_queued_with_the_callers_transaction(self):
+        woken = []
+        outbox.wake, wake = (lambda: woken.append(True)), outbox.wake
+        try:
+            with self.app.test_request_context(base_url='https://example.com'):
+                send_email('john@example.com', 'Confirm Your Account', 'auth/email/confirm',
+                           user=self.user, token='abc')
+                db.session.flush()
+                db.session.rollback()
+            self.assertEqual(OutboxMessage.query.count(), 0)
+            self.assertEqual(woken, [])
+            self.send('john@example.com')
+            self.assertEqual(OutboxMessage.query.count(), 1)
+            self.assertEqual(woken, [True])
+        finally:
+            del outbox.wake
+        self.assertEqual(outbox.wake, wake)
+
+    def test_burst_uses_one_connection(self):
+        for i in range(5):
+            self.send(f'user{i}@example.com')
+        self.assertEqual(outbox.drain(), 5)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.messages), 5)
+        recipients, data = self.server.messages[0]
+        self.assertEqual(recipients, ['user0@example.com'])
+        self.assertIn('Dear john', data)
+        self.assertIn('https://example.com/auth/confirm/abc', data)
+        self.assertEqual(OutboxMessage.query.filter(OutboxMessage.sent_at.is_(None)).count(), 0)
+        self.assertEqual(outbox.drain(), 0)
+
+    def test_failed_message_is_retried_with_backoff(self):
+        self.server.refuse.add('bad@example.com')
+        self.send('bad@example.com')
+        self.send('good@example.com')
+        start = datetime.utcnow()
+        self.assertEqual(outbox.drain(), 2)
+        self.assertEqual([r for r, _ in self.server.messages], [['good@example.com']])
+        message = OutboxMessage.query.filter_by(recipient='bad@example.com').one()
+        self.assertEqual(message.attempts, 1)
+        self.assertIsNone(message.sent_at)
+        self.assertGreaterEqual(message.next_attempt_at, start + timedelta(seconds=outbox.retry_delay))
+
+        # повтор после паузы, вторая пауза вдвое длиннее
+        message.next_attempt_at = datetime.utcnow()
+        db.session.commit()
+        outbox.drain()
+        message = OutboxMessage.query.filter_by(recipient='bad@example.com').one()
+        self.assertEqual(message.attempts, 2)
+        self.assertGreaterEqual(message.next_attempt_at,
+                                datetime.utcnow() + timedelta(seconds=2 * outbox.retry_delay - 5))
+
+        self.server.refuse.clear()
+        message.next_attempt_at = datetime.utcnow()
+        db.session.commit()
+        self.assertEqual(outbox.drain(), 1)
+        message = OutboxMessage.query.filter_by(recipient='bad@example.com').one()
+        self.assertIsNotNone(message.sent_at)
+        self.assertIsNone(message.next_attempt_at)
+
+    def test_unreachable_server_keeps_messages(self):
+        self.send('john@example.com')
+        self.app.extensions['mail'].port = 1
+        self.assertEqual(outbox.drain(), 1)
+        message = OutboxMessage.query.one()
+        self.assertEqual(message.attempts, 1)
+        self.assertIsNotNone(message.next_attempt_at)
+        self.assertIsNotNone(message.last_error)
+
+    def test_gives_up_after_max_attempts(self):
+        self.server.refuse.add('bad@example.com')
+        self.send('bad@example.com')
+        for i in range(outbox.max_attempts):
+            OutboxMessage.query.update({'next_attempt_at': datetime.utcnow()})
+            db.session.commit()
+            outbox.drain()
+        message = OutboxMessage.query.one()
+        self.assertEqual(message.attempts, outbox.max_attempts)
+        self.assertIsNone(message.next_attempt_at)
+        self.assertEqual(outbox.drain(), 0)
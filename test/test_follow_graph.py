@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from app import create_app, db, follow_graph
+from app.follow_graph import FollowGraph, ADD, REMOVE, HEADER, MAGIC
+from app.models import User, Role, build_follow_graph
+
+
+class FollowGraphTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['FLASKY_FOLLOW_GRAPH_PATH'] = os.path.join(self.dir, 'follows.bin')
+        follow_graph.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.app.config['FLASKY_FOLLOW_GRAPH_PATH'] = None
+        follow_graph.init_app(self.app)
+        shutil.rmtree(self.dir)
+
+    def add_user(self, email, username):
+        user = User(email=email, username=username, password='cat')
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    def test_snapshot_and_log(self):
+        graph = FollowGraph(self.app)
+        graph.build(lambda: [(1, 2), (1, 3), (3, 1)])
+        self.assertTrue(graph.available())
+        self.assertTrue(graph.is_following(1, 3))
+        self.assertFalse(graph.is_following(2, 1))
+        self.assertFalse(graph.is_following(7, 1))
+        self.assertTrue(graph.is_following(3, 1))
+
+        # второй процесс видит записи первого через лог
+        other = FollowGraph(self.app)
+        graph.record([(REMOVE, 1, 3), (ADD, 2, 1), (ADD, 9, 3)])
+        self.assertTrue(other.available())
+        self.assertFalse(other.is_following(1, 3))
+        self.assertTrue(other.is_following(2, 1))
+        self.assertTrue(other.is_following(9, 3))
+        self.assertTrue(other.is_following(1, 2))
+
+        # перестройка обрезает лог и заменяет снимок
+        graph.build(lambda: [(4, 5)])
+        self.assertEqual(os.path.getsize(graph.log_path), 0)
+        self.assertTrue(other.available())
+        self.assertTrue(other.is_following(4, 5))
+        self.assertFalse(other.is_following(2, 1))
+        graph.record([(ADD, 5, 4)])
+        self.assertTrue(other.available())
+        self.assertTrue(other.is_following(5, 4))
+
+    def test_models_use_graph(self):
+        u1 = self.add_user('john@example.com', 'john')
+        u2 = self.add_user('susan@example.com', 'susan')
+        self.assertFalse(follow_graph.available())
+        self.assertFalse(u1.is_following(u2))
+        # снимок строится при первом обращении
+        self.assertTrue(follow_graph.available())
+
+        u1.follow(u2)
+        # незафиксированная подписка видна через базу данных
+        self.assertTrue(u1.is_following(u2))
+        db.session.commit()
+        self.assertTrue(u1.is_following(u2))
+        self.assertTrue(u2.is_followed_by(u1))
+        self.assertTrue(follow_graph.is_following(u2.id, u2.id))
+        self.assertEqual(os.path.getsize(follow_graph.log_path), 12)
+
+        u1.unfollow(u2)
+        db.session.rollback()
+        self.assertTrue(u1.is_following(u2))
+        u1.unfollow(u2)
+        db.session.commit()
+        self.assertFalse(u1.is_following(u2))
+        self.assertTrue(follow_graph.available())
+        self.assertTrue(follow_graph.is_following(u1.id, u1.id))
+
+        build_follow_graph()
+        self.assertEqual(os.path.getsize(follow_graph.log_path), 0)
+        self.assertFalse(u1.is_following(u2))
+        self.assertTrue(u2.is_following(u2))
+
+    def test_build_keeps_concurrent_changes(self):
+        graph = FollowGraph(self.app)
+        other = FollowGraph(self.app)
+        writer = threading.Thread(target=other.record, args=([(ADD, 2, 1)],))
+
+        def edges():
+            # запись другого процесса ждет, пока снимок не будет записан
+            writer.start()
+            time.sleep(0.1)
+            return [(1, 2)]
+
+        graph.build(edges)
+        writer.join()
+        self.assertTrue(graph.available())
+        self.assertTrue(graph.is_following(1, 2))
+        self.assertTrue(graph.is_following(2, 1))
+
+    def test_old_snapshot_format_is_rebuilt(self):
+        u1 = self.add_user('john@example.com', 'john')
+        with open(follow_graph.path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, 1, 0, 0, 0) + bytes(8))
+        self.assertFalse(follow_graph.available())
+        self.assertTrue(u1.is_following(u1))
+        self.assertTrue(follow_graph.available())
@@ -0,0 +1,104 @@
+import unittest
+
+from flask import render_template_string
+
+from app import create_app, db, fragment_cache, page_cache, versions
+from app.models import User, Role, Post, Comment
+
+
+class FragmentCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        # страницы должны отрисовываться, а не отдаваться из кэша
+        self.app.config['FLASKY_PAGE_CACHE_TTL'] = 0
+        page_cache.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client(use_cookies=True)
+        john = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        susan = User(email='susan@example.com', username='susan', password='cat', confirmed=True)
+        db.session.add_all([john, susan,
+                            Post(body='first', author=john),
+                            Post(body='second', author=susan)])
+        db.session.commit()
+        db.session.remove()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, url='/'):
+        response = self.client.get(url, base_url='https://localhost')
+        db.session.remove()
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def counts(self, response):
+        timing = response.headers.get('Server-Timing', '')
+        for entry in timing.split(','):
+            if entry.strip().startswith('fragment-cache'):
+                desc = entry.split('desc="')[1].rstrip('"')
+                hits, misses = desc.split()
+                return int(hits.split('=')[1]), int(misses.split('=')[1])
+
+    def test_second_view_hits(self):
+        self.assertEqual(self.counts(self.get()), (0, 2))
+        response = self.get()
+        self.assertEqual(self.counts(response), (2, 0))
+        self.assertIn('first', response.get_data(as_text=True))
+        self.assertEqual(fragment_cache.stats()['posts']['ratio'], 0.5)
+
+    def test_edit_and_author_change_invalidate(self):
+        self.get()
+        post = Post.query.filter_by(body='first').one()
+        post.body = 'edited'
+        db.session.commit()
+        response = self.get()
+        self.assertEqual(self.counts(response), (1, 1))
+        self.assertIn('edited', response.get_data(as_text=True))
+
+        susan = User.query.filter_by(username='susan').one()
+        susan.username = 'susanna'
+        db.session.commit()
+        response = self.get()
+        self.assertEqual(self.counts(response), (1, 1))
+        self.assertIn('susanna', response.get_data(as_text=True))
+
+    def test_new_comment_does_not_invalidate_post(self):
+        self.get()
+        post = Post.query.filter_by(body='first').one()
+        db.session.add(Comment(body='nice', post=post, author=post.author))
+        db.session.commit()
+        response = self.get()
+        self.assertEqual(self.counts(response), (2, 0))
+        self.assertIn('1 Comments', response.get_data(as_text=True))
+
+    def test_edit_link_stays_per_viewer(self):
+        self.get()
+        self.client.post('/auth/login', base_url='https://localhost', data={
+            'email': 'john@example.com', 'password': 'cat'})
+        data = self.get().get_data(as_text=True)
+        post = Post.query.filter_by(body='first').one()
+        self.assertIn(f'/edit/{post.id}', data)
+        other = Post.query.filter_by(body='second').one()
+        self.assertNotIn(f'/edit/{other.id}', data)
+
+    def test_write_between_load_and_render(self):
+        post_id = Post.query.filter_by(body='first').one().id
+        db.session.remove()
+
+        @self.app.route('/racy')
+        def racy():
+            post = Post.query.get(post_id)
+            if post.body == 'first':
+                # другой запрос меняет пост после загрузки, но до отрисовки
+                with db.engine.begin() as connection:
+                    connection.execute(Post.__table__.update().where(Post.id == post_id).values(body='edited'))
+                versions.bump(('posts', post_id))
+            return render_template_string('{% cache post %}{{ post.body }}{% endcache %}', post=post)
+
+        self.assertEqual(self.get('/racy').get_data(as_text=True), 'first')
+        self.assertEqual(self.get('/racy').get_data(as_text=True), 'edited')
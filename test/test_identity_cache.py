@@ -0,0 +1,201 @@
+import unittest
+from base64 import b64encode
+from time import monotonic, time
+from unittest import mock
+
+from app import create_app, db, identity_cache, token_cache, credential_cache, password_hasher
+from app.models import User, Role, Permission
+
+
+class IdentityCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        user = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+        db.session.remove()
+        self.client = self.app.test_client(use_cookies=True)
+        self.statements = []
+        db.event.listen(db.engine, 'before_cursor_execute', self.record)
+
+    def tearDown(self):
+        db.event.remove(db.engine, 'before_cursor_execute', self.record)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def identity_queries(self, url='/edit-profile'):
+        del self.statements[:]
+        response = self.client.get(url, base_url='https://localhost')
+        self.assertEqual(response.status_code, 200)
+        db.session.remove()
+        return [s for s in self.statements if s.startswith('SELECT') and
+                ('FROM users' in s or 'FROM roles' in s)]
+
+    def login(self):
+        response = self.client.post('/auth/login', base_url='https://localhost', data={
+            'email': 'john@example.com', 'password': 'cat'})
+        self.assertEqual(response.status_code, 302)
+        db.session.remove()
+
+    def test_cached_identity_needs_no_queries(self):
+        self.login()
+        self.assertTrue(self.identity_queries())
+        self.assertEqual(self.identity_queries(), [])
+        self.assertEqual(self.identity_queries(), [])
+
+    def test_profile_change_invalidates(self):
+        self.login()
+        self.identity_queries()
+        user = User.query.get(self.user_id)
+        user.location = 'Moscow'
+        db.session.commit()
+        db.session.remove()
+        self.assertTrue(self.identity_queries())
+        response = self.client.get('/edit-profile', base_url='https://localhost')
+        self.assertIn('Moscow', response.get_data(as_text=True))
+
+    def test_role_change_invalidates(self):
+        self.login()
+        self.identity_queries()
+        role = Role.query.filter_by(name='User').first()
+        role.permissions = Permission.FOLLOW
+        db.session.commit()
+        db.session.remove()
+        self.assertTrue(self.identity_queries())
+        user = identity_cache.get(self.user_id)
+        self.assertFalse(user.can(Permission.COMMENT))
+
+    def test_last_seen_does_not_invalidate(self):
+        self.login()
+        self.identity_queries()
+        self.identity_queries()
+        self.assertIsNotNone(identity_cache.get(self.user_id))
+
+    def test_expired_entry_is_reloaded(self):
+        self.login()
+        self.identity_queries()
+        later = monotonic() + identity_cache.ttl + 1
+        with mock.patch('app.identity.monotonic', return_value=later):
+            self.assertIsNone(identity_cache.get(self.user_id))
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_verified_token_is_cached(self):
+        token = self.user.generate_auth_token(3600)
+        self.assertEqual(User.verify_auth_token(token), self.user)
+        self.assertEqual(token_cache.get(token), self.user.id)
+        with mock.patch('app.models.Serializer') as serializer:
+            self.assertEqual(User.verify_auth_token(token), self.user)
+            serializer.assert_not_called()
+
+    def test_invalid_token_is_not_cached(self):
+        self.assertIsNone(User.verify_auth_token('bad-token'))
+        self.assertIsNone(token_cache.get('bad-token'))
+
+    def test_token_expiry_is_respected(self):
+        token = self.user.generate_auth_token(1)
+        User.verify_auth_token(token)
+        with mock.patch('app.identity.time', return_value=time() + 2):
+            self.assertIsNone(token_cache.get(token))
+
+    def test_credential_change_revokes(self):
+        token = self.user.generate_auth_token(3600)
+        User.verify_auth_token(token)
+        self.user.location = 'Moscow'
+        db.session.commit()
+        self.assertEqual(token_cache.get(token), self.user.id)
+        self.user.password = 'dog'
+        db.session.commit()
+        self.assertIsNone(token_cache.get(token))
+        User.verify_auth_token(token)
+        self.user.email = 'john@example.org'
+        db.session.commit()
+        self.assertIsNone(token_cache.get(token))
+
+
+class CredentialCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        user = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+        db.session.remove()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, email, password):
+        credentials = b64encode(f'{email}:{password}'.encode('utf-8')).decode('utf-8')
+        response = self.client.get('/api/v1.0/posts/', base_url='https://localhost',
+                                   headers={'Authorization': 'Basic ' + credentials})
+        db.session.remove()
+        return response
+
+    def test_successful_check_is_cached(self):
+        hashes = password_hasher.count
+        self.assertEqual(self.get('john@example.com', 'cat').status_code, 200)
+        self.assertEqual(password_hasher.count, hashes + 1)
+        response = self.get('john@example.com', 'cat')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(password_hasher.count, hashes + 1)
+
+    def test_wrong_password_is_not_cached(self):
+        self.assertEqual(self.get('john@example.com', 'dog').status_code, 401)
+        response = self.get('john@example.com', 'dog')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('password-hash;dur=', response.headers['Server-Timing'])
+        self.assertIsNone(credential_cache.get('john@example.com', 'dog'))
+
+    def test_password_change_revokes(self):
+        self.get('john@example.com', 'cat')
+        self.assertEqual(credential_cache.get('john@example.com', 'cat'), self.user_id)
+        user = User.query.get(self.user_id)
+        user.password = 'dog'
+        db.session.commit()
+        self.assertIsNone(credential_cache.get('john@example.com', 'cat'))
+        self.assertEqual(self.get('john@example.com', 'cat').status_code, 401)
+        self.assertEqual(self.get('john@example.com', 'dog').status_code, 200)
+
+    def test_password_change_during_check_is_not_cached(self):
+        check = password_hasher.check
+
+        def racing_check(password_hash, password):
+            # смена пароля фиксируется, пока идет PBKDF2
+            credential_cache.revoke([self.user_id])
+            return check(password_hash, password)
+
+        with mock.patch.object(password_hasher, 'check', racing_check):
+            self.assertEqual(self.get('john@example.com', 'cat').status_code, 200)
+        self.assertIsNone(credential_cache.get('john@example.com', 'cat'))
@@ -0,0 +1,66 @@
+import unittest
+
+from app import create_app, db
+from app.index_advisor import record_queries, advise, explain, render_migration
+from app.models import User, Post, Comment, Follow
+from app.seed import seed_database
+
+
+class IndexAdvisorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        seed_database(users=10, posts=100, comments=100, follows=30, workers=1)
+        self.data = {'users': [tuple(row) for row in db.session.query(User.id, User.email, User.username)],
+                     'posts': [id for id, in db.session.query(Post.id)]}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def plan(self, query):
+        statement = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        with db.engine.connect() as connection:
+            return '\n'.join(explain(connection, statement, {}))
+
+    def test_hot_queries_use_index_scans(self):
+        user = User.query.first()
+        post = Post.query.first()
+        hot = {
+            'ix_comments_post_id_timestamp_id': post.comments.order_by(Comment.timestamp, Comment.id),
+            'ix_posts_author_id_timestamp_id': user.posts.order_by(Post.timestamp.desc(), Post.id.desc()),
+            'ix_follows_followed_id_timestamp_follower_id':
+                user.followers.order_by(Follow.timestamp.desc(), Follow.follower_id.desc()),
+            'ix_follows_follower_id_timestamp_followed_id':
+                user.followed.order_by(Follow.timestamp.desc(), Follow.followed_id.desc()),
+            'ix_timeline_user_id_timestamp_post_id': user.followed_posts,
+        }
+        for index, query in hot.items():
+            plan = self.plan(query.limit(10))
+            self.assertIn(f'INDEX {index} (', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_no_recommendations_for_current_schema(self):
+        queries = record_queries(self.app, self.data)
+        self.assertGreater(len(queries), 10)
+        self.assertEqual(advise(db.engine, queries), [])
+
+    def test_recommends_missing_index(self):
+        db.session.execute('DROP INDEX ix_comments_post_id_timestamp_id')
+        db.session.commit()
+        recommendations = advise(db.engine, record_queries(self.app, self.data))
+        self.assertEqual([(r.table, r.columns) for r in recommendations],
+                         [('comments', ['post_id', 'timestamp', 'id'])])
+        self.assertIn('comments.post_id', recommendations[0].reasons[0])
+        source = render_migration(recommendations, 'abc', 'def')
+        self.assertIn("op.create_index('ix_comments_post_id_timestamp_id', 'comments', "
+                      "['post_id', 'timestamp', 'id'], unique=False)", source)
+        compile(source, 'migration.py', 'exec')
+        comments = [line.strip() for line in source.splitlines() if line.startswith('    #')]
+        self.assertTrue(all(len(line) <= 120 for line in source.splitlines()))
+        # причины переносятся по словам, а не обрезаются
+        self.assertEqual(' '.join(line.lstrip('# ') for line in comments), ' '.join(recommendations[0].reasons[:3]))
@@ -0,0 +1,104 @@
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from app import create_app, db, last_seen_buffer
+from app.models import User, Role
+
+
+class LastSeenBufferTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['FLASKY_LAST_SEEN_BATCH'] = 3
+        last_seen_buffer.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.statements = []
+        db.event.listen(db.engine, 'before_cursor_execute', self.record)
+
+    def tearDown(self):
+        db.event.remove(db.engine, 'before_cursor_execute', self.record)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        last_seen_buffer.stop()
+        last_seen_buffer.init_app(self.app)
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def add_user(self, n, last_seen):
+        user = User(email=f'user{n}@example.com', username=f'user{n}', password='cat',
+                    confirmed=True, last_seen=last_seen)
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    def test_ping_does_not_write(self):
+        old = datetime.utcnow() - timedelta(hours=1)
+        u = self.add_user(1, old)
+        self.assertEqual(u.last_seen, old)
+        del self.statements[:]
+        u.ping()
+        db.session.commit()
+        self.assertEqual(self.statements, [])
+        self.assertEqual(len(last_seen_buffer), 1)
+        self.assertEqual(u.last_seen, old)
+
+    def test_recent_visit_is_ignored(self):
+        u = self.add_user(1, datetime.utcnow())
+        u.ping()
+        self.assertEqual(len(last_seen_buffer), 0)
+
+    def test_flush_coalesces_and_batches(self):
+        old = datetime.utcnow() - timedelta(hours=1)
+        u1, u2, u3 = self.add_user(1, old), self.add_user(2, old), self.add_user(3, old)
+        u1.ping()
+        u1.ping()
+        u2.ping()
+        self.assertEqual(len(last_seen_buffer), 2)
+        del self.statements[:]
+        # третий пользователь заполняет пакет
+        u3.ping()
+        self.assertEqual(len(last_seen_buffer), 0)
+        self.assertEqual(len([s for s in self.statements if s.startswith('UPDATE')]), 1)
+        db.session.expire_all()
+        for u in (u1, u2, u3):
+            self.assertGreater(u.last_seen, old)
+
+    def test_timer_flushes_without_traffic(self):
+        old = datetime.utcnow() - timedelta(hours=1)
+        u = self.add_user(1, old)
+        last_seen_buffer.stop()
+        last_seen_buffer.interval = 0.05
+        u.ping()
+        deadline = time.monotonic() + 5
+        while len(last_seen_buffer) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(last_seen_buffer), 0)
+        last_seen_buffer.stop()
+        db.session.expire_all()
+        self.assertGreater(u.last_seen, old)
+
+    def test_flush_keeps_newer_value(self):
+        now = datetime.utcnow()
+        u = self.add_user(1, now - timedelta(hours=1))
+        last_seen_buffer.touch(u.id, u.last_seen, now=now - timedelta(minutes=30))
+        User.query.filter_by(id=u.id).update({'last_seen': now})
+        db.session.commit()
+        self.assertEqual(last_seen_buffer.flush(), 1)
+        db.session.expire_all()
+        self.assertEqual(u.last_seen, now)
+
+    def test_read_only_request_does_not_write(self):
+        self.add_user(1, datetime.utcnow() - timedelta(hours=1))
+        db.session.remove()
+        client = self.app.test_client(use_cookies=True)
+        client.post('/auth/login', base_url='https://localhost', data={
+            'email': 'user1@example.com', 'password': 'cat'})
+        del self.statements[:]
+        response = client.get('/edit-profile', base_url='https://localhost')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([s for s in self.statements if not s.startswith('SELECT')], [])
@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from app.loadtest import run, summarize, compare, parse_weights, load_app, seed_dataset
+
+
+class LoadTestTestCase(unittest.TestCase):
+    def test_summarize(self):
+        samples = {'main.index': [i / 1000 for i in range(1, 101)], 'api.get_post': [0.002]}
+        total, endpoints = summarize(samples, {'main.index': 3}, 2.0)
+        self.assertEqual(total['requests'], 101)
+        self.assertEqual(total['errors'], 3)
+        self.assertAlmostEqual(endpoints['main.index']['rps'], 50.0)
+        self.assertAlmostEqual(endpoints['main.index']['p50_ms'], 51.0)
+        self.assertAlmostEqual(endpoints['main.index']['p95_ms'], 96.0)
+        self.assertAlmostEqual(endpoints['main.index']['p99_ms'], 100.0)
+        self.assertEqual(endpoints['api.get_post']['errors'], 0)
+
+    def test_weights_and_compare(self):
+        self.assertEqual(parse_weights('browse=3,api'), {'browse': 3.0, 'api': 10})
+        with self.assertRaises(ValueError):
+            parse_weights('crawl=1')
+        before = {'endpoints': {'main.index': {'rps': 100.0, 'p95_ms': 10.0, 'p99_ms': 20.0}}}
+        after = {'endpoints': {'main.index': {'rps': 110.0, 'p95_ms': 8.0, 'p99_ms': 20.0},
+                               'main.user': {'rps': 1.0, 'p95_ms': 1.0, 'p99_ms': 1.0}}}
+        changes = compare(before, after)
+        self.assertEqual(list(changes), ['main.index'])
+        self.assertAlmostEqual(changes['main.index']['rps'], 0.1)
+        self.assertAlmostEqual(changes['main.index']['p95_ms'], -0.2)
+
+    def test_run(self):
+        results = run(duration=1, warmup=0.5, concurrency=2, users=5, posts=10, comments=5, follows=5)
+        self.assertGreater(results['total']['requests'], 0)
+        self.assertEqual(results['total']['errors'], 0)
+        self.assertIn('main.index', results['endpoints'])
+        self.assertEqual(results['dataset']['users'], 5)
+
+    def test_refuses_seeded_database(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        database = 'sqlite:///' + os.path.join(directory, 'loadtest.sqlite')
+        seed_dataset(load_app('loadtest', database), 2, 2, 0, 0, 0, 'cat')
+        with self.assertRaises(RuntimeError):
+            seed_dataset(load_app('loadtest', database), 2, 2, 0, 0, 0, 'cat')
+        with self.assertRaises(RuntimeError):
+            run(database=database, duration=1, warmup=0, users=2, posts=2, comments=0, follows=0)
@@ -0,0 +1,47 @@
+import unittest
+
+from app import create_app, db, render_cache
+from app.markup import RenderCache, render_markdown
+from app.models import Post
+
+
+class RenderCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        render_cache.cache.clear()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_identical_bodies_render_once(self):
+        first = Post(body='*hello*')
+        second = Post(body='*hello*')
+        self.assertEqual(first.body_html, '<p><em>hello</em></p>')
+        self.assertEqual(second.body_html, first.body_html)
+        self.assertEqual(render_cache.stats()['misses'], 1)
+        self.assertEqual(render_cache.stats()['hits'], 1)
+
+    def test_unchanged_body_skips_render(self):
+        post = Post(body='hello')
+        post.body = 'hello'
+        self.assertEqual(render_cache.stats()['misses'] + render_cache.stats()['hits'], 1)
+        post.body = 'bye'
+        self.assertEqual(post.body_html, '<p>bye</p>')
+
+    def test_allowlist_is_part_of_key(self):
+        cache = RenderCache(tags=['p'])
+        self.assertNotEqual(cache.key('text'), render_cache.key('text'))
+        self.assertEqual(cache.render('*hi*'), render_markdown('*hi*', tags=['p']))
+
+    def test_eviction(self):
+        cache = RenderCache()
+        cache.cache.resize(2)
+        for body in ('a', 'b', 'c'):
+            cache.render(body)
+        self.assertEqual(len(cache.cache), 2)
+        self.assertIsNone(cache.cache.get(cache.key('a')))
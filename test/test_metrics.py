@@ -0,0 +1,112 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from app import create_app, db, metrics
+from app.metrics import LATENCY_BUCKETS
+from app.models import Role
+
+
+def samples(text):
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, _, value = line.rpartition(' ')
+            values[name] = float(value)
+    return values
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.path = tempfile.mkdtemp()
+        metrics.path = self.path
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        metrics.path = None
+        metrics.token = None
+        metrics.public = True
+        shutil.rmtree(self.path)
+
+    def scrape(self, **kwargs):
+        response = self.client.get('/metrics', base_url='https://localhost', **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        return response.get_data(as_text=True)
+
+    def test_request_latency(self):
+        for _ in range(3):
+            self.client.get('/', base_url='https://localhost')
+        self.client.get('/no-such-page', base_url='https://localhost')
+        # слушатели пула ставятся после первого запроса, в котором появился движок;
+        # сессия в общем контексте приложения держит соединение между запросами
+        db.session.remove()
+        db.session.execute('SELECT 1')
+        db.session.remove()
+        db.session.execute('SELECT 1')
+        db.session.remove()
+        text = self.scrape()
+        self.assertIn('# TYPE flasky_request_duration_seconds histogram', text)
+        values = samples(text)
+        labels = 'blueprint="main",endpoint="main.index",method="GET",status="200"'
+        self.assertEqual(values[f'flasky_request_duration_seconds_count{{{labels}}}'], 3)
+        self.assertEqual(values[f'flasky_request_duration_seconds_bucket{{{labels},le="+Inf"}}'], 3)
+        self.assertIn('flasky_request_duration_seconds_count{blueprint="",endpoint="none",method="GET",'
+                      'status="404"}', values)
+        self.assertGreaterEqual(values['flasky_db_connection_held_seconds_count{bind="default"}'], 1)
+        self.assertGreaterEqual(values['flasky_db_pool_checkouts_total{bind="default"}'], 1)
+        self.assertIn('flasky_cache_hits_total{cache="render"}', values)
+        self.assertIn('flasky_password_hashes_total', values)
+
+    def test_aggregates_processes(self):
+        self.client.get('/', base_url='https://localhost')
+        labels = [['blueprint', 'main'], ['endpoint', 'main.index'], ['method', 'GET'], ['status', '200']]
+        counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        counts[0] = 2
+        for pid in (os.getppid(), 2 ** 22 + 1):
+            with open(os.path.join(self.path, f'metrics.{pid}.json'), 'w') as f:
+                json.dump({'pid': pid,
+                           'counters': [['flasky_cache_hits_total', [['cache', 'render']], 5]],
+                           'gauges': [['flasky_db_pool_connections',
+                                       [['bind', 'other'], ['state', 'checkedout']], 1]],
+                           'histograms': [['flasky_request_duration_seconds', labels, list(LATENCY_BUCKETS),
+                                           counts, 0.002]]}, f)
+        values = samples(self.scrape())
+        own = 'blueprint="main",endpoint="main.index",method="GET",status="200"'
+        self.assertEqual(values[f'flasky_request_duration_seconds_count{{{own}}}'], 3)
+        self.assertGreaterEqual(values[f'flasky_request_duration_seconds_bucket{{{own},le="0.005"}}'], 2)
+        # файл завершенного процесса удаляется вместе с его счетчиками
+        self.assertGreaterEqual(values['flasky_cache_hits_total{cache="render"}'], 5)
+        self.assertLess(values['flasky_cache_hits_total{cache="render"}'], 10)
+        self.assertEqual(values['flasky_db_pool_connections{bind="other",state="checkedout"}'], 1)
+        self.assertFalse(os.path.exists(os.path.join(self.path, f'metrics.{2 ** 22 + 1}.json')))
+        self.assertTrue(os.path.exists(os.path.join(self.path, f'metrics.{os.getppid()}.json')))
+
+    def test_snapshot_file(self):
+        self.client.get('/', base_url='https://localhost')
+        metrics.save()
+        with open(os.path.join(self.path, f'metrics.{os.getpid()}.json')) as f:
+            snapshot = json.load(f)
+        self.assertEqual(snapshot['pid'], os.getpid())
+        self.assertTrue(any(name == 'flasky_request_duration_seconds' for name, *_ in snapshot['histograms']))
+
+    def test_not_public_without_token(self):
+        metrics.public = False
+        response = self.client.get('/metrics', base_url='https://localhost')
+        self.assertEqual(response.status_code, 404)
+
+    def test_token(self):
+        metrics.token = 'secret'
+        response = self.client.get('/metrics', base_url='https://localhost')
+        self.assertEqual(response.status_code, 403)
+        self.scrape(headers={'Authorization': 'Bearer secret'})
@@ -0,0 +1,72 @@
+import unittest
+from base64 import b64encode
+
+from app import create_app, db
+from app.models import User, Role, Post, Comment
+
+
+class MultiGetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['FLASKY_MULTI_GET_LIMIT'] = 5
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        john = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        posts = [Post(body=f'post {i}', author=john) for i in range(3)]
+        db.session.add_all([john] + posts + [Comment(body='comment', post=posts[0], author=john)])
+        db.session.commit()
+        db.session.remove()
+        self.client = self.app.test_client()
+        credentials = b64encode(b'john@example.com:cat').decode('utf-8')
+        self.auth = {'Authorization': 'Basic ' + credentials}
+        self.statements = []
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def get(self, url, headers=None):
+        return self.client.get(url, base_url='https://localhost', headers=self.auth if headers is None else headers)
+
+    def test_posts(self):
+        response = self.get('/api/v1.0/posts/?ids=3,1,99,1')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual([post['body'] for post in data['posts']], ['post 2', 'post 0'])
+        self.assertEqual(data['missing'], [99])
+        single = self.get('/api/v1.0/posts/3').get_json()
+        self.assertEqual(data['posts'][0], single)
+
+    def test_users_and_comments(self):
+        data = self.get('/api/v1.0/users/?ids=1&ids=2').get_json()
+        self.assertEqual([user['username'] for user in data['users']], ['john'])
+        self.assertEqual(data['missing'], [2])
+        data = self.get('/api/v1.0/comments/?ids=1').get_json()
+        self.assertEqual([comment['body'] for comment in data['comments']], ['comment'])
+        self.assertEqual(data['missing'], [])
+
+    def test_one_query_per_batch(self):
+        self.get('/api/v1.0/posts/?ids=1')
+        db.event.listen(db.engine, 'before_cursor_execute', self.record)
+        try:
+            self.get('/api/v1.0/posts/?ids=1,2,3')
+        finally:
+            db.event.remove(db.engine, 'before_cursor_execute', self.record)
+        self.assertEqual(len([s for s in self.statements if 'FROM posts' in s]), 1)
+
+    def test_bad_ids(self):
+        for url in ('/api/v1.0/posts/?ids=1,x', '/api/v1.0/users/', '/api/v1.0/comments/?ids=',
+                    '/api/v1.0/posts/?ids=1,2,3,4,5,6'):
+            response = self.get(url)
+            self.assertEqual(response.status_code, 400, url)
+            self.assertEqual(response.get_json()['error'], 'bad request')
+
+    def test_requires_auth(self):
+        response = self.get('/api/v1.0/posts/?ids=1', headers={})
+        self.assertEqual(response.status_code, 401)
@@ -0,0 +1,106 @@
+import unittest
+
+from app import create_app, db, page_cache, versions
+from app.models import User, Role, Post, Comment
+
+
+class PageCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client(use_cookies=True)
+        john = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        susan = User(email='susan@example.com', username='susan', password='cat', confirmed=True)
+        db.session.add_all([john, susan, Post(body='first', author=john), Post(body='second', author=susan)])
+        db.session.commit()
+        db.session.remove()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, url):
+        response = self.client.get(url, base_url='https://localhost')
+        db.session.remove()
+        return response
+
+    def cache_state(self, url):
+        return self.get(url).headers.get('X-Page-Cache')
+
+    def test_anonymous_pages_are_cached(self):
+        post = Post.query.filter_by(body='first').one()
+        for url in ('/', '/user/john', f'/post/{post.id}', '/followers/john'):
+            self.assertEqual(self.cache_state(url), 'miss')
+            response = self.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['X-Page-Cache'], 'hit')
+        self.assertEqual(self.get('/user/nobody').status_code, 404)
+        self.assertIsNone(self.cache_state('/user/nobody'))
+
+    def test_writes_invalidate_affected_pages(self):
+        post = Post.query.filter_by(body='first').one()
+        post_id, john_id = post.id, post.author_id
+        urls = ['/', '/user/john', '/user/susan', f'/post/{post_id}', '/followers/john', '/followers/susan']
+        for url in urls:
+            self.get(url)
+
+        # комментарий меняет страницу поста и списки, где он показан
+        db.session.add(Comment(body='nice', post_id=post_id, author_id=john_id))
+        db.session.commit()
+        self.assertEqual([self.cache_state(url) for url in urls],
+                         ['miss', 'miss', 'hit', 'miss', 'hit', 'hit'])
+        self.assertIn('1 Comments', self.get('/').get_data(as_text=True))
+
+        susan = User.query.filter_by(username='susan').one()
+        susan.follow(User.query.get(john_id))
+        db.session.commit()
+        self.assertEqual([self.cache_state(url) for url in urls],
+                         ['hit', 'miss', 'miss', 'hit', 'miss', 'hit'])
+
+        db.session.add(Post(body='third', author=susan))
+        db.session.commit()
+        self.assertEqual([self.cache_state(url) for url in urls],
+                         ['miss', 'hit', 'miss', 'hit', 'hit', 'hit'])
+        self.assertIn('third', self.get('/').get_data(as_text=True))
+
+        susan = User.query.filter_by(username='susan').one()
+        susan.location = 'Moscow'
+        db.session.commit()
+        # каждый пользователь подписан на себя, поэтому Сьюзен есть в обоих списках
+        self.assertEqual([self.cache_state(url) for url in urls],
+                         ['miss', 'hit', 'miss', 'hit', 'miss', 'miss'])
+
+    def test_authenticated_requests_bypass_cache(self):
+        self.get('/')
+        self.client.post('/auth/login', base_url='https://localhost', data={
+            'email': 'john@example.com', 'password': 'cat'})
+        response = self.get('/')
+        self.assertIsNone(response.headers.get('X-Page-Cache'))
+        self.assertIn('Hello, john', response.get_data(as_text=True))
+
+    def test_flashes_are_not_cached(self):
+        self.get('/')
+        # несуществующий пользователь: сообщение и перенаправление на главную
+        self.assertEqual(self.get('/followers/nobody').status_code, 302)
+        response = self.get('/')
+        self.assertIsNone(response.headers.get('X-Page-Cache'))
+        self.assertIn('Invalid user.', response.get_data(as_text=True))
+        response = self.get('/')
+        self.assertEqual(response.headers['X-Page-Cache'], 'hit')
+        self.assertNotIn('Invalid user.', response.get_data(as_text=True))
+
+    def test_writes_during_render_invalidate(self):
+        @self.app.route('/racy')
+        @page_cache.cached
+        def racy():
+            page_cache.depends_on(('page', 'racy'))
+            # запись другого запроса фиксируется, пока страница рендерится
+            versions.bump(('page', 'racy'))
+            return 'racy'
+
+        self.assertEqual(self.cache_state('/racy'), 'miss')
+        self.assertEqual(self.cache_state('/racy'), 'miss')
@@ -0,0 +1,70 @@
+import unittest
+from datetime import datetime, timedelta
+
+from werkzeug.exceptions import BadRequest
+
+from app import create_app, db
+from app.models import User, Role, Post
+from app.pagination import paginate, encode_cursor
+
+
+class PaginationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        r = Role.query.filter_by(name='User').first()
+        self.user = User(email='john@example.com', username='john', password='cat', role=r)
+        db.session.add(self.user)
+        # по два поста с одинаковым временем, чтобы проверить порядок по id
+        start = datetime(2020, 1, 1)
+        for i in range(7):
+            db.session.add(Post(body=str(i), author=self.user, timestamp=start + timedelta(seconds=i // 2)))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def bodies(self, pagination):
+        return [post.body for post in pagination.items]
+
+    def test_cursor_walk(self):
+        columns = (Post.timestamp, Post.id)
+        pages = []
+        pagination = paginate(Post.query, columns, 3)
+        self.assertFalse(pagination.has_prev)
+        while True:
+            pages.append(self.bodies(pagination))
+            if not pagination.has_next:
+                break
+            pagination = paginate(Post.query, columns, 3, cursor=pagination.next_cursor)
+        self.assertEqual(pages, [['6', '5', '4'], ['3', '2', '1'], ['0']])
+
+        pagination = paginate(Post.query, columns, 3, cursor=pagination.prev_cursor)
+        self.assertEqual(self.bodies(pagination), ['3', '2', '1'])
+        self.assertTrue(pagination.has_prev)
+        self.assertTrue(pagination.has_next)
+
+    def test_page_numbers(self):
+        columns = (Post.timestamp, Post.id)
+        self.assertEqual(self.bodies(paginate(Post.query, columns, 3, page=2)), ['3', '2', '1'])
+        self.assertEqual(self.bodies(paginate(Post.query, columns, 3, page=-1)), ['2', '1', '0'])
+        pagination = paginate(Post.query, columns, 3, page=1, descending=False)
+        self.assertEqual(self.bodies(pagination), ['0', '1', '2'])
+
+    def test_invalid_cursors(self):
+        columns = (Post.timestamp, Post.id)
+        for cursor in ('eyJhIjoxfQ', 'not base64!', encode_cursor([1, 2], 'up'),
+                       encode_cursor(['2020-01-01T00:00:00', '1'], 'next'),
+                       encode_cursor(['2020-01-01T00:00:00', 1.5], 'next'),
+                       encode_cursor(['2020-01-01T00:00:00', True], 'next'),
+                       encode_cursor([20200101, 1], 'next'),
+                       encode_cursor(['2020-01-01T00:00:00'], 'next')):
+            with self.assertRaises(BadRequest):
+                paginate(Post.query, columns, 3, cursor=cursor)
+        response = self.app.test_client().get('/?cursor=eyJhIjoxfQ', base_url='https://localhost')
+        self.assertEqual(response.status_code, 400)
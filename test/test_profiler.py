@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+from base64 import b64encode
+
+from app import create_app, db, sql_profiler
+from app.models import User, Role, Post
+from app.profiler import fingerprint
+
+
+class FingerprintTestCase(unittest.TestCase):
+    def test_literals_and_lists(self):
+        self.assertEqual(fingerprint("SELECT * FROM posts WHERE id IN (1, 2, 3) AND body = 'it''s'"),
+                         fingerprint("SELECT *\n  FROM posts WHERE id IN (?) AND body = 'x'"))
+        self.assertEqual(fingerprint('SELECT * FROM users WHERE id = %(id_1)s LIMIT %(param_1)s'),
+                         'SELECT * FROM users WHERE id = ? LIMIT ?')
+        self.assertEqual(fingerprint("SELECT to_tsvector(:language::regconfig, anon_1.body)"),
+                         "SELECT to_tsvector(?::regconfig, anon_1.body)")
+        self.assertEqual(fingerprint('INSERT INTO t (a, b) VALUES (?, ?), (?, ?), (?, ?)'),
+                         'INSERT INTO t (a, b) VALUES (...)+')
+
+
+class ProfilerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.path = tempfile.mkdtemp()
+        sql_profiler.path = self.path
+        sql_profiler.slow = 0
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        john = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        db.session.add_all([john] + [Post(body=f'post {i}', author=john) for i in range(3)])
+        db.session.commit()
+        db.session.remove()
+        self.client = self.app.test_client()
+        credentials = b64encode(b'john@example.com:cat').decode('utf-8')
+        self.auth = {'Authorization': 'Basic ' + credentials}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.path)
+
+    def test_aggregates_per_endpoint(self):
+        for id in (1, 2, 3):
+            response = self.client.get(f'/api/v1.0/posts/{id}', base_url='https://localhost', headers=self.auth)
+            self.assertEqual(response.status_code, 200)
+        endpoints, statements = sql_profiler.report('api.get_post')
+        self.assertEqual(endpoints[0]['requests'], 3)
+        self.assertGreaterEqual(endpoints[0]['queries_per_request'], 1)
+        posts = [row for row in statements if 'FROM posts' in row['fingerprint']]
+        self.assertEqual(len(posts), 1)
+        self.assertEqual(posts[0]['count'], 3)
+        self.assertGreaterEqual(posts[0]['max'], posts[0]['p95'])
+        # план снимается в фоновом потоке, а не в запросе
+        sql_profiler.wait_for_plans()
+        plans = [row['plan'] for row in sql_profiler.report('api.get_post')[1] if row['id'] == posts[0]['id']]
+        self.assertIn('posts', plans[0])
+        with self.assertRaises(ValueError):
+            sql_profiler.report(order_by='foo')
+
+    def test_report_merges_processes(self):
+        self.client.get('/api/v1.0/posts/1', base_url='https://localhost', headers=self.auth)
+        sql_profiler.save()
+        # файл как будто записан другим процессом
+        os.replace(os.path.join(self.path, f'sql-profile.{os.getpid()}.json'),
+                   os.path.join(self.path, 'sql-profile.0.json'))
+        endpoints, statements = sql_profiler.report('api.get_post')
+        self.assertEqual(endpoints[0]['requests'], 2)
+        self.assertEqual(sum(row['count'] for row in statements), endpoints[0]['queries'])
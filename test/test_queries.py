@@ -0,0 +1,61 @@
+import unittest
+
+from app import create_app, db, page_cache
+from app.models import User, Role, Post, Comment
+
+
+class ListingQueriesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        # страницы должны отрисовываться, а не отдаваться из кэша
+        self.app.config['FLASKY_PAGE_CACHE_TTL'] = 0
+        page_cache.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.statements = []
+        db.event.listen(db.engine, 'before_cursor_execute', self.record)
+
+    def tearDown(self):
+        db.event.remove(db.engine, 'before_cursor_execute', self.record)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def add_posts(self, count):
+        r = Role.query.filter_by(name='User').first()
+        for i in range(count):
+            n = User.query.count()
+            user = User(email=f'user{n}@example.com', username=f'user{n}', password='cat', role=r)
+            post = Post(body='post', author=user)
+            db.session.add(Comment(body='comment', post=post, author=user))
+        db.session.commit()
+        db.session.remove()
+
+    def count_queries(self, url):
+        del self.statements[:]
+        response = self.client.get(url, base_url='https://localhost')
+        self.assertEqual(response.status_code, 200)
+        return len(self.statements)
+
+    def test_index_queries_do_not_grow_with_page(self):
+        self.add_posts(2)
+        small = self.count_queries('/')
+        self.add_posts(6)
+        self.assertEqual(self.count_queries('/'), small)
+
+    def test_post_comments_queries_do_not_grow_with_page(self):
+        self.add_posts(1)
+        small = self.count_queries('/post/1')
+        r = Role.query.filter_by(name='User').first()
+        for i in range(6):
+            user = User(email=f'reader{i}@example.com', username=f'reader{i}', password='cat', role=r)
+            db.session.add(Comment(body='comment', post_id=1, author=user))
+        db.session.commit()
+        db.session.remove()
+        self.assertEqual(self.count_queries('/post/1'), small)
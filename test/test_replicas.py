@@ -0,0 +1,100 @@
+import os
+import sqlite3
+import unittest
+from base64 import b64encode
+
+from flask import request
+from sqlalchemy.engine.url import make_url
+
+from app import create_app, db, identity_cache
+from app.models import User, Role, Post, load_user
+from config import base_dir
+
+REPLICA_PATH = os.path.join(base_dir, 'data_replica_test.sqlite')
+
+
+class ReplicaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        # вторая база SQLite играет роль реплики
+        self.app.config['SQLALCHEMY_BINDS'] = {'replica1': 'sqlite:///' + REPLICA_PATH}
+        self.app.config['FLASKY_READ_REPLICAS'] = ['replica1']
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        john = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        db.session.add_all([john, Post(body='replicated', author=john)])
+        db.session.commit()
+        self.replicate()
+        db.session.add(Post(body='not replicated yet', author=john))
+        db.session.commit()
+        db.session.remove()
+        self.client = self.app.test_client()
+        credentials = b64encode(b'john@example.com:cat').decode('utf-8')
+        self.auth = {'Authorization': 'Basic ' + credentials, 'Content-Type': 'application/json'}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.get_engine(self.app, 'replica1').dispose()
+        self.app_context.pop()
+        os.remove(REPLICA_PATH)
+
+    def replicate(self):
+        primary = sqlite3.connect(make_url(self.app.config['SQLALCHEMY_DATABASE_URI']).database)
+        replica = sqlite3.connect(REPLICA_PATH)
+        primary.backup(replica)
+        primary.close()
+        replica.close()
+
+    def post_bodies(self):
+        response = self.client.get('/api/v1.0/posts/', base_url='https://localhost', headers=self.auth)
+        self.assertEqual(response.status_code, 200)
+        return sorted(post['body'] for post in response.get_json()['posts'])
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.post_bodies(), ['replicated'])
+        self.assertEqual(db.session.query(Post).count(), 2)
+
+    def test_read_your_writes(self):
+        response = self.client.post('/api/v1.0/post/', base_url='https://localhost', headers=self.auth,
+                                    json={'body': 'new post'})
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(self.app.config['FLASKY_REPLICA_COOKIE'], response.headers['Set-Cookie'])
+        self.assertEqual(self.post_bodies(), ['new post', 'not replicated yet', 'replicated'])
+        self.client.cookie_jar.clear()
+        self.assertEqual(self.post_bodies(), ['replicated'])
+
+    def test_no_replicas(self):
+        self.app.config['FLASKY_READ_REPLICAS'] = []
+        self.assertEqual(self.post_bodies(), ['not replicated yet', 'replicated'])
+        response = self.client.post('/api/v1.0/post/', base_url='https://localhost', headers=self.auth,
+                                    json={'body': 'new post'})
+        self.assertNotIn('Set-Cookie', response.headers)
+
+    def test_cache_misses_read_primary(self):
+        response = self.client.get('/', base_url='https://localhost')
+        self.assertEqual(response.headers['X-Page-Cache'], 'miss')
+        self.assertIn('not replicated yet', response.get_data(as_text=True))
+        self.assertEqual(self.client.get('/', base_url='https://localhost').headers['X-Page-Cache'], 'hit')
+        self.assertGreater(self.app.jinja_env.fragment_cache.cache.stats()['size'], 0)
+        john = User.query.filter_by(email='john@example.com').first()
+        db.session.remove()
+        with self.app.test_request_context(base_url='https://localhost'):
+            self.app.preprocess_request()
+            self.assertEqual(load_user(john.id).email, 'john@example.com')
+            self.assertIsNotNone(identity_cache.get(john.id))
+            # остальные запросы остаются на реплике
+            self.assertEqual(request.environ['flasky.replica'], 'replica1')
+            self.assertEqual(Post.query.count(), 1)
+
+    def test_pool_options_per_bind(self):
+        self.app.config['FLASKY_POOL_OPTIONS'] = {None: {'pool_size': 3}, 'replica2': {'pool_size': 7}}
+        self.app.config['FLASKY_REPLICA_POOL_OPTIONS'] = {'pool_size': 5}
+        self.app.config['FLASKY_READ_REPLICAS'] = ['replica1', 'replica2']
+        url = make_url('postgresql://localhost/flasky')
+        for bind, size in ((None, 3), ('replica1', 5), ('replica2', 7)):
+            self.assertEqual(db.make_connector(self.app, bind).get_options(url, False)['pool_size'], size)
+        self.assertNotIn('pool_size', db.make_connector(self.app, 'replica1').get_options(
+            make_url('sqlite:///' + REPLICA_PATH), False))
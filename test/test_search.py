@@ -0,0 +1,112 @@
+import unittest
+from base64 import b64encode
+
+from app import create_app, db, search_index
+from app.models import User, Role, Post, Comment, rebuild_search_index
+from app.pagination import encode_cursor
+
+
+class SearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['FLASKY_POSTS_PER_PAGE'] = 2
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.john = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        db.session.add(self.john)
+        db.session.commit()
+        self.client = self.app.test_client()
+        credentials = b64encode(b'john@example.com:cat').decode('utf-8')
+        self.auth = {'Authorization': 'Basic ' + credentials}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def search(self, query, kind='posts'):
+        return search_index.search(db.session.connection(), query, kind)
+
+    def test_index_follows_body(self):
+        post = Post(body='Кошки и собаки', author=self.john)
+        other = Post(body='only dogs here', author=self.john)
+        db.session.add_all([post, other])
+        db.session.commit()
+        self.assertEqual(self.search('кошки'), [post.id])
+        post.body = 'только собаки'
+        db.session.commit()
+        self.assertEqual(self.search('кошки'), [])
+        self.assertEqual(self.search('собаки'), [post.id])
+        db.session.delete(post)
+        db.session.commit()
+        self.assertEqual(self.search('собаки'), [])
+
+    def test_rollback_discards_changes(self):
+        post = Post(body='first draft', author=self.john)
+        db.session.add(post)
+        db.session.commit()
+        post.body = 'second draft'
+        db.session.flush()
+        self.assertEqual(self.search('second'), [post.id])
+        db.session.rollback()
+        self.assertEqual(self.search('second'), [])
+        self.assertEqual(self.search('first'), [post.id])
+
+    def test_disabled_comments_are_not_found(self):
+        post = Post(body='post', author=self.john)
+        comment = Comment(body='nice cat picture', post=post, author=self.john)
+        db.session.add_all([post, comment])
+        db.session.commit()
+        self.assertEqual(self.search('cat', 'comments'), [comment.id])
+        self.assertEqual(self.search('cat'), [])
+        comment.disabled = True
+        db.session.commit()
+        self.assertEqual(self.search('cat', 'comments'), [])
+        comment.disabled = False
+        db.session.commit()
+        self.assertEqual(self.search('cat', 'comments'), [comment.id])
+
+    def test_ranking_and_query_syntax(self):
+        weak = Post(body='cat ' + 'word ' * 50, author=self.john)
+        strong = Post(body='cat cat cat', author=self.john)
+        db.session.add_all([weak, strong])
+        db.session.commit()
+        self.assertEqual(self.search('cat'), [strong.id, weak.id])
+        self.assertEqual(self.search('"cat" (* -'), [strong.id, weak.id])
+        self.assertEqual(self.search('  '), [])
+
+    def test_rebuild(self):
+        db.session.add(Post(body='rebuilt index', author=self.john))
+        db.session.commit()
+        db.session.execute('DELETE FROM search_index')
+        db.session.commit()
+        self.assertEqual(self.search('rebuilt'), [])
+        rebuild_search_index(batch_size=1)
+        self.assertEqual(len(self.search('rebuilt')), 1)
+
+    def test_api_and_view(self):
+        db.session.add_all([Post(body=f'searchable post {i}', author=self.john) for i in range(3)])
+        db.session.commit()
+        response = self.client.get('/api/v1.0/search?q=searchable', base_url='https://localhost', headers=self.auth)
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(len(data['posts']), 2)
+        self.assertIsNone(data['prev'])
+        response = self.client.get(data['next'], base_url='https://localhost', headers=self.auth)
+        data = response.get_json()
+        self.assertEqual(len(data['posts']), 1)
+        self.assertIsNotNone(data['prev'])
+        self.assertIsNone(data['next'])
+        response = self.client.get('/api/v1.0/search?q=x&kind=users', base_url='https://localhost',
+                                   headers=self.auth)
+        self.assertEqual(response.status_code, 400)
+        for offset in ('x', 1.5, True, -1):
+            cursor = encode_cursor([offset], 'next')
+            response = self.client.get(f'/api/v1.0/search?q=searchable&cursor={cursor}',
+                                       base_url='https://localhost', headers=self.auth)
+            self.assertEqual(response.status_code, 400)
+        response = self.client.get('/search?q=searchable', base_url='https://localhost')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('searchable post', response.get_data(as_text=True))
@@ -0,0 +1,41 @@
+import unittest
+
+from app import create_app, db
+from app.models import User, Post, Comment, Follow, reconcile_counters
+from app.seed import seed_database
+
+
+class SeedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def snapshot(self):
+        return ([(u.id, u.email) for u in User.query.order_by(User.id)],
+                [(p.id, p.author_id, p.body, p.timestamp) for p in Post.query.order_by(Post.id)],
+                [(f.follower_id, f.followed_id) for f in Follow.query.order_by(Follow.follower_id, Follow.followed_id)])
+
+    def test_seed_counts(self):
+        seed_database(users=10, posts=30, comments=20, follows=15, batch_size=7, workers=1)
+        self.assertEqual(User.query.count(), 10)
+        self.assertEqual(Post.query.count(), 30)
+        self.assertEqual(Comment.query.count(), 20)
+        self.assertEqual(Follow.query.count(), 10 + 15)
+        self.assertIsNotNone(Post.query.first().body_html)
+        # счетчики заполнены без расхождений
+        self.assertEqual(reconcile_counters(), 0)
+
+    def test_seed_is_deterministic(self):
+        seed_database(users=10, posts=20, comments=0, follows=10, seed=42, workers=1)
+        first = self.snapshot()
+        db.drop_all()
+        db.create_all()
+        seed_database(users=10, posts=20, comments=0, follows=10, seed=42, workers=1)
+        self.assertEqual(self.snapshot(), first)
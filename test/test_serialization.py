@@ -0,0 +1,72 @@
+import json
+import unittest
+from datetime import datetime, timezone
+
+from flask import url_for, jsonify as flask_jsonify
+
+from app import create_app, db, serialization
+from app.models import User, Role, Post, Comment
+
+
+class SerializationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.request_context = self.app.test_request_context(base_url='https://localhost')
+        self.request_context.push()
+
+    def tearDown(self):
+        self.request_context.pop()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def assertSameBody(self, obj):
+        self.assertEqual(serialization.jsonify(obj).get_data(), flask_jsonify(obj).get_data())
+
+    def test_http_date(self):
+        for value in (datetime(2020, 2, 29, 23, 59, 1, 999999), datetime(1999, 12, 5, 0, 0),
+                      datetime(2021, 7, 4, 12, 30, tzinfo=timezone.utc)):
+            self.assertEqual(json.loads(flask_jsonify(value).get_data()), serialization.http_date(value))
+        self.assertIsNone(serialization.http_date(None))
+
+    def test_url_templates(self):
+        urls = serialization.url_templates()
+        self.assertIs(serialization.url_templates(), urls)
+        for id in (1, 42, 123456):
+            self.assertEqual(urls.build('api.get_post', id, external=True),
+                             url_for('api.get_post', id=id, _external=True))
+            self.assertEqual(urls.build('api.get_user', id), url_for('api.get_user', id=id))
+        with self.app.test_request_context(base_url='http://example.com/app/'):
+            self.assertEqual(serialization.url_templates().build('api.get_post', 7, external=True),
+                             'http://example.com/app/api/v1.0/posts/7')
+
+    def test_escaping_matches_jsonify(self):
+        self.assertSameBody({'text': 'Привет, мир ☃ 😀 \x7f \x00\t\n "quoted" \\ </script>',
+                             'numbers': [0, -1, 2 ** 63, 2 ** 70], 'none': None, 'flag': True,
+                             'b': {'z': 1, 'a': 'ü'}})
+        self.assertSameBody({'lone': '\ud800'})
+
+    def test_to_json_matches_jsonify(self):
+        u = User(email='john@example.com', username='jöhn', password='cat')
+        p = Post(body='*пост* с **разметкой** 😀', author=u)
+        c = Comment(body='комментарий', post=p, author=u)
+        db.session.add_all([u, p, c])
+        db.session.commit()
+        # прежний to_json отдавал даты кодировщику Flask
+        dates = [(u, {'member_since': u.member_since, 'last_seen': u.last_seen}),
+                 (p, {'timestamp': p.timestamp}), (c, {'timestamp': c.timestamp})]
+        for obj, values in dates:
+            data = obj.to_json()
+            self.assertEqual(serialization.jsonify(data).get_data(),
+                             flask_jsonify(dict(data, **values)).get_data())
+        self.assertEqual(p.to_json()['comments'], url_for('api.get_post_comments', id=p.id, _external=True))
+        self.assertEqual(c.to_json()['post_url'], url_for('api.get_post', id=p.id))
+
+    def test_pretty_print_falls_back_to_jsonify(self):
+        self.app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
+        self.assertSameBody({'b': 'ü', 'a': [1, 2]})
+        self.assertIn(b'\n  ', serialization.jsonify({'a': 1}).get_data())
@@ -0,0 +1,47 @@
+import json
+import unittest
+from base64 import b64encode
+
+from app import create_app, db
+from app.models import User, Role, Post
+
+
+class StreamingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['FLASKY_STREAM_BATCH_SIZE'] = 2
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        john = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        db.session.add_all([john] + [Post(body=f'post {i}', author=john) for i in range(5)])
+        db.session.commit()
+        db.session.remove()
+        self.client = self.app.test_client()
+        credentials = b64encode(b'john@example.com:cat').decode('utf-8')
+        self.auth = {'Authorization': 'Basic ' + credentials}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, url, accept):
+        return self.client.get(url, base_url='https://localhost', headers=dict(self.auth, Accept=accept))
+
+    def test_stream_matches_json(self):
+        posts = self.get('/api/v1.0/posts/', 'application/json').get_json()['posts']
+        for url, accept in (('/api/v1.0/posts/', 'application/x-ndjson'),
+                            ('/api/v1.0/posts/?stream=1', 'application/json')):
+            response = self.get(url, accept)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'application/x-ndjson')
+            self.assertTrue(response.is_streamed)
+            lines = response.get_data(as_text=True).splitlines()
+            self.assertEqual([json.loads(line) for line in lines], posts)
+
+    def test_default_is_json(self):
+        response = self.get('/api/v1.0/posts/', '*/*')
+        self.assertEqual(response.mimetype, 'application/json')
+        self.assertEqual(len(response.get_json()['posts']), 5)
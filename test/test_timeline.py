@@ -0,0 +1,61 @@
+import unittest
+
+from app import create_app, db
+from app.models import User, Role, Post, TimelineEntry, rebuild_timelines
+
+
+class TimelineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['FLASKY_TIMELINE_LENGTH'] = 3
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_user(self, email, username):
+        r = Role.query.filter_by(name='User').first()
+        user = User(email=email, username=username, password='cat', role=r)
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    def add_posts(self, author, *bodies):
+        for body in bodies:
+            db.session.add(Post(body=body, author=author))
+            db.session.commit()
+
+    def test_fan_out_on_write(self):
+        john = self.add_user('john@example.com', 'john')
+        susan = self.add_user('susan@example.com', 'susan')
+        self.add_posts(john, 'one', 'two')
+        self.assertEqual(susan.followed_posts.all(), [])
+
+        # подписка добавляет в ленту уже написанные посты
+        susan.follow(john)
+        db.session.commit()
+        self.assertEqual([p.body for p in susan.followed_posts], ['two', 'one'])
+
+        # новые посты попадают в ленты всех читателей
+        self.add_posts(john, 'three', 'four')
+        self.assertEqual([p.body for p in susan.followed_posts], ['four', 'three', 'two'])
+        self.assertEqual([p.body for p in john.followed_posts], ['four', 'three', 'two'])
+
+        susan.unfollow(john)
+        db.session.commit()
+        self.assertEqual(susan.followed_posts.all(), [])
+
+    def test_rebuild_timelines(self):
+        john = self.add_user('john@example.com', 'john')
+        self.add_posts(john, 'one', 'two')
+        db.session.execute(TimelineEntry.__table__.delete())
+        db.session.commit()
+        self.assertEqual(john.followed_posts.all(), [])
+
+        rebuild_timelines()
+        self.assertEqual([p.body for p in john.followed_posts], ['two', 'one'])